@@ -0,0 +1,32 @@
+"""Benchmarks do pipeline de dados do painel.
+
+Cada etapa (leitura das bases, reprojeção, junção com os talhões,
+classificação do Status, agregação, colunas de recomendação, mapa de calor,
+GeoPDF e planilha Excel) é medida em bases sintéticas com 1x, 10x, ... o
+tamanho das bases do repositório (ver benchmarks/synthetic.py), com o tempo
+pelo pytest-benchmark e o pico de memória pelo tracemalloc. Tudo roda sem
+rede: as imagens de fundo vêm apenas do cache local de tiles.
+
+Executar a partir da pasta app_final (dependências em benchmarks/requirements.txt):
+
+    python -m pytest benchmarks [--scales 1,10,100] [--benchmark-json resultado.json]
+
+As bases sintéticas ficam em COMBATE_BENCH_DATA (padrão: pasta temporária do
+sistema) e são geradas na primeira execução. A escala 100x precisa de dezenas
+de GB de memória, por isso as escalas padrão são 1 e 10. O GeoPDF só é medido
+quando o GDAL (osgeo) está instalado.
+
+benchmarks/test_startup.py mede a importação do topo do New_Home.py em um
+processo novo (o tempo até a página começar a aparecer, com limite em
+COMBATE_STARTUP_BUDGET) e, à parte, a das bibliotecas dos mapas e GeoPDFs,
+carregadas em segundo plano (ver combate/warmup.py).
+
+benchmarks/test_thresholds.py verifica os histogramas dos limiares QT
+(quantis iguais aos do pandas e combinação equivalente a um único histograma)
+e benchmarks/test_ingest.py, que a ingestão incremental de uma nova data
+produz as mesmas bases agrupadas que o recálculo completo, em cada modo de
+limiar, inclusive ao reenviar parte das fazendas de uma data já ingerida.
+
+O teste de carga com várias sessões simultâneas do painel fica em
+benchmarks/load_test.py (``python -m benchmarks.load_test --users 20``).
+"""
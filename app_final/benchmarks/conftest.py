@@ -0,0 +1,85 @@
+"""Configuração dos benchmarks do pipeline do painel (ver benchmarks/__init__.py)."""
+import os
+
+# Sem rede: as imagens de fundo dos mapas e GeoPDFs vêm apenas do cache local
+os.environ.setdefault("COMBATE_TILES_OFFLINE", "1")
+
+import time
+import tracemalloc
+
+import pytest
+
+from benchmarks import synthetic
+
+# Resultados de cada etapa: (etapa, escala, segundos (média), pico de memória em MB); sem
+# escala nem pico nas medições que não dependem das bases (ex.: test_startup.py)
+_results = []
+
+
+def pytest_addoption(parser):
+    parser.addoption("--scales", default=os.environ.get("COMBATE_BENCH_SCALES", "1,10"),
+                     help="Escalas das bases sintéticas, separadas por vírgula (ex.: 1,10,100)")
+
+
+def pytest_generate_tests(metafunc):
+    if "scale" in metafunc.fixturenames:
+        scales = [int(value) for value in metafunc.config.getoption("scales").split(",")]
+        metafunc.parametrize("scale", scales, ids=[f"x{scale}" for scale in scales], scope="session")
+
+
+@pytest.fixture(scope="session")
+def dataset(scale):
+    """Caminhos (predições, talhões) da base sintética da escala."""
+    return synthetic.generate(scale)
+
+
+@pytest.fixture
+def stage(benchmark, scale):
+    """Mede uma etapa: tempo pelo pytest-benchmark e pico de memória pelo tracemalloc.
+
+    O pico considera as alocações do Python e do NumPy; os buffers do Arrow
+    (leitura do Parquet) não são rastreados pelo tracemalloc.
+
+    ``setup`` (opcional) é chamado antes de cada execução e retorna os
+    argumentos da etapa, como no ``benchmark.pedantic``. As escalas maiores
+    são executadas uma única vez.
+    """
+    def run(name, fn, setup=None, rounds=3):
+        args, kwargs = setup() if setup else ((), {})
+
+        # Execução separada para o pico de memória, já que o tracemalloc deixa a execução mais lenta
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+
+        benchmark.group = name
+        benchmark.extra_info.update(scale=scale, peak_mb=round(peak, 1))
+        rounds = rounds if scale == 1 and elapsed < 10 else 1
+        result = benchmark.pedantic(fn, setup=setup, rounds=rounds, iterations=1) if setup \
+            else benchmark.pedantic(fn, rounds=rounds, iterations=1)
+        # Com --benchmark-disable, o tempo é o da execução medida pelo tracemalloc
+        _results.append((name, scale, benchmark.stats.stats.mean if benchmark.stats else elapsed, peak))
+        return result
+    return run
+
+
+@pytest.fixture
+def report():
+    """Registra no resumo uma medição feita sem ``stage``: ``report(etapa, escala, segundos, pico=None)``."""
+    def add(name, scale, seconds, peak=None):
+        _results.append((name, scale, seconds, peak))
+    return add
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    terminalreporter.section("tempo e pico de memória por etapa")
+    terminalreporter.write_line(f"{'etapa':<20} {'escala':>7} {'tempo (s)':>10} {'pico (MB)':>10}")
+    for name, scale, seconds, peak in sorted(_results, key=lambda result: result[1] or 0):
+        scale = f"x{scale}" if scale else "-"
+        peak = f"{peak:.1f}" if peak is not None else "-"
+        terminalreporter.write_line(f"{name:<20} {scale:>7} {seconds:>10.3f} {peak:>10}")
@@ -0,0 +1,242 @@
+"""Teste de carga do painel com várias sessões simultâneas.
+
+Cada usuário simulado é uma sessão do ``New_Home.py`` executada sem navegador
+pelo ``streamlit.testing.v1.AppTest``, todas no mesmo processo, como em um
+servidor Streamlit. Os usuários abrem o painel ao mesmo tempo e, a cada passo,
+escolhem uma fazenda e depois um talhão ao acaso (com semente fixa). São
+registradas a latência de cada execução do script (p50/p95 por tipo de
+interação) e a memória residente (RSS) do processo ao longo do teste.
+
+Os tiles de imagem de fundo vêm de um servidor local que responde sempre a
+mesma imagem (com atraso opcional), e os caches em disco ficam em uma pasta
+temporária, de forma que o resultado não depende da rede nem de execuções
+anteriores. Executar a partir da pasta app_final:
+
+    python -m benchmarks.load_test [--users 20] [--steps 3] [--tile-latency 50] [--json resultado.json]
+"""
+import argparse
+import http.server
+import io
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "New_Home.py")
+
+
+def _tile_png():
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (256, 256), (90, 110, 80)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class TileStub:
+    """Servidor de tiles local (``{z}/{x}/{y}``) que responde sempre a mesma imagem."""
+
+    def __init__(self, latency=0.0):
+        content = _tile_png()
+        self.requests = 0
+        lock = threading.Lock()
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                with lock:
+                    stub.requests += 1
+                time.sleep(latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/{{z}}/{{x}}/{{y}}.png"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def rss_mb():
+    """Memória residente atual do processo, em MB (Linux; nos demais, o pico)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+class RssSampler(threading.Thread):
+    """Amostra o RSS do processo a cada ``interval`` segundos até ser parado."""
+
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.samples.append(rss_mb())
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.samples.append(rss_mb())
+
+
+def _selectbox(at, label):
+    return next(box for box in at.sidebar.selectbox if box.label == label)
+
+
+def _shared_runtime():
+    """Mantém o Runtime simulado do AppTest disponível para todas as sessões.
+
+    Cada ``AppTest.run`` define ``Runtime._instance`` e o anula ao terminar; com
+    sessões simultâneas, o fim de uma execução não deve derrubar as outras.
+    """
+    from unittest import mock
+
+    from streamlit.runtime import Runtime
+
+    original = Runtime.instance
+    last = []
+
+    def instance():
+        if Runtime._instance is not None:
+            last[:] = [Runtime._instance]
+            return Runtime._instance
+        return last[0] if last else original()
+    return mock.patch.object(Runtime, "instance", staticmethod(instance))
+
+
+def simulate_user(user, steps, barrier, seed=0, timeout=600):
+    """Executa a sessão de um usuário; retorna a lista de (interação, segundos, erro)."""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed * 1000 + user)
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    records = []
+
+    def rerun(kind):
+        start = time.perf_counter()
+        try:
+            at.run()
+            error = "; ".join(str(exc.value) for exc in at.exception) or None
+            if error is None and not any(box.label == "Selecione a Fazenda" for box in at.sidebar.selectbox):
+                # Ex.: falha ao compilar o script, que o AppTest não registra como exceção
+                error = "execução sem os seletores da barra lateral"
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        records.append((kind, time.perf_counter() - start, error))
+        return error is None
+
+    barrier.wait()
+    if not rerun("abertura"):
+        return records
+    for _ in range(steps):
+        farm_box = _selectbox(at, "Selecione a Fazenda")
+        farm_box.select(rng.choice(list(farm_box.options)))
+        if not rerun("fazenda"):
+            break
+        stand_box = _selectbox(at, "Selecione o Talhão")
+        stand_box.select(rng.choice(list(stand_box.options)))
+        if not rerun("talhao"):
+            break
+    return records
+
+
+def _summary(seconds):
+    seconds = np.asarray(seconds)
+    return {'n': int(len(seconds)), 'p50': round(float(np.percentile(seconds, 50)), 3),
+            'p95': round(float(np.percentile(seconds, 95)), 3), 'max': round(float(seconds.max()), 3)}
+
+
+def run_load_test(users=20, steps=3, tile_latency=0.0, seed=0, timeout=600):
+    """Executa o teste de carga e retorna o resumo (latências por interação e RSS)."""
+    with TileStub(tile_latency) as stub:
+        # Antes de importar o painel: as configurações são lidas na importação de combate.config
+        os.environ["COMBATE_TILE_URL"] = stub.url
+        # Sem servidor Streamlit não há cabeçalhos da requisição para montar o endereço dos tiles do dossel
+        os.environ.setdefault("COMBATE_CANOPY_TILE_URL", stub.url.split("/{z}")[0] + "/canopy")
+        os.environ.pop("COMBATE_TILES_OFFLINE", None)
+        os.environ.setdefault("COMBATE_CACHE_DIR", tempfile.mkdtemp(prefix="combate_load_"))
+
+        sampler = RssSampler()
+        rss_start = rss_mb()
+        sampler.start()
+        barrier = threading.Barrier(users)
+        start = time.perf_counter()
+        with _shared_runtime(), ThreadPoolExecutor(max_workers=users) as pool:
+            futures = [pool.submit(simulate_user, user, steps, barrier, seed, timeout) for user in range(users)]
+            records = [record for future in futures for record in future.result()]
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+
+    by_kind = {}
+    for kind, seconds, error in records:
+        if error is None:
+            by_kind.setdefault(kind, []).append(seconds)
+    return {
+        'users': users,
+        'steps': steps,
+        'tile_latency_ms': tile_latency * 1000,
+        'elapsed_s': round(elapsed, 1),
+        'reruns': len(records),
+        'errors': [error for _, _, error in records if error is not None],
+        'latency_s': dict({kind: _summary(values) for kind, values in by_kind.items()},
+                          total=_summary([seconds for values in by_kind.values() for seconds in values]))
+        if by_kind else {},
+        'rss_mb': {'start': round(rss_start, 1), 'peak': round(max(sampler.samples), 1),
+                   'end': round(sampler.samples[-1], 1)},
+        'tile_requests': stub.requests,
+        'cache_dir': os.environ["COMBATE_CACHE_DIR"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga do painel com sessões simultâneas")
+    parser.add_argument("--users", type=int, default=20, help="Número de usuários simultâneos")
+    parser.add_argument("--steps", type=int, default=3, help="Trocas de fazenda e talhão por usuário")
+    parser.add_argument("--tile-latency", type=float, default=0.0, help="Atraso de cada tile (ms)")
+    parser.add_argument("--seed", type=int, default=0, help="Semente das escolhas dos usuários")
+    parser.add_argument("--json", default=None, help="Grava o resumo neste arquivo JSON")
+    args = parser.parse_args(argv)
+
+    result = run_load_test(args.users, args.steps, args.tile_latency / 1000, args.seed)
+    print(f"{result['users']} usuários, {result['reruns']} execuções em {result['elapsed_s']}s, "
+          f"{len(result['errors'])} com erro")
+    for kind, stats in result['latency_s'].items():
+        print(f"  {kind:<10} n={stats['n']:<4} p50={stats['p50']:.2f}s p95={stats['p95']:.2f}s max={stats['max']:.2f}s")
+    rss = result['rss_mb']
+    print(f"  RSS: início {rss['start']:.0f} MB, pico {rss['peak']:.0f} MB, fim {rss['end']:.0f} MB; "
+          f"{result['tile_requests']} tiles servidos pelo servidor local")
+    for error in result['errors'][:5]:
+        print(f"  erro: {error}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Bases sintéticas para os benchmarks, em múltiplos do tamanho das bases do repositório.
+
+Uma base na escala N tem N cópias de cada fazenda: a cópia 0 mantém os nomes
+originais e a cópia i recebe o sufixo ``_R{i:03d}`` na fazenda e nos talhões
+(``BOI_PRETO_XI_R001``, ``BOI_PRETO_XI_R001_041``), com os polígonos e os
+pixels deslocados em uma grade, de forma que as cópias não se sobrepõem. As
+datas, os valores de cobertura do dossel e a relação fazenda/talhão/data são
+os da base original. As predições são gravadas cópia a cópia (um row group
+por cópia), com memória limitada ao tamanho da base original.
+
+Executar a partir da pasta app_final:
+
+    python -m benchmarks.synthetic --scales 1,10,100 [--out pasta]
+"""
+import argparse
+import os
+import tempfile
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from shapely import affinity
+
+from combate import config
+
+DATA_DIR = os.environ.get("COMBATE_BENCH_DATA", os.path.join(tempfile.gettempdir(), "combate_bench"))
+
+# Cópias por linha da grade de deslocamento
+COPIES_PER_ROW = 10
+
+
+def _offset(copy, bounds):
+    # Deslocamento (graus) da cópia: grade de COPIES_PER_ROW colunas, com folga de 10%
+    w, s, e, n = bounds
+    row, col = divmod(copy, COPIES_PER_ROW)
+    return col * (e - w) * 1.1, -row * (n - s) * 1.1
+
+
+def _suffix(copy):
+    return f"_R{copy:03d}" if copy else ""
+
+
+def dataset_paths(scale, root=DATA_DIR):
+    """Caminhos (predições, talhões) da base sintética na escala informada."""
+    folder = os.path.join(root, f"x{scale}")
+    return os.path.join(folder, "pred_attack.parquet"), os.path.join(folder, "talhoes.shp")
+
+
+def _write_stands(stands, scale, bounds, path):
+    copies = []
+    for copy in range(scale):
+        dx, dy = _offset(copy, bounds)
+        replica = stands.copy()
+        replica['Fazenda'] = replica['Fazenda'] + _suffix(copy)
+        replica['geometry'] = replica['geometry'].apply(affinity.translate, xoff=dx, yoff=dy)
+        copies.append(replica)
+    gpd.GeoDataFrame(pd.concat(copies, ignore_index=True), crs=stands.crs).to_file(path)
+
+
+def _write_predictions(pred, scale, bounds, path):
+    # Parte do talhão após o nome da fazenda (ex.: "_001"), para renomear os talhões de cada cópia
+    farm, stand = pred['FARM'].astype(str), pred['STAND'].astype(str)
+    stand_suffix = pd.Series([s[len(f):] for f, s in zip(farm, stand)], index=pred.index)
+
+    writer = None
+    try:
+        for copy in range(scale):
+            dx, dy = _offset(copy, bounds)
+            replica = pred.copy()
+            replica['FARM'] = farm + _suffix(copy)
+            replica['STAND'] = farm + _suffix(copy) + stand_suffix
+            replica['X'] = pred['X'] + dx
+            replica['Y'] = pred['Y'] + dy
+            table = pa.Table.from_pandas(replica, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def generate(scale, root=DATA_DIR, pred_path=config.PRED_ATTACK_PATH, stands_path=config.STANDS_PATH):
+    """Gera a base sintética na escala informada, se ainda não existir; retorna os caminhos."""
+    pred_out, stands_out = dataset_paths(scale, root)
+    if os.path.exists(pred_out) and os.path.exists(stands_out):
+        return pred_out, stands_out
+
+    os.makedirs(os.path.dirname(pred_out), exist_ok=True)
+    stands = gpd.read_file(stands_path).to_crs(config.CRS_LATLON)
+    bounds = tuple(stands.total_bounds)
+    _write_stands(stands, scale, bounds, stands_out)
+
+    # Gravado com outro nome e renomeado, para uma geração interrompida não ser reaproveitada
+    tmp_out = pred_out + ".tmp"
+    _write_predictions(pd.read_parquet(pred_path), scale, bounds, tmp_out)
+    os.replace(tmp_out, pred_out)
+    return pred_out, stands_out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bases sintéticas para os benchmarks")
+    parser.add_argument("--scales", default="1,10,100", help="Escalas separadas por vírgula")
+    parser.add_argument("--out", default=DATA_DIR, help="Pasta de saída")
+    args = parser.parse_args(argv)
+    for scale in (int(value) for value in args.scales.split(",")):
+        pred_path, stands_path = generate(scale, args.out)
+        print(f"x{scale}: {pq.ParquetFile(pred_path).metadata.num_rows} pixels em {pred_path}")
+
+
+if __name__ == "__main__":
+    main()
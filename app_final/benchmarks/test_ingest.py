@@ -0,0 +1,116 @@
+"""Verifica que a ingestão incremental (combate/ingest.py) equivale a recalcular as bases agrupadas por completo."""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pytest
+from pandas.testing import assert_frame_equal
+
+from combate import config, loading, store
+from combate import thresholds as canopy_thresholds
+from combate.aggregates import build_aggregates
+from combate.build_aggregates import read_thresholds, write_aggregates
+from combate.ingest import ingest
+
+
+@pytest.fixture(scope="module")
+def split(tmp_path_factory):
+    """Predições do repositório separadas em datas anteriores e última data."""
+    folder = tmp_path_factory.mktemp("ingest")
+    table = pq.read_table(config.PRED_ATTACK_PATH)
+    last = pc.max(table['DATE'])
+    earlier_path, last_path = str(folder / "earlier.parquet"), str(folder / "last.parquet")
+    pq.write_table(table.filter(pc.less(table['DATE'], last)), earlier_path)
+    pq.write_table(table.filter(pc.equal(table['DATE'], last)), last_path)
+    return folder, earlier_path, last_path
+
+
+def _sorted(df, key):
+    return df.sort_values(['COMPANY', key, 'DATE']).reset_index(drop=True)
+
+
+def _aggregate_paths(out):
+    return tuple(str(out / os.path.basename(path)) for path in
+                 (config.GROUPED_FARM_PATH, config.GROUPED_STAND_PATH, config.AGGREGATES_META_PATH))
+
+
+def _assert_matches_rebuild(dataset, stands_path, out, frozen, mode):
+    # Recálculo completo com os mesmos limiares registrados antes da ingestão
+    farm_path, stand_path, meta_path = _aggregate_paths(out)
+    loading.evict(dataset)
+    pred = loading.load_pred_attack(dataset)
+    grouped_farm, grouped_stand, _ = build_aggregates(pred, loading.load_stands(stands_path), frozen, mode)
+    assert_frame_equal(_sorted(pd.read_parquet(farm_path), 'FARM'), _sorted(grouped_farm, 'FARM'))
+    assert_frame_equal(_sorted(pd.read_parquet(stand_path), 'STAND'), _sorted(grouped_stand, 'STAND'))
+
+    # Os histogramas correspondem aos pixels gravados na base, sem pixels contados duas vezes
+    sketches = read_thresholds(meta_path).sketches
+    expected = canopy_thresholds.sketch_pixels(pred)
+    for sketch_mode in canopy_thresholds.MODES:
+        assert sketches[sketch_mode].keys() == expected[sketch_mode].keys()
+        for key, sketch in expected[sketch_mode].items():
+            np.testing.assert_array_equal(sketches[sketch_mode][key].bins, sketch.bins)
+            np.testing.assert_array_equal(sketches[sketch_mode][key].counts, sketch.counts)
+    loading.evict(dataset)
+
+
+@pytest.mark.parametrize("mode", canopy_thresholds.MODES)
+def test_ingest_matches_full_rebuild(split, mode):
+    folder, earlier_path, last_path = split
+    out = folder / mode
+    out.mkdir()
+    dataset = str(out / "pred_attack")
+    stands_path = loading.stands_source()
+    farm_path, stand_path, meta_path = _aggregate_paths(out)
+
+    # Base com as datas anteriores e bases agrupadas correspondentes
+    store.convert_to_dataset(earlier_path, dataset)
+    write_aggregates(dataset, stands_path, farm_path, stand_path, meta_path, threshold_mode=mode)
+    frozen = read_thresholds(meta_path)
+
+    result = ingest(last_path, dataset, stands_path, str(out))
+    assert result['incremental']
+
+    _assert_matches_rebuild(dataset, stands_path, out, frozen, mode)
+    shutil.rmtree(dataset)
+
+
+@pytest.mark.parametrize("mode", canopy_thresholds.MODES)
+def test_partial_reingest_matches_full_rebuild(split, mode):
+    # Uma data já ingerida chega de novo com apenas parte das fazendas e outros valores de cobertura
+    folder, earlier_path, last_path = split
+    out = folder / f"reingest_{mode}"
+    out.mkdir()
+    dataset = str(out / "pred_attack")
+    stands_path = loading.stands_source()
+    farm_path, stand_path, meta_path = _aggregate_paths(out)
+
+    store.convert_to_dataset(earlier_path, dataset)
+    write_aggregates(dataset, stands_path, farm_path, stand_path, meta_path, threshold_mode=mode)
+    ingest(last_path, dataset, stands_path, str(out))
+    frozen = read_thresholds(meta_path)
+
+    last = pq.read_table(last_path)
+    farms = pc.unique(last['FARM']).to_pylist()
+    assert len(farms) > 1
+    farms = farms[:1]
+    partial = last.filter(pc.is_in(last['FARM'], pa.array(farms)))
+    partial = partial.set_column(partial.schema.get_field_index('canopycov'), 'canopycov',
+                                 pc.cast(pc.subtract(100, partial['canopycov']), pa.int32()))
+    partial_path = str(out / "partial.parquet")
+    pq.write_table(partial, partial_path)
+
+    result = ingest(partial_path, dataset, stands_path, str(out))
+    assert result['incremental']
+
+    grouped_farm = pd.read_parquet(farm_path)
+    last_date = pd.Timestamp(pc.max(last['DATE']).as_py())
+    # As demais fazendas da data continuam nas bases agrupadas
+    assert set(grouped_farm.loc[grouped_farm['DATE'] == last_date, 'FARM']) == {farm.upper() for farm in
+                                                                                pc.unique(last['FARM']).to_pylist()}
+    _assert_matches_rebuild(dataset, stands_path, out, frozen, mode)
+    shutil.rmtree(dataset)
@@ -0,0 +1,111 @@
+"""Benchmarks de cada etapa do pipeline do painel nas bases sintéticas."""
+import os
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+from combate import config, loading, render
+from combate.aggregates import _add_recommendations, count_pixels, farm_rows, stand_lookup, stand_rows
+from combate.classification import classify_status, compute_qt
+from combate.monthly import monthly_cube
+from combate.reports import report_frames, write_xlsx
+from combate.stands import area_index
+from combate.thresholds import build as build_thresholds
+
+
+@pytest.fixture(scope="session")
+def pipeline(dataset):
+    """Entradas de cada etapa, calculadas uma vez por escala."""
+    pred_path, stands_path = dataset
+    pred = loading.load_pred_attack(pred_path)
+    stands = loading.load_stands(stands_path)
+    QT = compute_qt(pred['canopycov'])
+    lookup = stand_lookup(stands)
+    counts = count_pixels(pred, QT)
+    rows_farm, rows_stand = farm_rows(counts, lookup), stand_rows(counts, lookup)
+    grouped_farm = _add_recommendations(rows_farm.copy(), 'FARM', 'farm_total_area_ha')
+    grouped_stand = _add_recommendations(rows_stand.copy(), 'STAND', 'stand_total_area_ha')
+
+    # Fazenda e data exibidas nos mapas: a primeira fazenda da base original, na última data
+    farm, date = pred['FARM'].cat.categories[0], pred['DATE'].max()
+    pred_farm = pred[(pred['FARM'] == farm) & (pred['DATE'] == date)]
+    outlines = [(stands[stands['FARM'] == farm], 'black', 0.5)]
+    yield SimpleNamespace(pred_path=pred_path, stands_path=stands_path, pred=pred, stands=stands, QT=QT,
+                          lookup=lookup, counts=counts, rows_farm=rows_farm, rows_stand=rows_stand,
+                          grouped_farm=grouped_farm, grouped_stand=grouped_stand,
+                          farm=farm, date=date, pred_farm=pred_farm, outlines=outlines)
+    loading.evict(pred_path, stands_path)
+
+
+def test_load_predictions(stage, pipeline):
+    def setup():
+        loading.evict(pipeline.pred_path)
+        return (pipeline.pred_path,), {}
+    stage("load_predictions", loading.load_pred_attack, setup)
+
+
+def test_load_stands(stage, pipeline):
+    def setup():
+        loading.evict(pipeline.stands_path)
+        return (pipeline.stands_path,), {}
+    stage("load_stands", loading.load_stands, setup)
+
+
+def test_reprojection(stage, pipeline):
+    stage("reprojection", lambda: pipeline.stands.to_crs(config.CRS_UTM))
+
+
+def test_area_index(stage, pipeline):
+    stage("area_index", lambda: area_index(pipeline.stands))
+
+
+def test_merge(stage, pipeline):
+    def merge():
+        lookup = stand_lookup(pipeline.stands)
+        return farm_rows(pipeline.counts, lookup), stand_rows(pipeline.counts, lookup)
+    stage("merge", merge)
+
+
+def test_status_classification(stage, pipeline):
+    stage("status", lambda: classify_status(pipeline.pred['canopycov'], compute_qt(pipeline.pred['canopycov'])))
+
+
+def test_threshold_sketch(stage, pipeline):
+    stage("threshold_sketch", lambda: build_thresholds(pipeline.pred, 'date'))
+
+
+def test_aggregation(stage, pipeline):
+    stage("aggregation", count_pixels, lambda: ((pipeline.pred, pipeline.QT), {}))
+
+
+def test_recommendations(stage, pipeline):
+    def recommendations(rows_farm, rows_stand):
+        return (_add_recommendations(rows_farm, 'FARM', 'farm_total_area_ha'),
+                _add_recommendations(rows_stand, 'STAND', 'stand_total_area_ha'))
+    stage("recommendations", recommendations,
+          lambda: ((pipeline.rows_farm.copy(), pipeline.rows_stand.copy()), {}))
+
+
+def test_monthly_cube(stage, pipeline):
+    stage("monthly_cube", lambda: (monthly_cube(pipeline.grouped_farm, 'FARM'),
+                                   monthly_cube(pipeline.grouped_stand, 'STAND')))
+
+
+def test_heatmap_render(stage, pipeline):
+    pred_farm = pipeline.pred_farm
+    stage("heatmap_render", lambda: render.render_heatmap(pred_farm['X'], pred_farm['Y'], pred_farm['canopycov'],
+                                                          outlines=pipeline.outlines))
+
+
+def test_geopdf_build(stage, pipeline):
+    pytest.importorskip("osgeo.gdal")
+    from combate.geopdf import create_geopdf
+
+    stage("geopdf_build", lambda: create_geopdf(pipeline.pred_farm, pipeline.farm, pipeline.date))
+
+
+def test_excel_export(stage, pipeline):
+    frames = report_frames(pipeline.grouped_farm, pipeline.grouped_stand)
+    with tempfile.TemporaryDirectory() as folder:
+        stage("excel_export", write_xlsx, lambda: ((frames, os.path.join(folder, "recomendacao.xlsx")), {}))
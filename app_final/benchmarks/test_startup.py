@@ -0,0 +1,70 @@
+"""Tempo de importação na primeira execução do painel em um processo novo.
+
+Os ``import`` do topo do New_Home.py são executados em um interpretador novo,
+sem os módulos em cache de execuções anteriores: é o tempo pago antes de
+qualquer elemento aparecer na página. As bibliotecas dos mapas e GeoPDFs
+(combate.warmup.HEAVY_MODULES) não devem estar entre elas; o tempo de
+importá-las, feito em segundo plano enquanto a página é montada, é medido à parte.
+
+O limite de tempo da importação é COMBATE_STARTUP_BUDGET (segundos, padrão 3).
+"""
+import ast
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.load_test import APP_PATH
+from combate.warmup import HEAVY_MODULES
+
+STARTUP_BUDGET = float(os.environ.get("COMBATE_STARTUP_BUDGET", 3))
+
+_MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+exec(compile(sys.stdin.read(), "imports", "exec"), {})
+print(json.dumps({"seconds": time.perf_counter() - start,
+                  "loaded": [name for name in %r if name in sys.modules]}))
+"""
+
+
+def _app_imports():
+    with open(APP_PATH, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return ast.unparse(ast.Module([node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))], []))
+
+
+def _run(code, seconds):
+    # Interpretador novo a cada medição, na pasta app_final (como o `streamlit run`)
+    result = subprocess.run([sys.executable, "-c", _MEASURE % (HEAVY_MODULES,)], input=code, capture_output=True,
+                            text=True, check=True, cwd=os.path.dirname(APP_PATH))
+    measured = json.loads(result.stdout.splitlines()[-1])
+    seconds.append(measured['seconds'])
+    return measured
+
+
+def test_app_imports(benchmark, report):
+    # O tempo do pytest-benchmark inclui a criação do processo; o resumo usa o tempo medido no processo
+    seconds = []
+    measured = benchmark.pedantic(_run, args=(_app_imports(), seconds), rounds=3, iterations=1)
+    benchmark.extra_info.update(import_s=round(sum(seconds) / len(seconds), 3), budget_s=STARTUP_BUDGET,
+                                heavy_modules=measured['loaded'])
+    report("startup_imports", None, sum(seconds) / len(seconds))
+
+    assert not measured['loaded'], f"bibliotecas pesadas importadas na abertura: {measured['loaded']}"
+    assert max(seconds) <= STARTUP_BUDGET, \
+        f"importação em {max(seconds):.2f}s, acima do limite de {STARTUP_BUDGET:.1f}s"
+
+
+def test_deferred_imports(benchmark, report):
+    modules = [name for name in HEAVY_MODULES if importlib.util.find_spec(name.split(".")[0]) is not None]
+    if not modules:
+        pytest.skip("bibliotecas dos mapas e GeoPDFs não instaladas")
+    seconds = []
+    benchmark.pedantic(_run, args=("\n".join(f"import {name}" for name in modules), seconds), rounds=3,
+                       iterations=1)
+    benchmark.extra_info.update(import_s=round(sum(seconds) / len(seconds), 3), modules=modules)
+    report("deferred_imports", None, sum(seconds) / len(seconds))
@@ -0,0 +1,54 @@
+"""Verificações dos histogramas dos limiares QT (ver combate/thresholds.py)."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from combate import thresholds
+
+
+def _pixels(canopycov, **columns):
+    return pd.DataFrame({'canopycov': canopycov, 'DATE': pd.Timestamp('2024-01-05'),
+                         'COMPANY': 'MANULIFE', 'FARM': 'BOI_PRETO_XI', **columns})
+
+
+def _sketch(pred):
+    return thresholds.sketch_pixels(pred)['global'][thresholds.GLOBAL_KEY]
+
+
+@pytest.mark.parametrize("q", [0.0, 0.05, 0.25, 0.5, 0.9, 1.0])
+def test_quantile_matches_pandas(q):
+    canopycov = pd.Series(np.random.default_rng(0).integers(0, 101, 10_001), dtype=float)
+    assert _sketch(_pixels(canopycov)).quantile(q) == pytest.approx(canopycov.quantile(q))
+
+
+def test_merge_matches_concatenated_pixels():
+    rng = np.random.default_rng(1)
+    left = _pixels(rng.integers(0, 101, 5_000).astype(float))
+    right = _pixels(rng.integers(20, 90, 3_000).astype(float))
+    merged = _sketch(left).merge(_sketch(right))
+    whole = _sketch(pd.concat([left, right], ignore_index=True))
+
+    np.testing.assert_array_equal(merged.bins, whole.bins)
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+    assert merged.quantile(0.05) == whole.quantile(0.05)
+
+
+def test_farm_thresholds_are_per_company():
+    # A mesma fazenda em duas empresas recebe um limiar para cada uma
+    pred = pd.concat([_pixels(np.arange(0.0, 100.0), COMPANY='A'),
+                      _pixels(np.arange(50.0, 100.0), COMPANY='B')], ignore_index=True)
+    built = thresholds.build(pred, 'farm')
+
+    assert set(built.values) == {'A|BOI_PRETO_XI', 'B|BOI_PRETO_XI'}
+    per_pixel = built.for_pixels(pred)
+    assert (per_pixel[pred['COMPANY'] == 'A'] == built.values['A|BOI_PRETO_XI']).all()
+    assert (per_pixel[pred['COMPANY'] == 'B'] == built.values['B|BOI_PRETO_XI']).all()
+
+
+def test_qt_without_sketches_uses_recorded_value():
+    built = thresholds.build(_pixels(np.arange(0.0, 100.0)), 'date')
+    meta = {'QT': float(built.qt), 'thresholds': dict(built.to_meta(), resolution=1.0)}
+    restored = thresholds.from_meta(meta)
+
+    assert restored.sketches == {}
+    assert restored.qt == built.qt
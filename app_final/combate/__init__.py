@@ -0,0 +1 @@
+"""Camada de dados e processamento da Plataforma de Monitoramento (Combate SF)."""
@@ -0,0 +1,238 @@
+# Construção das bases agrupadas por fazenda (grouped_farm) e por talhão (grouped_stand)
+#
+# As bases dependem apenas das predições e dos talhões, portanto podem ser
+# calculadas uma vez por ingestão (ver combate/build_aggregates.py) em vez de
+# a cada interação com o painel.
+import numpy as np
+import pandas as pd
+
+from combate import thresholds as canopy_thresholds
+from combate.classification import (STATUS_CATEGORIES, add_other_defoliation, add_recommendation_bands,
+                                    classify_status)
+
+# Abreviação dos meses em português (independente do locale do sistema)
+MESES = ('jan', 'fev', 'mar', 'abr', 'mai', 'jun', 'jul', 'ago', 'set', 'out', 'nov', 'dez')
+
+
+def month_abbr(dates):
+    """Abreviação do mês (ex.: 'jan') para uma série de datas."""
+    months = pd.to_datetime(dates).dt.month.to_numpy()
+    return pd.Series(np.array(MESES)[months - 1], index=dates.index)
+
+
+def month_number(dates):
+    """Número sequencial do mês (ano * 12 + mês - 1): separa o mesmo mês de anos diferentes."""
+    dates = pd.to_datetime(dates)
+    return dates.dt.year.to_numpy() * 12 + dates.dt.month.to_numpy() - 1
+
+
+def month_label(numbers):
+    """Rótulo 'mês/ano' (ex.: 'jan/24') de números retornados por ``month_number``."""
+    numbers = np.asarray(numbers)
+    return [f"{MESES[number % 12]}/{number // 12 % 100:02d}" for number in numbers]
+
+
+def stand_lookup(stands_all):
+    """Tabela com uma linha por talhão e as áreas do talhão e da fazenda, em hectares.
+
+    As áreas vêm da base de talhões (calculadas em EPSG:32722, ver
+    combate/stands.py); talhões com mais de um polígono têm as áreas somadas.
+    """
+    lookup = pd.DataFrame({
+        'COMPANY': stands_all['COMPANY'].to_numpy(),
+        'FARM': stands_all['FARM'].to_numpy(),
+        'STAND': stands_all['STAND'].to_numpy(),
+        'stand_total_area_ha': stands_all['area_ha'].to_numpy(),
+        'farm_total_area_ha': stands_all['farm_total_area_ha'].to_numpy(),
+    })
+    return (lookup
+            .groupby(['COMPANY', 'FARM', 'STAND'], as_index=False, sort=False)
+            .agg(stand_total_area_ha=('stand_total_area_ha', 'sum'),
+                 farm_total_area_ha=('farm_total_area_ha', 'first')))
+
+
+def _factorize(values):
+    # Colunas categóricas já têm os códigos inteiros; as demais são fatoradas.
+    # As chaves têm poucos valores distintos, então a tabela hash começa pequena.
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values, size_hint=1024)
+
+
+def count_pixels(pred, QT):
+    """Contagem de pixels por data, status e talhão.
+
+    Os pixels carregam apenas chaves inteiras (data, talhão e status); a
+    contagem é feita com ``np.bincount`` sobre a chave combinada, e FARM e STAND
+    são recuperados das tabelas de chaves, que têm uma linha por talhão. ``QT``
+    é um limiar único ou um limiar por pixel (alinhado a ``pred``).
+    """
+    date_codes, dates = _factorize(pred['DATE'])
+    farm_codes, farms = _factorize(pred['FARM'])
+    stand_codes, stands = _factorize(pred['STAND'])
+    status_codes = classify_status(pred['canopycov'], QT).codes
+
+    # Pixels sem data, fazenda ou talhão ficam fora do agrupamento
+    valid = (date_codes >= 0) & (farm_codes >= 0) & (stand_codes >= 0)
+
+    # Chave inteira de cada par (FARM, STAND) presente nas predições
+    pair_codes, pairs = pd.factorize(farm_codes[valid].astype(np.int64) * len(stands) + stand_codes[valid],
+                                     size_hint=len(stands))
+
+    n_status = len(STATUS_CATEGORIES)
+    combined = (date_codes[valid].astype(np.int64) * len(pairs) + pair_codes) * n_status + status_codes[valid]
+    counts = np.bincount(combined, minlength=len(dates) * len(pairs) * n_status)
+
+    nonzero = np.flatnonzero(counts)
+    date_idx, rest = np.divmod(nonzero, len(pairs) * n_status)
+    pair_idx, status_idx = np.divmod(rest, n_status)
+    farm_idx, stand_idx = np.divmod(pairs[pair_idx], len(stands))
+    return pd.DataFrame({
+        'DATE': dates[date_idx],
+        'Status': pd.Categorical.from_codes(status_idx, categories=STATUS_CATEGORIES),
+        'FARM': farms[farm_idx],
+        'STAND': stands[stand_idx],
+        'count': counts[nonzero],
+    })
+
+
+# Colunas calculadas por _add_recommendations a partir das linhas base
+RECOMMENDATION_DERIVED = ['Mes', 'Average%', 'SDD', 'Controle 9M', 'Controle 3M', 'percentage_diff', 'Outra desfolha']
+
+
+def _add_recommendations(grouped, key, area_col):
+    # Criar coluna de mês
+    grouped['DATE'] = pd.to_datetime(grouped['DATE'])
+    grouped['Mes'] = month_abbr(grouped['DATE'])
+
+    # Criar coluna de porcentagem média de desfolha por mês (de cada ano)
+    month = pd.Series(month_number(grouped['DATE']), index=grouped.index)
+    grouped['Average%'] = grouped.groupby([grouped[key], month], observed=True)['percentage'].transform('mean').round(1)
+
+    # Criando as colunas de recomendação
+    grouped = add_recommendation_bands(grouped, area_col)
+    grouped = grouped.sort_values(by=[key, 'DATE'])
+    grouped['percentage_diff'] = grouped.groupby(key, observed=True)['percentage'].diff()
+    grouped['percentage_diff'] = grouped['percentage_diff'].round(1)
+    return add_other_defoliation(grouped, area_col)
+
+
+def farm_rows(counts, lookup):
+    """Linhas base (sem as colunas de recomendação) da base agrupada por fazenda."""
+    farm_areas = lookup.drop_duplicates(subset=['FARM'])
+
+    # Criando a base agrupada por fazenda e status e tratando-a
+    grouped_farm = (counts
+                    .groupby(['DATE', 'Status', 'FARM'], observed=True)
+                    .agg(count=('count', 'sum'))
+                    .reset_index()
+                    .merge(farm_areas[['FARM', 'farm_total_area_ha']], on='FARM', how='left'))
+    grouped_farm['farm_desfolha_area_ha'] = grouped_farm['count']/100
+    grouped_farm['total'] = grouped_farm.groupby(['DATE', 'FARM'], observed=True)['count'].transform('sum')
+    grouped_farm = grouped_farm[grouped_farm['Status'] == 'Desfolha'].sort_values(by='DATE')
+    grouped_farm['farm_total_area_ha'] = grouped_farm['farm_total_area_ha'].round(1)
+    grouped_farm['farm_desfolha_area_ha'] = grouped_farm[['farm_desfolha_area_ha', 'farm_total_area_ha']].min(axis=1)
+    grouped_farm['percentage'] = (grouped_farm['farm_desfolha_area_ha'] / grouped_farm['farm_total_area_ha']) * 100
+    grouped_farm['percentage'] = grouped_farm['percentage'].round(1)
+    return grouped_farm
+
+
+def build_grouped_farm(counts, lookup):
+    """Base agrupada por fazenda e data com as colunas de recomendação."""
+    return _add_recommendations(farm_rows(counts, lookup), 'FARM', 'farm_total_area_ha')
+
+
+def stand_rows(counts, lookup):
+    """Linhas base (sem as colunas de recomendação) da base agrupada por talhão."""
+    # Criando a base agrupada por talhão e status e tratando-a
+    grouped_stand = (counts
+                    .groupby(['DATE', 'Status', 'FARM', 'STAND'], observed=True)
+                    .agg(count=('count', 'sum'))
+                    .reset_index()
+                    .merge(lookup[['STAND', 'stand_total_area_ha']], on='STAND', how='left'))
+    grouped_stand['stand_desfolha_area_ha'] = grouped_stand['count']/100
+    grouped_stand['total'] = grouped_stand.groupby(['DATE', 'FARM', 'STAND'], observed=True)['count'].transform('sum')
+    grouped_stand = grouped_stand[grouped_stand['Status'] == 'Desfolha'].sort_values(by='DATE')
+    grouped_stand['stand_total_area_ha'] = grouped_stand['stand_total_area_ha'].round(1)
+    grouped_stand = grouped_stand.drop_duplicates(subset=['DATE', 'FARM', 'STAND'])
+    grouped_stand = grouped_stand.sort_values(by='stand_desfolha_area_ha', ascending=False)
+    grouped_stand['stand_desfolha_area_ha'] = grouped_stand[['stand_desfolha_area_ha', 'stand_total_area_ha']].min(axis=1)
+    grouped_stand['percentage'] = (grouped_stand['stand_desfolha_area_ha'] / grouped_stand['stand_total_area_ha']) * 100
+    grouped_stand['percentage'] = grouped_stand['percentage'].round(1)
+    return grouped_stand
+
+
+def build_grouped_stand(counts, lookup):
+    """Base agrupada por talhão e data com as colunas de recomendação."""
+    return _add_recommendations(stand_rows(counts, lookup), 'STAND', 'stand_total_area_ha')
+
+
+def company_rows(pred_attack, lookup, empresa, thresholds):
+    """Linhas base por fazenda e por talhão de uma empresa, com a coluna COMPANY.
+
+    ``lookup`` é a tabela de áreas por talhão retornada por ``stand_lookup`` e
+    ``thresholds`` os limiares QT (ver combate/thresholds.py).
+    """
+    filtered_company = pred_attack[pred_attack['COMPANY'] == empresa]
+    company_lookup = lookup[lookup['COMPANY'] == empresa]
+
+    counts = count_pixels(filtered_company, thresholds.for_pixels(filtered_company))
+    grouped_farm = farm_rows(counts, company_lookup)
+    grouped_stand = stand_rows(counts, company_lookup)
+    grouped_farm.insert(0, 'COMPANY', empresa)
+    grouped_stand.insert(0, 'COMPANY', empresa)
+    return grouped_farm, grouped_stand
+
+
+def build_company_aggregates(pred_attack, lookup, empresa, thresholds):
+    """Calcula grouped_farm e grouped_stand de uma empresa."""
+    grouped_farm, grouped_stand = company_rows(pred_attack, lookup, empresa, thresholds)
+    return (_add_recommendations(grouped_farm, 'FARM', 'farm_total_area_ha'),
+            _add_recommendations(grouped_stand, 'STAND', 'stand_total_area_ha'))
+
+
+def update_grouped(grouped, rows, key, area_col):
+    """Insere em uma base agrupada já calculada as linhas base de novas datas.
+
+    ``rows`` são as linhas de uma empresa retornadas por ``company_rows``;
+    linhas existentes nas mesmas datas e fazendas são substituídas (como as
+    partições (DATE, FARM) na base particionada). As colunas de
+    recomendação são recalculadas apenas para as fazendas (ou talhões)
+    presentes nessas datas, a partir das linhas já agregadas, sem reler os
+    pixels de datas anteriores.
+    """
+    empresa = rows['COMPANY'].iloc[0]
+    company = grouped['COMPANY'] == empresa
+    partitions = pd.MultiIndex.from_frame(rows[['DATE', 'FARM']].drop_duplicates())
+    replaced = company & pd.MultiIndex.from_frame(grouped[['DATE', 'FARM']]).isin(partitions)
+    affected = company & grouped[key].isin(pd.concat([grouped.loc[replaced, key], rows[key]]).unique())
+
+    # Linhas das fazendas (ou talhões) afetadas: histórico já agregado mais as novas datas
+    history = grouped[affected & ~replaced].drop(columns=RECOMMENDATION_DERIVED)
+    rows = rows[history.columns].astype(history.dtypes.to_dict())
+    recomputed = _add_recommendations(pd.concat([history, rows], ignore_index=True), key, area_col)
+
+    return (pd.concat([grouped[~affected], recomputed[grouped.columns]], ignore_index=True)
+            .sort_values(by=['COMPANY', key, 'DATE'], kind='stable')
+            .reset_index(drop=True))
+
+
+def build_aggregates(pred_attack, stands_all, previous_thresholds=None, threshold_mode=None):
+    """Calcula grouped_farm e grouped_stand de todas as empresas das predições.
+
+    Os limiares já registrados em ``previous_thresholds`` são mantidos (ver
+    combate/thresholds.py). Retorna as duas bases (com a coluna COMPANY) e os
+    limiares utilizados.
+    """
+    thresholds = canopy_thresholds.build(pred_attack, threshold_mode, previous_thresholds)
+    lookup = stand_lookup(stands_all)
+
+    farms, stands = [], []
+    for empresa in pred_attack['COMPANY'].unique():
+        grouped_farm, grouped_stand = build_company_aggregates(pred_attack, lookup, empresa, thresholds)
+        farms.append(grouped_farm)
+        stands.append(grouped_stand)
+
+    grouped_farm = pd.concat(farms, ignore_index=True)
+    grouped_stand = pd.concat(stands, ignore_index=True)
+    return grouped_farm, grouped_stand, thresholds
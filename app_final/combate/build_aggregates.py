@@ -0,0 +1,113 @@
+"""Gera as bases grouped_farm e grouped_stand em Parquet.
+
+Executar a partir da pasta app_final, após cada nova entrega de predições
+(por exemplo, em um job noturno):
+
+    python -m combate.build_aggregates
+
+As bases são gravadas ao lado de filtered_pred_attack.parquet, junto com um
+arquivo aggregates.json que registra a impressão digital das bases de origem.
+O painel não recalcula as bases: quando essas impressões digitais não
+coincidem com as dos arquivos atuais, ele continua exibindo as últimas bases
+gravadas, com um aviso, até a próxima execução deste comando.
+
+O aggregates.json também registra os limiares QT (ver combate/thresholds.py),
+que são mantidos nos recálculos seguintes; ``--threshold-mode`` escolhe o modo
+(padrão: COMBATE_THRESHOLD_MODE) e ``--reset-thresholds`` os recalcula.
+"""
+import argparse
+import json
+import os
+import time
+
+from combate import config
+from combate import thresholds as canopy_thresholds
+from combate.aggregates import build_aggregates
+from combate.companies import load_registry
+from combate.loading import file_fingerprint, load_pred_attack, load_stands, prediction_source, stands_source
+
+
+def save_aggregates(grouped_farm, grouped_stand, thresholds, pred_path, stands_path,
+                    farm_path=config.GROUPED_FARM_PATH, stand_path=config.GROUPED_STAND_PATH,
+                    meta_path=config.AGGREGATES_META_PATH):
+    """Grava as bases agrupadas e o aggregates.json com as impressões digitais das bases de origem."""
+    # Grava em arquivos temporários e substitui, para o painel nunca ler um arquivo pela metade
+    for df, path in ((grouped_farm, farm_path), (grouped_stand, stand_path)):
+        tmp_path = path + ".tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    meta = {
+        'pred_attack': file_fingerprint(pred_path),
+        'stands': file_fingerprint(stands_path),
+        'QT': float(thresholds.qt),
+        'thresholds': thresholds.to_meta(),
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_path + ".tmp", meta_path)
+    return meta
+
+
+def read_thresholds(meta_path=config.AGGREGATES_META_PATH):
+    """Limiares QT registrados no aggregates.json, se houver (ver combate/thresholds.py)."""
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return canopy_thresholds.from_meta(json.load(f))
+
+
+def write_aggregates(pred_path=None, stands_path=None,
+                     farm_path=config.GROUPED_FARM_PATH, stand_path=config.GROUPED_STAND_PATH,
+                     meta_path=config.AGGREGATES_META_PATH, threshold_mode=None, reset_thresholds=False):
+    """Calcula e grava as bases agrupadas; retorna o conteúdo do aggregates.json.
+
+    Os limiares QT já registrados em ``meta_path`` são mantidos, a menos que
+    ``reset_thresholds`` seja verdadeiro ou o modo seja outro.
+    """
+    pred_path = pred_path or prediction_source()
+    stands_path = stands_path or stands_source()
+    previous = None if reset_thresholds else read_thresholds(meta_path)
+    pred_attack = load_pred_attack(pred_path)
+    stands_all = load_stands(stands_path)
+    grouped_farm, grouped_stand, thresholds = build_aggregates(pred_attack, stands_all, previous, threshold_mode)
+    return save_aggregates(grouped_farm, grouped_stand, thresholds, pred_path, stands_path,
+                           farm_path, stand_path, meta_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--prediction', default=None,
+                        help="Base de predições (arquivo Parquet ou base particionada; padrão: a base em uso)")
+    parser.add_argument('--stands', default=None,
+                        help="Base de talhões (shapefile ou GeoParquet; padrão: a base em uso)")
+    parser.add_argument('--out-dir', default=None, help="Pasta de saída (padrão: pasta da base de predições)")
+    parser.add_argument('--company', default=None,
+                        help="Empresa do cadastro (companies.json); usa as bases e a pasta de saída da empresa")
+    parser.add_argument('--threshold-mode', default=None, choices=canopy_thresholds.MODES,
+                        help="Limiar QT único, por data ou por fazenda (padrão: COMBATE_THRESHOLD_MODE)")
+    parser.add_argument('--reset-thresholds', action='store_true',
+                        help="Recalcula os limiares QT em vez de manter os já registrados")
+    args = parser.parse_args(argv)
+
+    prediction, stands, out_dir = args.prediction, args.stands, args.out_dir
+    if args.company:
+        company = load_registry()[args.company.upper()]
+        prediction, stands = company.prediction, company.stands
+        out_dir = out_dir or company.aggregates_dir
+    prediction = prediction or prediction_source()
+    out_dir = out_dir or os.path.dirname(os.path.abspath(prediction))
+    start = time.perf_counter()
+    meta = write_aggregates(
+        prediction, stands,
+        farm_path=os.path.join(out_dir, os.path.basename(config.GROUPED_FARM_PATH)),
+        stand_path=os.path.join(out_dir, os.path.basename(config.GROUPED_STAND_PATH)),
+        meta_path=os.path.join(out_dir, os.path.basename(config.AGGREGATES_META_PATH)),
+        threshold_mode=args.threshold_mode, reset_thresholds=args.reset_thresholds)
+    print(f"Bases agrupadas gravadas em {out_dir} (QT={meta['QT']:.2f}, limiar {meta['thresholds']['mode']}) "
+          f"em {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Pirâmide de tiles XYZ da cobertura do dossel, por empresa e data.
+
+Os pixels de cada data são agregados em uma grade por fazenda (na resolução
+das predições, com níveis reduzidos 2x2 para os zooms menores) e cortados em
+tiles PNG Web Mercator de 256 px, com o mesmo mapa de cores (RdYlGn) dos mapas
+do painel. Apenas os tiles com dados são gravados. Layout em disco::
+
+    static/canopy/MANULIFE/2024-10-01/{z}/{x}/{y}.png
+    static/canopy/MANULIFE/2024-10-01/metadata.json
+
+A pasta static é servida pelo próprio Streamlit (ver .streamlit/config.toml),
+e o painel mostra um mapa interativo que só carrega os tiles visíveis. Para
+gerar a pirâmide, executar a partir da pasta app_final:
+
+    python -m combate.canopy_tiles build [--company MANULIFE] [--dates 2024-10-01] [--zooms 10-18]
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from combate import config, tiles
+from combate.companies import load_registry
+from combate.loading import load_prediction_keys, read_predictions
+from combate.render import bin_to_grid, colorize, colormap_lut
+
+CMAP = "RdYlGn"
+
+
+def _downsample(grid):
+    # Média 2x2 ignorando células vazias; a origem (canto noroeste) é mantida
+    rows, cols = grid.shape
+    padded = np.full((rows + rows % 2, cols + cols % 2), np.nan)
+    padded[:rows, :cols] = grid
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    counts = np.isfinite(blocks).sum(axis=(1, 3))
+    sums = np.nansum(blocks, axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def farm_grids(pred, lut, vmin, vmax, cell=config.PREDICTION_GRID_DEG):
+    """Grade colorida (RGBA) da cobertura do dossel de cada fazenda, com os níveis reduzidos.
+
+    Retorna uma lista de (limites (oeste, sul, leste, norte), [grade nível 0, nível 1, ...]);
+    a célula do nível k mede ``cell * 2**k`` graus. As médias dos níveis
+    reduzidos são calculadas sobre os valores, antes da coloração.
+    """
+    grids = []
+    for _, farm in pred.groupby('FARM', observed=True):
+        x, y = farm['X'].to_numpy(np.float64), farm['Y'].to_numpy(np.float64)
+        cols = int(round((x.max() - x.min()) / cell)) + 1
+        rows = int(round((y.max() - y.min()) / cell)) + 1
+        w, n = x.min() - cell / 2, y.max() + cell / 2
+        bounds = (w, n - rows * cell, w + cols * cell, n)
+        levels = [bin_to_grid(x, y, farm['canopycov'].to_numpy(), bounds, (rows, cols))]
+        while max(levels[-1].shape) > 1:
+            levels.append(_downsample(levels[-1]))
+        # Cada pixel RGBA é guardado como um uint32, para a amostragem mover um único valor por pixel
+        grids.append((bounds, [colorize(level, lut, vmin, vmax).view(np.uint32)[..., 0] for level in levels]))
+    return grids
+
+
+def _pixel_centers(x, y, zoom):
+    # Longitude de cada coluna e latitude de cada linha dos pixels do tile
+    minx, maxx, miny, maxy = tiles.tile_extent(x, y, zoom)
+    offsets = (np.arange(tiles.TILE_SIZE) + 0.5) / tiles.TILE_SIZE
+    lon = (minx + offsets * (maxx - minx)) / tiles.ORIGIN_SHIFT * 180.0
+    lat = np.degrees(np.arctan(np.sinh((maxy - offsets * (maxy - miny)) / tiles.ORIGIN_SHIFT * np.pi)))
+    return lon, lat
+
+
+def render_tile(grids, x, y, zoom, cell=config.PREDICTION_GRID_DEG):
+    """Imagem RGBA do tile, ou None quando não há dados nele."""
+    lon, lat = _pixel_centers(x, y, zoom)
+
+    # Nível da grade com célula não maior que o pixel do tile
+    pixel_deg = 360.0 / (tiles.TILE_SIZE * 2 ** zoom)
+    image = None
+    for (w, s, e, n), levels in grids:
+        if w > lon[-1] or e < lon[0] or s > lat[0] or n < lat[-1]:
+            continue
+        level = min(max(int(np.floor(np.log2(pixel_deg / cell))), 0), len(levels) - 1)
+        grid, level_cell = levels[level], cell * 2 ** level
+        cols = np.floor((lon - w) / level_cell).astype(np.int64)
+        rows = np.floor((n - lat) / level_cell).astype(np.int64)
+        inside = ((rows >= 0) & (rows < grid.shape[0]))[:, None] & ((cols >= 0) & (cols < grid.shape[1]))[None, :]
+
+        # A grade é separável em linhas e colunas: duas seleções simples em vez de uma indexação 2D
+        sampled = grid.take(np.clip(rows, 0, grid.shape[0] - 1), axis=0).take(np.clip(cols, 0, grid.shape[1] - 1), axis=1)
+        sampled = np.where(inside, sampled, 0)
+
+        # Fazendas vizinhas: cada pixel fica com a primeira fazenda que tem dados nele (pixels vazios valem 0)
+        image = sampled if image is None else np.where(image != 0, image, sampled)
+
+    if image is None or not image.any():
+        return None
+    return image.view(np.uint8).reshape(tiles.TILE_SIZE, tiles.TILE_SIZE, 4)
+
+
+def build_date(pred, dest, zooms=range(config.CANOPY_MIN_ZOOM, config.CANOPY_MAX_ZOOM + 1)):
+    """Grava a pirâmide de uma data em ``dest``; retorna o metadata.json gravado."""
+    vmin, vmax = float(pred['canopycov'].min()), float(pred['canopycov'].max())
+    grids = farm_grids(pred, colormap_lut(CMAP), vmin, vmax)
+
+    # Grava em uma pasta temporária e substitui, para o painel nunca ler uma pirâmide pela metade
+    tmp_dest = dest + ".tmp"
+    if os.path.exists(tmp_dest):
+        shutil.rmtree(tmp_dest)
+    count = 0
+    for zoom in zooms:
+        tile_set = {tile for (w, s, e, n), _ in grids for tile in tiles.tiles_for_bounds(w, s, e, n, zoom)}
+        for x, y, z in sorted(tile_set):
+            image = render_tile(grids, x, y, z)
+            if image is None:
+                continue
+            path = os.path.join(tmp_dest, str(z), str(x), f"{y}.png")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            Image.fromarray(image, "RGBA").save(path)
+            count += 1
+
+    bounds = [min(b[0][0] for b in grids), min(b[0][1] for b in grids),
+              max(b[0][2] for b in grids), max(b[0][3] for b in grids)]
+    metadata = {'vmin': vmin, 'vmax': vmax, 'bounds': bounds, 'minzoom': min(zooms), 'maxzoom': max(zooms),
+                'tiles': count, 'cmap': CMAP, 'built_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    with open(os.path.join(tmp_dest, "metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+    if os.path.exists(dest):
+        shutil.rmtree(dest)
+    os.replace(tmp_dest, dest)
+    return metadata
+
+
+def pyramid_dir(company, date, root=config.CANOPY_TILES_DIR):
+    return os.path.join(root, company, f"{pd.Timestamp(date):%Y-%m-%d}")
+
+
+def pyramid_metadata(company, date, root=config.CANOPY_TILES_DIR):
+    """metadata.json da pirâmide da empresa e data, ou None se ela ainda não foi gerada."""
+    path = os.path.join(pyramid_dir(company, date, root), "metadata.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def tile_url(base_url, company, date):
+    """Modelo de endereço ``{z}/{x}/{y}`` dos tiles da empresa e data."""
+    return f"{base_url.rstrip('/')}/{company}/{pd.Timestamp(date):%Y-%m-%d}/{{z}}/{{x}}/{{y}}.png"
+
+
+def build_pyramids(company, dates=None, zooms=range(config.CANOPY_MIN_ZOOM, config.CANOPY_MAX_ZOOM + 1),
+                   root=config.CANOPY_TILES_DIR, progress=print):
+    """Gera a pirâmide de cada data da empresa (por padrão, todas as datas)."""
+    source = load_registry()[company].prediction
+    if dates is None:
+        keys = load_prediction_keys(source)
+        dates = sorted(keys.loc[keys['COMPANY'] == company, 'DATE'].unique())
+    for date in dates:
+        start = time.perf_counter()
+        pred = read_predictions(columns=['X', 'Y', 'canopycov'], source=source, dates=[date], companies=[company])
+        metadata = build_date(pred, pyramid_dir(company, date, root), zooms)
+        progress(f"{company} {pd.Timestamp(date):%Y-%m-%d}: {metadata['tiles']} tiles "
+                 f"em {time.perf_counter() - start:.1f}s")
+
+
+def _parse_zooms(text):
+    first, _, last = text.partition("-")
+    return range(int(first), int(last or first) + 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pirâmide de tiles da cobertura do dossel")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Gera a pirâmide de tiles das datas")
+    build_parser.add_argument("--company", default=None, help="Empresa do cadastro (padrão: todas)")
+    build_parser.add_argument("--dates", default=None, help="Datas separadas por vírgula (padrão: todas)")
+    build_parser.add_argument("--zooms", default=f"{config.CANOPY_MIN_ZOOM}-{config.CANOPY_MAX_ZOOM}",
+                              help="Intervalo de níveis de zoom, ex.: 10-18")
+    build_parser.add_argument("--out", default=config.CANOPY_TILES_DIR, help="Pasta de saída")
+    args = parser.parse_args(argv)
+
+    companies = [args.company.upper()] if args.company else list(load_registry())
+    dates = [pd.Timestamp(date) for date in args.dates.split(",")] if args.dates else None
+    for company in companies:
+        build_pyramids(company, dates, _parse_zooms(args.zooms), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""Gráficos do painel (plotly), montados a partir das bases agrupadas já filtradas.
+
+Usados pelo painel e pela exportação dos relatórios (ver combate/engine.py).
+"""
+import json
+
+import plotly.graph_objects as go
+
+from combate import config, tiles
+
+# Cores das barras dos 10 talhões com maior percentual de desfolha
+TOP_STANDS_COLORS = ["#ffae00", "#ffbd00", "#ffcb00", "#ffda00", "#ffe800",
+                     "#fff700", "#c8eb0a", "#92df14", "#5bd21d", "#24c627"]
+
+_HOVER = (
+    '<b>%{label}</b><br>'
+    'Área: %{value:.2f} ha<br>'
+    'Porcentagem: %{percent:.1%}<extra></extra>'
+)
+
+
+def monitored_area_pie(healthy_ha, defoliated_ha):
+    """Rosca da área monitorada da empresa: sem desfolha detectada e em desfolha."""
+    fig = go.Figure()
+
+    fig.add_trace(go.Pie(
+        labels=['Área Total Sem Desfolha Detectada', 'Área Total c/ Desfolha'],
+        values=[healthy_ha, defoliated_ha],
+        marker=dict(colors=['darkgreen', 'orange']),
+        textinfo='percent',
+        textfont=dict(size=20),
+        hovertemplate=_HOVER,
+        showlegend=True
+    ))
+
+    fig.update_layout(
+        title={
+            'text': "Área Monitorada",
+            'y': 0.95,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+            'font': {'color': 'black', 'size': 21}
+        },
+        paper_bgcolor='#f5f5f5',
+        plot_bgcolor='rgba(0,0,0,0)',
+        showlegend=True,
+        legend=dict(
+            orientation="h",
+            yanchor="top",
+            y=-0.3,
+            xanchor="center",
+            x=0.5,
+            font=dict(size=14, color='black'),
+            bgcolor='rgba(0,0,0,0)'
+        )
+    )
+    return fig
+
+
+def top_farms_bar(top_farms):
+    """Barras empilhadas das fazendas com maior percentual de desfolha (colunas FARM e percentage)."""
+    healthy_percentage = 100 - top_farms['percentage']
+
+    fig = go.Figure()
+
+    fig.add_trace(go.Bar(
+        x=top_farms['percentage'],
+        y=top_farms['FARM'],
+        orientation='h',
+        name='Área em Desfolha',
+        marker=dict(color='orange'),
+        text=top_farms['percentage'].round(1).astype(str) + '%',
+        textposition='inside'
+    ))
+
+    fig.add_trace(go.Bar(
+        x=healthy_percentage,
+        y=top_farms['FARM'],
+        orientation='h',
+        name='Área Sem Desfolha Detectada',
+        marker=dict(color='darkgreen'),
+        text=healthy_percentage.round(1).astype(str) + '%',
+        textposition='inside'
+    ))
+
+    fig.update_layout(
+        title='Top 10 Fazendas com Maior Percentual de Desfolha',
+        xaxis_title=dict(text="Percentual de Área (%)", font=dict(size=14, color='black')),
+        yaxis_title=dict(text="Fazenda", font=dict(size=14, color='black')),
+        xaxis=dict(
+            tickfont=dict(size=12, color='black'),
+            range=[0, 100],
+        ),
+        yaxis=dict(
+            tickfont=dict(size=12, color='black'),
+            autorange='reversed'
+        ),
+        barmode='stack',
+        title_font=dict(size=16, family='Arial', color='black'),
+        paper_bgcolor='#f5f5f5',
+        plot_bgcolor='rgba(0,0,0,0)',
+        showlegend=True,
+        legend=dict(
+            orientation='h',
+            yanchor='top',
+            y=-0.3,
+            xanchor='center',
+            x=0.5,
+            font=dict(size=12, color='black'),
+            bgcolor='rgba(0,0,0,0)'
+        )
+    )
+    return fig
+
+
+def top_stands_bar(top_stands, title):
+    """Barras dos talhões com maior percentual de desfolha (colunas STAND e desfolha_percentage)."""
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=top_stands['desfolha_percentage'],
+        y=top_stands['STAND'],
+        orientation='h',
+        marker=dict(color=TOP_STANDS_COLORS),
+        text=top_stands['desfolha_percentage'].round(1).astype(str) + '%',
+        textposition='auto'
+    ))
+
+    fig.update_layout(
+        title=title,
+        xaxis_title=dict(text="Percentual de Desfolha (%)", font=dict(size=14, color='black')),
+        yaxis_title=dict(text="Talhão", font=dict(size=14, color='black')),
+        title_font=dict(size=16, family='Arial', color='black'),
+        xaxis=dict(
+            title="Percentual de Desfolha (%)",
+            tickfont=dict(size=12, color='black'),
+            range=[0, 100]
+        ),
+        yaxis=dict(tickfont=dict(size=12, color='black'), autorange='reversed'),
+        paper_bgcolor='#f5f5f5',
+        plot_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig
+
+
+def farm_area_pie(defoliated_ha, healthy_ha):
+    """Rosca da área da fazenda selecionada: em desfolha e sem desfolha detectada."""
+    fig = go.Figure()
+    fig.add_trace(go.Pie(
+        labels=['Área Total c/ Desfolha', 'Área Total Sem Desfolha Detectada'],
+        values=[defoliated_ha, healthy_ha],
+        marker=dict(colors=['orange', 'darkgreen']),
+        textinfo='percent',
+        texttemplate='%{percent:.1%}',
+        insidetextorientation='horizontal',
+        hovertemplate=_HOVER,
+        textfont=dict(size=20, color='white')
+    ))
+
+    fig.update_layout(
+        title={'text': "Área Monitorada na fazenda selecionada", 'y': 0.95, 'x': 0.5, 'xanchor': 'center', 'yanchor': 'top', 'font': {'color': 'black', 'size': 21, 'family': 'Arial Black'}},
+        paper_bgcolor='#f5f5f5',
+        plot_bgcolor='rgba(0,0,0,0)',
+        showlegend=True,
+        legend=dict(
+            orientation='h',
+            yanchor='bottom',
+            y=-0.2,
+            xanchor='center',
+            x=0.5,
+            font=dict(size=14, color='black'),
+            bgcolor='rgba(0, 0, 0, 0)'
+        )
+    )
+    return fig
+
+
+def stand_area_pie(stand, defoliated_ha, healthy_ha):
+    """Rosca da área do talhão selecionado: em desfolha e sem desfolha detectada."""
+    fig = go.Figure()
+    fig.add_trace(go.Pie(
+        labels=['Área Total c/ Desfolha', 'Área Total Sem Desfolha Detectada'],
+        values=[defoliated_ha, healthy_ha],
+        marker=dict(colors=['orange', 'darkgreen']),
+        textinfo='percent',
+        texttemplate='%{percent:.1%}',
+        textposition='inside',
+        insidetextorientation='auto',
+        hovertemplate=_HOVER,
+        textfont=dict(size=18, color='white')
+    ))
+
+    fig.update_layout(
+        title={'text': f"Área Monitorada - {stand}", 'y': 0.95, 'x': 0.5, 'xanchor': 'center', 'yanchor': 'top', 'font': {'color': 'black', 'size': 21, 'family': 'Arial Black'}},
+        paper_bgcolor='#f5f5f5',
+        plot_bgcolor='rgba(0,0,0,0)',
+        showlegend=True,
+        legend=dict(
+            orientation='h',
+            yanchor='bottom',
+            y=-0.2,
+            xanchor='center',
+            x=0.5,
+            font=dict(size=14, color='black'),
+            bgcolor='rgba(0, 0, 0, 0)'
+        )
+    )
+    return fig
+
+
+def monthly_line(monthly, title, decimals=1):
+    """Linha da desfolha média (%) por mês (colunas Mes e Average%)."""
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=monthly['Mes'],
+        y=monthly['Average%'],
+        mode='lines+markers+text',
+        name='Média Mensal (%)',
+        line=dict(color='red', width=2),
+        marker=dict(size=6),
+        text=monthly['Average%'].round(decimals),
+        textposition='top center',
+        textfont=dict(size=12, color='black')
+    ))
+
+    fig.update_layout(
+        title=title,
+        xaxis_title=dict(text="Mês", font=dict(size=14, color='black')),
+        yaxis_title=dict(text="Desfolha (%)", font=dict(size=14, color='black')),
+        title_font=dict(size=16, family='Arial', color='black'),
+        xaxis=dict(tickfont=dict(size=12, color='black')),
+        yaxis=dict(tickfont=dict(size=12, color='black')),
+        showlegend=False,
+        paper_bgcolor='#f5f5f5',
+        plot_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig
+
+
+def canopy_map(canopy_url, metadata, farm_stands, stand_shape):
+    """Mapa interativo com os tiles da cobertura do dossel e os contornos dos talhões.
+
+    ``canopy_url`` é o endereço ``{z}/{x}/{y}`` dos tiles (ver combate/canopy_tiles.py)
+    e ``metadata`` os metadados da pirâmide (vmin e vmax da barra de cores).
+    """
+    # Camadas: imagem de fundo, tiles da cobertura do dossel e contornos dos talhões da fazenda
+    map_layers = []
+    if not config.TILES_OFFLINE:
+        map_layers.append(dict(sourcetype='raster', source=[tiles.basemap_provider().build_url()], below='traces'))
+    map_layers += [
+        dict(sourcetype='raster', source=[canopy_url], below='traces'),
+        dict(sourcetype='geojson', source=json.loads(farm_stands[['STAND', 'geometry']].to_json()),
+             type='line', color='black', line=dict(width=1)),
+        dict(sourcetype='geojson', source=json.loads(stand_shape[['STAND', 'geometry']].to_json()),
+             type='line', color='red', line=dict(width=2)),
+    ]
+
+    # Traço vazio apenas para exibir a barra de cores
+    fig = go.Figure(go.Scattermap(
+        lat=[None], lon=[None], mode='markers', hoverinfo='skip', showlegend=False,
+        marker=dict(colorscale='RdYlGn', cmin=metadata['vmin'], cmax=metadata['vmax'],
+                    color=[metadata['vmin']], showscale=True,
+                    colorbar=dict(title=dict(text='Cobertura do dossel (%)', side='right')))))
+
+    farm_w, farm_s, farm_e, farm_n = farm_stands.total_bounds
+    fig.update_layout(
+        map=dict(style='white-bg', layers=map_layers,
+                 center=dict(lon=(farm_w + farm_e) / 2, lat=(farm_s + farm_n) / 2),
+                 zoom=tiles.auto_zoom(farm_w, farm_s, farm_e, farm_n) - 1),
+        height=500,
+        margin=dict(l=0, r=0, t=0, b=0),
+        paper_bgcolor='#f5f5f5'
+    )
+    return fig
@@ -0,0 +1,56 @@
+# Classificação dos pixels (Status) e colunas de recomendação
+#
+# As regras são aplicadas com operações vetorizadas do NumPy e são
+# compartilhadas pelas bases por fazenda e por talhão. Os limiares ficam em
+# combate/config.py.
+import numpy as np
+import pandas as pd
+
+from combate import config
+
+STATUS_CATEGORIES = ['Desfolha', 'Saudavel']
+
+# Colunas de recomendação, na ordem em que aparecem nas tabelas e planilhas
+RECOMMENDATION_COLUMNS = ['SDD', 'Controle 9M', 'Controle 3M', 'Outra desfolha']
+
+
+def compute_qt(canopycov, quantile=config.CANOPY_QUANTILE):
+    """Limiar de cobertura do dossel abaixo do qual o pixel é considerado em desfolha."""
+    return canopycov.quantile(quantile)
+
+
+def classify_status(canopycov, qt):
+    """Status de cada pixel ('Desfolha' se canopycov < qt, senão 'Saudavel'), como categórico."""
+    codes = np.where(np.asarray(canopycov) < qt, 0, 1).astype(np.int8)
+    return pd.Categorical.from_codes(codes, categories=STATUS_CATEGORIES)
+
+
+def add_recommendation_bands(grouped, area_col):
+    """Adiciona as colunas SDD, Controle 9M e Controle 3M a partir de Average%.
+
+    Cada coluna recebe a área (``area_col``) quando a média mensal de desfolha
+    está na faixa correspondente, e fica vazia caso contrário.
+    """
+    average = grouped['Average%'].to_numpy(dtype=float)
+    area = grouped[area_col].to_numpy(dtype=float)
+
+    grouped['SDD'] = np.where(average < config.SDD_MAX_PERCENT, area, np.nan)
+    grouped['Controle 9M'] = np.where(
+        (average >= config.SDD_MAX_PERCENT) & (average <= config.CONTROLE_9M_MAX_PERCENT), area, np.nan)
+    grouped['Controle 3M'] = np.where(average > config.CONTROLE_9M_MAX_PERCENT, area, np.nan)
+    return grouped
+
+
+def add_other_defoliation(grouped, area_col):
+    """Adiciona a coluna Outra desfolha a partir de percentage_diff.
+
+    Quando a desfolha aumenta mais que o limiar em relação à data anterior, a
+    área passa para Outra desfolha e deixa de contar como Controle 3M.
+    """
+    diff = grouped['percentage_diff'].to_numpy(dtype=float)
+    area = grouped[area_col].to_numpy(dtype=float)
+
+    other = diff > config.OUTRA_DESFOLHA_DIFF
+    grouped['Outra desfolha'] = np.where(other, area, np.nan)
+    grouped['Controle 3M'] = np.where(other, np.nan, grouped['Controle 3M'].to_numpy(dtype=float))
+    return grouped
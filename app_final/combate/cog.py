@@ -0,0 +1,191 @@
+"""Rasters da cobertura do dossel (Cloud-Optimized GeoTIFF) por fazenda e data.
+
+Cada (empresa, fazenda, data) tem um COG em EPSG:4326 na grade das predições
+(0,0001°), em blocos de 256 px, compressão DEFLATE e overviews internos
+(média). A banda 1 é canopycov e a banda 2 é o código do talhão de cada pixel
+(a lista de talhões fica na tag STANDS), de forma que o recorte de um talhão é
+uma leitura de janela. Layout em disco::
+
+    prediction/cog/MANULIFE/2024-10-01/BOI_PRETO_XI.tif
+
+Os mapas de calor e os GeoPDFs leem janelas desses arquivos em vez de
+rasterizar os pontos a cada vez. Os COGs são gerados sob demanda na primeira
+visualização da fazenda e regenerados quando a partição de origem muda; para
+gerá-los de antemão, executar a partir da pasta app_final:
+
+    python -m combate.cog build [--company MANULIFE] [--dates 2024-10-01]
+
+O rasterio é importado apenas ao gerar ou ler um COG (ver combate/warmup.py).
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from combate import config, profiling, store
+from combate.companies import load_registry
+from combate.loading import file_fingerprint, load_prediction_keys, read_predictions
+from combate.render import bin_to_grid
+
+# Opções de criação do driver COG do GDAL
+COG_OPTIONS = {
+    'compress': 'DEFLATE',
+    'predictor': 'YES',
+    'blocksize': 256,
+    'overview_resampling': 'AVERAGE',
+}
+
+
+def cog_path(company, farm, date, root=config.COG_DIR):
+    return os.path.join(root, company, f"{pd.Timestamp(date):%Y-%m-%d}", f"{farm}.tif")
+
+
+def partition_fingerprint(source, farm, date):
+    """Impressão digital dos pixels de origem da fazenda e data.
+
+    Na base particionada é a da partição (DATE, FARM), de forma que novas
+    datas não invalidam os COGs já gerados; no arquivo único, a do arquivo.
+    """
+    if store.is_dataset(source):
+        partition = os.path.join(source, f"DATE={pd.Timestamp(date):%Y-%m-%d}", f"FARM={farm}")
+        if os.path.isdir(partition):
+            return file_fingerprint(partition)
+    return file_fingerprint(source)
+
+
+def write_cog(pred_farm, path, fingerprint, cell=config.PREDICTION_GRID_DEG):
+    """Rasteriza os pixels de uma fazenda e data (X, Y, canopycov, STAND) em um COG."""
+    import rasterio.shutil
+    from rasterio.io import MemoryFile
+    from rasterio.transform import from_origin
+
+    x, y = pred_farm['X'].to_numpy(np.float64), pred_farm['Y'].to_numpy(np.float64)
+    cols = int(round((x.max() - x.min()) / cell)) + 1
+    rows = int(round((y.max() - y.min()) / cell)) + 1
+    w, n = x.min() - cell / 2, y.max() + cell / 2
+    bounds = (w, n - rows * cell, w + cols * cell, n)
+
+    stand_codes, stands = pd.factorize(pred_farm['STAND'].astype(str))
+    canopy = bin_to_grid(x, y, pred_farm['canopycov'].to_numpy(), bounds, (rows, cols)).astype(np.float32)
+    stand_grid = bin_to_grid(x, y, stand_codes + 1, bounds, (rows, cols)).astype(np.float32)
+
+    profile = dict(driver="GTiff", width=cols, height=rows, count=2, dtype="float32", nodata=np.nan,
+                   crs=config.CRS_LATLON, transform=from_origin(w, n, cell, cell))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as dst:
+            dst.write(canopy, 1)
+            dst.write(stand_grid, 2)
+            dst.set_band_description(1, "canopycov")
+            dst.set_band_description(2, "stand")
+            dst.update_tags(SOURCE_FINGERPRINT=fingerprint, STANDS=json.dumps(list(stands)))
+        with memfile.open() as src:
+            rasterio.shutil.copy(src, tmp_path, driver="COG", **COG_OPTIONS)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _is_current(path, fingerprint):
+    if not os.path.exists(path):
+        return False
+    import rasterio
+
+    with rasterio.open(path) as src:
+        return src.tags().get('SOURCE_FINGERPRINT') == fingerprint
+
+
+def open_cog(source, company, farm, date, root=config.COG_DIR):
+    """Caminho do COG da fazenda e data se ele estiver atualizado, senão None."""
+    path = cog_path(company, farm, date, root)
+    return path if _is_current(path, partition_fingerprint(source, farm, date)) else None
+
+
+@profiling.traced("cog.ensure_cog")
+def ensure_cog(source, company, farm, date, pred_farm=None, root=config.COG_DIR):
+    """Caminho do COG da fazenda e data, gerando-o se ausente ou desatualizado.
+
+    ``pred_farm`` são os pixels da fazenda e data, se já estiverem carregados;
+    caso contrário, são lidos da base.
+    """
+    path = cog_path(company, farm, date, root)
+    fingerprint = partition_fingerprint(source, farm, date)
+    if not _is_current(path, fingerprint):
+        if pred_farm is None:
+            pred_farm = read_predictions(columns=['X', 'Y', 'canopycov'], source=source,
+                                         dates=[date], farms=[farm], companies=[company])
+        write_cog(pred_farm, path, fingerprint)
+    return path
+
+
+def read_window(path, bounds=None, shape=None, stand=None):
+    """Lê a cobertura do dossel de uma janela do COG.
+
+    ``bounds`` é (oeste, sul, leste, norte) em graus (padrão: o raster
+    inteiro), ajustado à grade do raster; fora do raster os valores são NaN.
+    Com ``shape`` (linhas, colunas), a leitura é reamostrada pela média e usa
+    os overviews. Com ``stand``, apenas os pixels do talhão são mantidos (na
+    resolução nativa). Retorna a grade e seus limites.
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.windows import Window
+
+    with rasterio.open(path) as src:
+        if bounds is None:
+            window = Window(0, 0, src.width, src.height)
+        else:
+            window = src.window(*bounds).round_offsets().round_lengths()
+        canopy = src.read(1, window=window, out_shape=shape, boundless=True, fill_value=np.nan,
+                          resampling=Resampling.average)
+
+        if stand is not None:
+            # Os códigos dos talhões só são exatos na resolução nativa (não nos overviews)
+            stands = json.loads(src.tags().get('STANDS', '[]'))
+            code = stands.index(stand) + 1 if stand in stands else 0
+            codes = src.read(2, window=window, boundless=True, fill_value=np.nan)
+            canopy = np.where(codes == code, canopy, np.nan).astype(np.float32)
+        return canopy, src.window_bounds(window)
+
+
+def build_cogs(company, dates=None, root=config.COG_DIR, progress=print):
+    """Gera os COGs de todas as fazendas das datas da empresa (por padrão, todas as datas)."""
+    source = load_registry()[company].prediction
+    keys = load_prediction_keys(source)
+    keys = keys[keys['COMPANY'] == company]
+    if dates is None:
+        dates = sorted(keys['DATE'].unique())
+    for date in dates:
+        start = time.perf_counter()
+        pred = read_predictions(columns=['X', 'Y', 'canopycov'], source=source, dates=[date], companies=[company])
+        farms = 0
+        for farm, pred_farm in pred.groupby('FARM', observed=True):
+            path = cog_path(company, farm, date, root)
+            fingerprint = partition_fingerprint(source, farm, date)
+            if not _is_current(path, fingerprint):
+                write_cog(pred_farm, path, fingerprint)
+                farms += 1
+        progress(f"{company} {pd.Timestamp(date):%Y-%m-%d}: {farms} COGs gerados em {time.perf_counter() - start:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rasters (COG) da cobertura do dossel por fazenda e data")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Gera os COGs ausentes ou desatualizados")
+    build_parser.add_argument("--company", default=None, help="Empresa do cadastro (padrão: todas)")
+    build_parser.add_argument("--dates", default=None, help="Datas separadas por vírgula (padrão: todas)")
+    build_parser.add_argument("--out", default=config.COG_DIR, help="Pasta de saída")
+    args = parser.parse_args(argv)
+
+    companies = [args.company.upper()] if args.company else list(load_registry())
+    dates = [pd.Timestamp(date) for date in args.dates.split(",")] if args.dates else None
+    for company in companies:
+        build_cogs(company, dates, args.out)
+
+
+if __name__ == "__main__":
+    main()
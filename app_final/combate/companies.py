@@ -0,0 +1,182 @@
+"""Cadastro de empresas e carregamento sob demanda dos dados de cada uma.
+
+O cadastro fica em companies.json (ver ``config.COMPANIES_PATH``), com os
+caminhos relativos à pasta app_final::
+
+    {
+        "MANULIFE": {
+            "prediction": "prediction/pred_attack",
+            "stands": "prediction/Talhoes_Manulife_2.shp"
+        },
+        "OUTRA_EMPRESA": {
+            "prediction": "prediction/outra_empresa/pred_attack",
+            "stands": "prediction/outra_empresa/talhoes.shp",
+            "aggregates_dir": "prediction/outra_empresa"
+        }
+    }
+
+O nome de cada empresa deve coincidir com a coluna COMPANY das predições e
+com a coluna Companhia dos talhões (sem diferenciar maiúsculas). Sem o
+arquivo, cada empresa presente na base de predições padrão é cadastrada com as
+bases de config.py. A base de talhões pode ser o shapefile ou o GeoParquet
+convertido por ``python -m combate.stands convert`` (ver combate/stands.py).
+
+Os dados de uma empresa só são carregados quando alguma sessão a seleciona e
+ficam em um cache compartilhado com no máximo ``config.MAX_LOADED_COMPANIES``
+empresas; a empresa usada há mais tempo é descartada primeiro.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+
+import geopandas as gpd
+import pandas as pd
+
+from combate import config, loading
+from combate.monthly import MonthlyCube, monthly_cube
+from combate.stands import AreaIndex, area_index
+
+
+@dataclass(frozen=True)
+class Company:
+    name: str
+    prediction: str
+    stands: str
+    aggregates_dir: str
+
+    def aggregate_paths(self):
+        """Caminhos de grouped_farm, grouped_stand e aggregates.json da empresa."""
+        return tuple(os.path.join(self.aggregates_dir, os.path.basename(path))
+                     for path in (config.GROUPED_FARM_PATH, config.GROUPED_STAND_PATH, config.AGGREGATES_META_PATH))
+
+    def paths(self):
+        return (self.prediction, self.stands) + self.aggregate_paths()
+
+
+@dataclass(frozen=True)
+class CompanyData:
+    """Dados de uma empresa usados pelo painel, já filtrados pela empresa.
+
+    ``keys`` tem as combinações de FARM, STAND e DATE das predições; as bases
+    agrupadas não têm a coluna COMPANY. ``areas`` tem as áreas da empresa, das
+    fazendas e dos talhões (ver combate/stands.py); ``farm_monthly`` e
+    ``stand_monthly``, a desfolha média por mês (ver combate/monthly.py).
+    ``version`` identifica os arquivos carregados; ``stale`` indica
+    que as bases agrupadas são anteriores às predições ou aos talhões atuais.
+    """
+    company: Company
+    keys: pd.DataFrame
+    stands: gpd.GeoDataFrame
+    grouped_farm: pd.DataFrame
+    grouped_stand: pd.DataFrame
+    areas: AreaIndex
+    farm_monthly: MonthlyCube
+    stand_monthly: MonthlyCube
+    version: str
+    stale: bool
+
+
+def _resolve(path):
+    return path if os.path.isabs(path) else os.path.join(config.BASE_DIR, path)
+
+
+def load_registry(path=config.COMPANIES_PATH):
+    """Empresas cadastradas, por nome (em maiúsculas)."""
+    if not os.path.exists(path):
+        source = loading.prediction_source()
+        names = sorted(loading.load_prediction_keys(source)['COMPANY'].unique())
+        return {name: Company(name, source, loading.stands_source(), os.path.dirname(source)) for name in names}
+
+    with open(path) as f:
+        entries = json.load(f)
+    registry = {}
+    for name, entry in entries.items():
+        prediction = _resolve(entry['prediction'])
+        aggregates_dir = _resolve(entry.get('aggregates_dir', os.path.dirname(os.path.abspath(prediction))))
+        registry[name.upper()] = Company(name.upper(), prediction, _resolve(entry['stands']), aggregates_dir)
+    return registry
+
+
+def _only(df, name):
+    return df[df['COMPANY'] == name]
+
+
+def _load(company, version):
+    farm_path, stand_path, meta_path = company.aggregate_paths()
+    grouped_farm, grouped_stand = loading.load_aggregates(company.prediction, company.stands,
+                                                          farm_path, stand_path, meta_path)
+    company_stands = _only(loading.load_stands(company.stands), company.name)
+    grouped_farm = _only(grouped_farm, company.name).drop(columns=['COMPANY'])
+    grouped_stand = _only(grouped_stand, company.name).drop(columns=['COMPANY'])
+    return CompanyData(
+        company=company,
+        keys=_only(loading.load_prediction_keys(company.prediction), company.name).reset_index(drop=True),
+        stands=company_stands,
+        grouped_farm=grouped_farm,
+        grouped_stand=grouped_stand,
+        areas=area_index(company_stands),
+        farm_monthly=monthly_cube(grouped_farm, 'FARM'),
+        stand_monthly=monthly_cube(grouped_stand, 'STAND'),
+        version=version,
+        stale=loading.aggregates_stale(company.prediction, company.stands, meta_path))
+
+
+_loaded = OrderedDict()
+_lock = threading.Lock()
+_company_locks = {}
+
+
+def _evict_over_limit():
+    # Descarta as empresas usadas há mais tempo, junto com as bases que só elas usam
+    evicted = []
+    while len(_loaded) > config.MAX_LOADED_COMPANIES:
+        evicted.append(_loaded.popitem(last=False)[1][1].company)
+    in_use = {path for _, data in _loaded.values() for path in data.company.paths()}
+    return [path for company in evicted for path in company.paths() if path not in in_use]
+
+
+def company_data(name, registry=None):
+    """Dados da empresa, carregados na primeira vez em que ela é selecionada.
+
+    As bases são recarregadas quando os arquivos de predições, de talhões ou
+    as bases agrupadas da empresa mudam.
+    """
+    company = (registry if registry is not None else load_registry())[name]
+    # Bases agrupadas e aggregates.json também entram: um novo build_aggregates recarrega a empresa
+    fingerprint = "".join(loading.file_fingerprint(path) if os.path.exists(path) else "-"
+                          for path in company.paths())
+
+    with _lock:
+        company_lock = _company_locks.setdefault(name, threading.Lock())
+
+    # Um lock por empresa evita que várias sessões carreguem a mesma empresa ao mesmo tempo
+    with company_lock:
+        with _lock:
+            entry = _loaded.get(name)
+            if entry is not None and entry[0] == fingerprint:
+                _loaded.move_to_end(name)
+                data = entry[1]
+            else:
+                data = None
+
+        if data is None:
+            data = _load(company, fingerprint)
+            with _lock:
+                _loaded[name] = (fingerprint, data)
+                _loaded.move_to_end(name)
+                stale_paths = _evict_over_limit()
+            loading.evict(*stale_paths)
+
+    # Cópias rasas: os dados são compartilhados e, com o copy-on-write do pandas 3 (ver requirements.txt),
+    # escritas da sessão geram cópias locais sem alterar o original
+    return replace(data, keys=data.keys.copy(deep=False), stands=data.stands.copy(deep=False),
+                   grouped_farm=data.grouped_farm.copy(deep=False),
+                   grouped_stand=data.grouped_stand.copy(deep=False))
+
+
+def loaded_companies():
+    """Empresas atualmente em memória, da usada há mais tempo para a mais recente."""
+    with _lock:
+        return list(_loaded)
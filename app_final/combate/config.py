@@ -0,0 +1,101 @@
+# Configurações compartilhadas pela aplicação e pelos utilitários de linha de comando
+import os
+
+# Diretório base da aplicação (app_final)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Bases de dados (alterar aqui para mudar a base referenciada)
+PREDICTION_DIR = os.path.join(BASE_DIR, "prediction")
+PRED_ATTACK_PATH = os.path.join(PREDICTION_DIR, "filtered_pred_attack.parquet")
+STANDS_PATH = os.path.join(PREDICTION_DIR, "Talhoes_Manulife_2.shp")
+
+# Base de predições particionada por data e fazenda (gerada por `python -m combate.store convert`).
+# Quando existe, é utilizada no lugar de PRED_ATTACK_PATH.
+PREDICTION_DATASET_DIR = os.path.join(PREDICTION_DIR, "pred_attack")
+
+# Base de talhões em GeoParquet, já reprojetada e com as áreas calculadas (gerada por
+# `python -m combate.stands convert`). Quando existe, é utilizada no lugar de STANDS_PATH.
+STANDS_DATASET_PATH = os.path.join(PREDICTION_DIR, "talhoes.parquet")
+
+# Cadastro de empresas atendidas pelo painel (ver combate/companies.py). Sem o
+# arquivo, as empresas presentes na base de predições acima são utilizadas.
+COMPANIES_PATH = os.environ.get("COMBATE_COMPANIES", os.path.join(BASE_DIR, "companies.json"))
+
+# Número máximo de empresas mantidas em memória ao mesmo tempo
+MAX_LOADED_COMPANIES = int(os.environ.get("COMBATE_MAX_COMPANIES", "4"))
+
+# Recortes por data (painéis, pixels e mapas) mantidos em memória e pré-carregamento
+# das datas vizinhas à selecionada (ver combate/slices.py); COMBATE_PREFETCH=0 desativa
+SLICE_CACHE_SIZE = int(os.environ.get("COMBATE_SLICE_CACHE_SIZE", "64"))
+PREFETCH = os.environ.get("COMBATE_PREFETCH", "1") != "0"
+
+# Sistemas de referência utilizados
+CRS_LATLON = "EPSG:4326"
+CRS_UTM = "EPSG:32722"
+
+# Espaçamento (em graus) da grade regular em que os pixels das predições são gerados
+PREDICTION_GRID_DEG = 1e-4
+
+# Bases agrupadas pré-calculadas (geradas por `python -m combate.build_aggregates`)
+GROUPED_FARM_PATH = os.path.join(PREDICTION_DIR, "grouped_farm.parquet")
+GROUPED_STAND_PATH = os.path.join(PREDICTION_DIR, "grouped_stand.parquet")
+AGGREGATES_META_PATH = os.path.join(PREDICTION_DIR, "aggregates.json")
+
+# Rasters (COG) da cobertura do dossel por fazenda e data (ver combate/cog.py)
+COG_DIR = os.path.join(PREDICTION_DIR, "cog")
+
+# Cache em disco dos arquivos gerados sob demanda (COMBATE_CACHE_DIR substitui a pasta)
+CACHE_DIR = os.environ.get("COMBATE_CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+GEOPDF_CACHE_DIR = os.path.join(CACHE_DIR, "geopdf")
+REPORT_CACHE_DIR = os.path.join(CACHE_DIR, "reports")
+
+# Conjuntos de relatórios por empresa e data gerados sem navegador (`python -m combate.engine`)
+REPORT_SET_DIR = os.path.join(CACHE_DIR, "report_sets")
+
+# Medição do tempo e da memória por etapa (ver combate/profiling.py): log em JSON lines,
+# gravado em todas as execuções com COMBATE_PROFILE=1 (e sempre nas execuções com ?debug=1)
+PROFILE_LOG = os.environ.get("COMBATE_PROFILE_LOG", os.path.join(CACHE_DIR, "profile", "spans.jsonl"))
+PROFILE_ENABLED = os.environ.get("COMBATE_PROFILE") == "1"
+PROFILE_MEMORY = os.environ.get("COMBATE_PROFILE_MEMORY") == "1"
+
+# Importação em segundo plano das bibliotecas dos mapas e GeoPDFs na primeira execução
+# do painel (ver combate/warmup.py); COMBATE_PREWARM=0 desativa
+PREWARM = os.environ.get("COMBATE_PREWARM", "1") != "0"
+
+# Número de GeoPDFs gerados simultaneamente em segundo plano
+GEOPDF_WORKERS = 2
+
+# Exportação em lote dos GeoPDFs de uma data (ver combate/geopdf_batch.py): pasta dos
+# arquivos ZIP e número de processos (COMBATE_GEOPDF_BATCH_WORKERS)
+GEOPDF_BATCH_DIR = os.path.join(CACHE_DIR, "geopdf_batch")
+GEOPDF_BATCH_WORKERS = int(os.environ.get("COMBATE_GEOPDF_BATCH_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Resolução dos mapas de calor renderizados no servidor (ver combate/render.py)
+MAP_DPI = 200
+
+# Pirâmide de tiles da cobertura do dossel (ver combate/canopy_tiles.py), servida pelo
+# Streamlit como arquivos estáticos em /app/static/canopy. COMBATE_CANOPY_TILE_URL
+# substitui o endereço dos tiles (por exemplo, quando servidos por um CDN).
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+CANOPY_TILES_DIR = os.path.join(STATIC_DIR, "canopy")
+CANOPY_TILE_URL = os.environ.get("COMBATE_CANOPY_TILE_URL")
+CANOPY_MIN_ZOOM = 10
+CANOPY_MAX_ZOOM = 18
+
+# Imagens de fundo (ver combate/tiles.py)
+TILE_CACHE_DIR = os.path.join(CACHE_DIR, "tiles")
+TILE_CACHE_MAX_BYTES = int(os.environ.get("COMBATE_TILE_CACHE_MB", "2048")) * 1024 * 1024
+TILE_URL = os.environ.get("COMBATE_TILE_URL")
+TILE_MAX_ZOOM = 18
+TILE_TIMEOUT = 10
+BASEMAP_SOURCE = os.environ.get("COMBATE_BASEMAP_SOURCE")
+TILES_OFFLINE = os.environ.get("COMBATE_TILES_OFFLINE") == "1"
+
+# Limiares de classificação e de recomendação (ver combate/classification.py)
+CANOPY_QUANTILE = 0.10          # quantil da cobertura do dossel que define o limiar QT
+CANOPY_SKETCH_RESOLUTION = 0.01 # resolução (p.p.) dos histogramas de canopycov (ver combate/thresholds.py)
+SDD_MAX_PERCENT = 0.5           # Average% abaixo deste valor: Sem Desfolha Detectada
+CONTROLE_9M_MAX_PERCENT = 5     # Average% até este valor: Controle 9M; acima: Controle 3M
+OUTRA_DESFOLHA_DIFF = 8         # aumento (p.p.) em relação à data anterior: Outra desfolha
+# Limiar QT único ("global"), por data ("date") ou por fazenda ("farm"); ver combate/thresholds.py
+THRESHOLD_MODE = os.environ.get("COMBATE_THRESHOLD_MODE", "global")
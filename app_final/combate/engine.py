@@ -0,0 +1,397 @@
+"""Cálculo do painel sem Streamlit: cartões, recomendações, gráficos, mapas e relatórios.
+
+O painel tem três níveis, cada um calculado por uma função a partir dos dados
+da empresa (``CompanyData``, ver combate/companies.py) e da data:
+
+- ``company_panel``: visão geral das fazendas da empresa;
+- ``farm_panel``: fazenda selecionada;
+- ``stand_panel``: talhão selecionado.
+
+Cada uma retorna um ``Panel`` com os cartões (título → valor), os gráficos
+(plotly, ver combate/charts.py) e a tabela de recomendações. Os mapas de calor
+são gerados à parte (``farm_pixels``, ``farm_cog``, ``farm_map``,
+``stand_map`` e ``interactive_map``), por serem as etapas mais caras. O
+New_Home.py apenas escolhe a empresa, a fazenda, o talhão e a data e exibe o
+resultado, obtido com ``date_panels``, ``farm_slice`` e ``date_maps``, que
+mantêm os recortes de cada data em cache e pré-carregam as datas vizinhas
+(``prefetch_neighbours``, ver combate/slices.py).
+
+``export_date`` gera o conjunto de relatórios de uma empresa e data sem
+navegador (planilhas, resumo em JSON, gráficos em HTML e, opcionalmente, os
+mapas em PNG e os GeoPDFs). Executar a partir da pasta app_final:
+
+    python -m combate.engine 2024-10-01 [--company MANULIFE] [--out pasta] [--maps] [--geopdf]
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from combate import canopy_tiles, charts, cog, config, profiling, render, reports, slices, tiles
+from combate.companies import company_data, load_registry
+from combate.loading import read_predictions
+
+RECOMMENDATIONS = {
+    'SDD': 'Sem Desfolha Detectada',
+    'Controle 9M': 'Baixo Índice de Desfolha por Formigas',
+    'Controle 3M': 'Médio a Alto Índice de Desfolha por Formigas',
+    'Outra desfolha': 'Outra desfolha detectada'
+}
+
+# Recomendações que contam como área afetada
+AFFECTED = ['Controle 9M', 'Controle 3M', 'Outra desfolha']
+
+
+@dataclass(frozen=True)
+class Panel:
+    """Um nível do painel: cartões (título → valor, na ordem de exibição), gráficos e recomendações."""
+    cards: dict
+    charts: dict
+    recommendations: pd.DataFrame = field(default=None)
+
+
+def _affected_ha(grouped_stand_date):
+    return sum(grouped_stand_date[column].sum() for column in AFFECTED)
+
+
+def _date_rows(grouped, date):
+    return grouped[grouped['DATE'] == date]
+
+
+def _key(data, name, *parts):
+    # Chave no cache de recortes (ver combate/slices.py): empresa, versão das bases e recorte
+    return (data.company.name, data.version, name) + parts
+
+
+def date_rows(data, date):
+    """Linhas de grouped_farm e grouped_stand na data, em cache compartilhado entre as sessões."""
+    date = pd.Timestamp(date)
+    return slices.get(_key(data, 'date_rows', date),
+                      lambda: (_date_rows(data.grouped_farm, date), _date_rows(data.grouped_stand, date)))
+
+
+def recommendation_table(grouped_stand_date):
+    """Área (ha) de cada recomendação nas linhas por talhão, com a descrição de cada uma."""
+    return pd.DataFrame({
+        'Recomendação': list(RECOMMENDATIONS),
+        'Área': [grouped_stand_date[column].sum() for column in RECOMMENDATIONS],
+        'O que?': list(RECOMMENDATIONS.values())
+    })
+
+
+def _top_stands(grouped_stand_date):
+    # Talhões com maior percentual de desfolha
+    ranked = grouped_stand_date.assign(desfolha_percentage=(
+        grouped_stand_date['stand_desfolha_area_ha'] / grouped_stand_date['stand_total_area_ha']) * 100)
+    return ranked.sort_values(by='desfolha_percentage', ascending=False).head(10)
+
+
+@profiling.traced("engine.company_panel")
+def company_panel(data, date):
+    """Visão geral das fazendas da empresa na data."""
+    date = pd.Timestamp(date)
+    grouped_farm_date, grouped_stand_date = date_rows(data, date)
+    total_area_ha = data.areas.total_ha
+    total_area_desfolha = grouped_farm_date['farm_desfolha_area_ha'].sum()
+
+    top_farms = grouped_farm_date.assign(percentage=(
+        grouped_farm_date['farm_desfolha_area_ha'] / grouped_farm_date['farm_total_area_ha']) * 100)
+    top_farms = top_farms.sort_values(by='percentage', ascending=False).head(10)
+
+    return Panel(
+        cards={
+            'Área total monitorada (ha)': round(total_area_ha, 1),
+            'Área total em desfolha (ha)': round(total_area_desfolha, 1),
+            'Área total afetada (ha)': _affected_ha(grouped_stand_date),
+            'Número total de fazendas': len(data.areas.farm_ha),
+            'Número total de talhões': data.areas.stand_count(),
+        },
+        charts={
+            'area_monitorada': charts.monitored_area_pie(total_area_ha - total_area_desfolha, total_area_desfolha),
+            'top_fazendas': charts.top_farms_bar(top_farms),
+            'top_talhoes': charts.top_stands_bar(_top_stands(grouped_stand_date),
+                                                 'Top 10 Talhões com Maior Percentual de Desfolha'),
+        },
+        recommendations=recommendation_table(grouped_stand_date),
+    )
+
+
+@profiling.traced("engine.farm_panel")
+def farm_panel(data, farm, date):
+    """Fazenda selecionada na data, com a evolução mensal até a data."""
+    date = pd.Timestamp(date)
+    grouped_farm_date, grouped_stand_date = date_rows(data, date)
+    farm_stands = grouped_stand_date[grouped_stand_date['FARM'] == farm]
+
+    farm_area_ha = round(data.areas.farm(farm), 1)
+    farm_area_desfolha = round(grouped_farm_date[grouped_farm_date['FARM'] == farm]['farm_desfolha_area_ha'].sum(), 1)
+
+    # Talhões da fazenda, dos maiores em área de desfolha para os menores, na data
+    stands_by_area = data.grouped_stand[data.grouped_stand['FARM'] == farm]
+    stands_by_area = stands_by_area.sort_values(by='stand_desfolha_area_ha', ascending=False)
+
+    return Panel(
+        cards={
+            'Área total na fazenda selecionada (ha)': farm_area_ha,
+            'Área em desfolha na fazenda (ha)': farm_area_desfolha,
+            'Área total afetada (ha)': round(_affected_ha(farm_stands), 1),
+            'Número de talhões na fazenda': data.areas.stand_count(farm),
+        },
+        charts={
+            'area_fazenda': charts.farm_area_pie(farm_area_desfolha, farm_area_ha - farm_area_desfolha),
+            'top_talhoes_fazenda': charts.top_stands_bar(
+                _top_stands(_date_rows(stands_by_area, date)),
+                'Top 10 Talhões com Maior Percentual de Desfolha na fazenda {}'.format(farm)),
+            'temporal_fazenda': charts.monthly_line(data.farm_monthly.series(farm, date),
+                                                    "Média desfolha (%) por mês na fazenda", decimals=1),
+        },
+        recommendations=recommendation_table(farm_stands),
+    )
+
+
+@profiling.traced("engine.stand_panel")
+def stand_panel(data, stand, date):
+    """Talhão selecionado na data, com a evolução mensal até a data."""
+    date = pd.Timestamp(date)
+    _, grouped_stand_date = date_rows(data, date)
+
+    stand_area_ha = round(data.areas.stand(stand), 1)
+    stand_area_desfolha = round(
+        grouped_stand_date[grouped_stand_date['STAND'] == stand]['stand_desfolha_area_ha'].sum(), 1)
+
+    return Panel(
+        cards={
+            'Área total no talhão selecionado (ha)': stand_area_ha,
+            'Área em desfolha no talhão (ha)': stand_area_desfolha,
+        },
+        charts={
+            'area_talhao': charts.stand_area_pie(stand, stand_area_desfolha, stand_area_ha - stand_area_desfolha),
+            'temporal_talhao': charts.monthly_line(data.stand_monthly.series(stand, date),
+                                                   "Média desfolha (%) por mês no talhão", decimals=2),
+        },
+    )
+
+
+# Mapas
+
+def farm_pixels(data, farm, date):
+    """Pixels (X, Y, canopycov, STAND) da fazenda na data; com a base particionada, só a partição é lida."""
+    return read_predictions(columns=['X', 'Y', 'canopycov'], source=data.company.prediction,
+                            dates=[pd.Timestamp(date)], farms=[farm], companies=[data.company.name])
+
+
+def farm_cog(data, farm, date, pixels):
+    """COG da fazenda na data (ver combate/cog.py), gerado na primeira vez; None sem pixels."""
+    if not len(pixels):
+        return None
+    return cog.ensure_cog(data.company.prediction, data.company.name, farm, pd.Timestamp(date), pixels)
+
+
+def farm_map(data, farm, stand, pixels, cog_path=None):
+    """PNG do mapa de calor da fazenda, com o talhão selecionado destacado.
+
+    Sem ``stand``, são desenhados os contornos de todos os talhões da fazenda.
+    """
+    if stand is None:
+        outlines = [(data.stands[data.stands['FARM'] == farm], 'black', 0.5)]
+    else:
+        stand_shape = data.stands[data.stands['STAND'] == stand]
+        outlines = [(stand_shape, 'black', 0.5), (stand_shape, 'red', 0.8)]
+    if cog_path is not None:
+        return render.render_grid(*cog.read_window(cog_path), outlines=outlines,
+                                  figsize=(6, 3), source=tiles.basemap_provider())
+    return render.render_heatmap(pixels['X'], pixels['Y'], pixels['canopycov'],
+                                 outlines=outlines, figsize=(6, 3), source=tiles.basemap_provider())
+
+
+def stand_map(data, stand, pixels, cog_path=None):
+    """PNG do mapa de calor do talhão (recorte do talhão no raster da fazenda)."""
+    outlines = [(data.stands[data.stands['STAND'] == stand], 'black', 0.5)]
+    if cog_path is not None:
+        return render.render_grid(*cog.read_window(cog_path, stand=stand), outlines=outlines,
+                                  figsize=(6, 3), source=tiles.basemap_provider())
+    pixels = pixels[pixels['STAND'] == stand]
+    return render.render_heatmap(pixels['X'], pixels['Y'], pixels['canopycov'],
+                                 outlines=outlines, figsize=(6, 3), source=tiles.basemap_provider())
+
+
+def interactive_map(data, farm, stand, date, tile_base):
+    """Mapa interativo da fazenda com a pirâmide de tiles da cobertura do dossel, ou None sem a pirâmide.
+
+    ``tile_base`` é o endereço base dos tiles (ver combate/canopy_tiles.py) ou uma
+    função que o retorna, chamada apenas quando a pirâmide da data existe.
+    """
+    metadata = canopy_tiles.pyramid_metadata(data.company.name, date)
+    if metadata is None:
+        return None
+    base = tile_base() if callable(tile_base) else tile_base
+    return charts.canopy_map(canopy_tiles.tile_url(base, data.company.name, date), metadata,
+                             data.stands[data.stands['FARM'] == farm], data.stands[data.stands['STAND'] == stand])
+
+
+# Recortes de uma data no painel, em cache compartilhado (ver combate/slices.py)
+
+def _panel_tasks(data, farm, stand, date):
+    return [(_key(data, 'company_panel', date), lambda: company_panel(data, date)),
+            (_key(data, 'farm_panel', farm, date), lambda: farm_panel(data, farm, date)),
+            (_key(data, 'stand_panel', stand, date), lambda: stand_panel(data, stand, date))]
+
+
+def _maps_task(data, farm, stand, date):
+    def build():
+        pixels, cog_path = farm_slice(data, farm, date)
+        return farm_map(data, farm, stand, pixels, cog_path), stand_map(data, stand, pixels, cog_path)
+    return _key(data, 'maps', farm, stand, date), build
+
+
+def date_panels(data, farm, stand, date):
+    """Painéis da empresa, da fazenda e do talhão na data (``company_panel``, ``farm_panel`` e ``stand_panel``)."""
+    return tuple(slices.get(key, build) for key, build in _panel_tasks(data, farm, stand, pd.Timestamp(date)))
+
+
+def farm_slice(data, farm, date):
+    """Pixels da fazenda na data (``farm_pixels``) e o COG correspondente (``farm_cog``)."""
+    date = pd.Timestamp(date)
+
+    def build():
+        pixels = farm_pixels(data, farm, date)
+        return pixels, farm_cog(data, farm, date, pixels)
+    return slices.get(_key(data, 'farm_slice', farm, date), build)
+
+
+def date_maps(data, farm, stand, date):
+    """PNGs dos mapas de calor da fazenda e do talhão na data (``farm_map`` e ``stand_map``)."""
+    return slices.get(*_maps_task(data, farm, stand, pd.Timestamp(date)))
+
+
+def prefetch_neighbours(data, farm, stand, date, dates):
+    """Calcula em segundo plano os painéis e mapas das datas anterior e seguinte a ``date`` em ``dates``."""
+    dates = sorted(pd.Timestamp(value) for value in dates)
+    position = dates.index(pd.Timestamp(date))
+    tasks = []
+    for neighbour in dates[max(position - 1, 0):position] + dates[position + 1:position + 2]:
+        tasks += _panel_tasks(data, farm, stand, neighbour) + [_maps_task(data, farm, stand, neighbour)]
+    slices.prefetch(tasks)
+
+
+# Relatórios de uma data, sem navegador
+
+def _safe(name):
+    return re.sub(r'[^0-9A-Za-z_-]', '_', str(name))
+
+
+def _write_charts(path, panels):
+    # Um arquivo HTML com os gráficos dos painéis; o plotly.js é carregado de um CDN
+    parts = []
+    for title, panel in panels:
+        parts.append(f"<h2>{title}</h2>")
+        parts += [fig.to_html(full_html=False, include_plotlyjs='cdn' if len(parts) == 1 else False)
+                  for fig in panel.charts.values()]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<html><head><meta charset='utf-8'></head><body>" + "".join(parts) + "</body></html>")
+
+
+def _summary(panel):
+    summary = {'cards': panel.cards}
+    if panel.recommendations is not None:
+        summary['recommendations'] = panel.recommendations.to_dict(orient='records')
+    return summary
+
+
+def report_set_dir(company, date, root=config.REPORT_SET_DIR):
+    """Pasta do conjunto de relatórios da empresa e data."""
+    return os.path.join(root, company, f"{pd.Timestamp(date):%Y-%m-%d}")
+
+
+def export_date(company, date, out=None, formats=tuple(reports.FORMATS), maps=False, geopdf=False,
+                registry=None, progress=print):
+    """Gera os relatórios da empresa na data em ``out`` e retorna o resumo gravado em resumo.json.
+
+    Layout::
+
+        recomendacao.xlsx, recomendacao.csv.zip, ...   planilhas (combate/reports.py)
+        resumo.json                                     cartões e recomendações de todos os níveis
+        graficos.html                                   gráficos da visão geral
+        fazendas/FARM/graficos.html                     gráficos da fazenda e de cada talhão
+        fazendas/FARM/mapa.png, talhoes/STAND.png       mapas de calor (com ``maps``)
+        geopdf.zip                                      GeoPDFs (com ``geopdf``, ver combate/geopdf_batch.py)
+    """
+    start = time.perf_counter()
+    date = pd.Timestamp(date)
+    data = company_data(company, registry)
+    keys = data.keys[data.keys['DATE'] == date]
+    if keys.empty:
+        raise ValueError(f"Sem predições de {company} em {date:%Y-%m-%d}")
+    out = out or report_set_dir(company, date)
+    os.makedirs(out, exist_ok=True)
+
+    source = reports.company_fingerprint(data.company)
+    for fmt in formats:
+        path = reports.export_report(data.grouped_farm, data.grouped_stand, company, date, fmt, source)
+        shutil.copyfile(path, os.path.join(out, f"recomendacao.{reports.FORMATS[fmt][1]}"))
+
+    overview = company_panel(data, date)
+    _write_charts(os.path.join(out, "graficos.html"), [("Visão geral das fazendas", overview)])
+    summary = {'company': company, 'date': f"{date:%Y-%m-%d}", 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'overview': _summary(overview), 'farms': {}}
+
+    farms = keys.groupby('FARM', observed=True)['STAND'].unique()
+    for done, (farm, stands) in enumerate(farms.items(), 1):
+        farm_dir = os.path.join(out, "fazendas", _safe(farm))
+        panel = farm_panel(data, farm, date)
+        stand_panels = {stand: stand_panel(data, stand, date) for stand in sorted(stands)}
+        _write_charts(os.path.join(farm_dir, "graficos.html"),
+                      [(f"Fazenda {farm}", panel)] + [(f"Talhão {stand}", p) for stand, p in stand_panels.items()])
+        summary['farms'][farm] = dict(_summary(panel),
+                                      stands={stand: _summary(p) for stand, p in stand_panels.items()})
+
+        if maps:
+            pixels = farm_pixels(data, farm, date)
+            cog_path = farm_cog(data, farm, date, pixels)
+            os.makedirs(os.path.join(farm_dir, "talhoes"), exist_ok=True)
+            with open(os.path.join(farm_dir, "mapa.png"), "wb") as f:
+                f.write(farm_map(data, farm, None, pixels, cog_path))
+            for stand in stand_panels:
+                with open(os.path.join(farm_dir, "talhoes", f"{_safe(stand)}.png"), "wb") as f:
+                    f.write(stand_map(data, stand, pixels, cog_path))
+        progress(f"[{done}/{len(farms)}] {farm}: {len(stand_panels)} talhões")
+
+    if geopdf:
+        from combate import geopdf_batch
+
+        geopdf_batch.export_date(company, date, os.path.join(out, "geopdf.zip"), progress=progress)
+
+    summary['seconds'] = round(time.perf_counter() - start, 2)
+    with open(os.path.join(out, "resumo.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False, default=str)
+    progress(f"Relatórios de {company} em {date:%Y-%m-%d} gravados em {out} ({summary['seconds']:.1f}s)")
+    return dict(summary, path=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Relatórios do painel de uma data, sem navegador")
+    parser.add_argument("date", help="Data da aquisição, ex.: 2024-10-01")
+    parser.add_argument("--company", default=None, help="Empresa do cadastro (padrão: todas)")
+    parser.add_argument("--out", default=None, help="Pasta de saída (apenas com --company)")
+    parser.add_argument("--formats", default=",".join(reports.FORMATS),
+                        help="Formatos das planilhas, separados por vírgula (xlsx, csv, parquet)")
+    parser.add_argument("--maps", action="store_true", help="Grava os mapas de calor em PNG")
+    parser.add_argument("--geopdf", action="store_true", help="Gera os GeoPDFs da data (geopdf.zip)")
+    args = parser.parse_args(argv)
+
+    registry = load_registry()
+    companies = [args.company.upper()] if args.company else list(registry)
+    formats = [fmt for fmt in args.formats.split(",") if fmt]
+    for company in companies:
+        export_date(company, args.date, args.out if args.company else None, formats, args.maps, args.geopdf,
+                    registry)
+
+
+if __name__ == "__main__":
+    main()
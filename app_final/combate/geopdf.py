@@ -0,0 +1,431 @@
+# Geração de GeoPDFs (mapa de cobertura do dossel sobre imagem de satélite)
+#
+# Os GeoPDFs são gerados sob demanda em uma thread de trabalho e guardados em
+# cache no disco, com chave (fazenda/talhão, data, resolução, provedor) e
+# impressão digital da base de predições. O mesmo arquivo é reaproveitado por
+# todas as sessões até que a base de origem mude.
+#
+# rasterio, matplotlib e GDAL são importados apenas ao gerar um GeoPDF (ver
+# combate/warmup.py), de forma que o cache pode ser consultado sem carregá-los.
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from combate import cog, config, profiling, tiles
+
+
+def create_geopdf(df, selected_farm, selected_date, 
+                           x_res=0.000100001, y_res=0.000100001,
+                           basemap_provider=None,
+                           out_pdf=None, cog_path=None):
+    """
+    Creates a georeferenced GeoPDF that composites a satellite basemap with
+    your canopy cover overlay (derived from point data without interpolation).
+    This version accepts a DataFrame directly.
+    
+    Parameters:
+      df : DataFrame
+          The DataFrame containing point data (with columns: X, Y, canopycov, etc.)
+          Assumed to be in EPSG:4326 (lon/lat).
+      selected_farm : str
+          Farm identifier to filter the data.
+      selected_date : str
+          Date string (e.g., "2024-01-05") to filter the data.
+      x_res, y_res : float, optional
+          Resolution in degrees (default ~0.0001°; about 5-10 m per pixel).
+      basemap_provider : xyzservices.TileProvider, optional
+          The basemap tile provider (default: tiles.basemap_provider(),
+          resolved when the PDF is built).
+      out_pdf : str or None, optional
+          Output PDF filename; if None, a default name is used.
+      cog_path : str or None, optional
+          Canopy COG of the farm and date (see combate/cog.py). When given,
+          the canopy layer is read from it instead of rasterising the points.
+    
+    Returns:
+      BytesIO
+          A BytesIO object containing the GeoPDF.
+    """
+    import matplotlib.pyplot as plt
+    import rasterio
+    from rasterio.transform import from_origin
+    from rasterio.features import rasterize
+    from osgeo import gdal
+
+    # Filter the DataFrame
+    df_filtered = df[(df["FARM"] == selected_farm) & (df["DATE"] == selected_date)]
+    if df_filtered.empty:
+        raise ValueError(f"No data found for farm '{selected_farm}' on date '{selected_date}'")
+    
+    if cog_path is not None:
+        # Raster da fazenda já gerado (ver combate/cog.py): lê a janela em vez de rasterizar os pontos
+        canopy_raster, (minx, miny, maxx, maxy) = cog.read_window(cog_path)
+        height, width = canopy_raster.shape
+        transform = from_origin(minx, maxy, (maxx - minx) / width, (maxy - miny) / height)
+    else:
+        # Rename columns for clarity (assuming the columns are named as in your example)
+        df_filtered = df_filtered.rename(columns={"X": "lon", "Y": "lat", "canopycov": "value"})
+    
+        # Create a GeoDataFrame (EPSG:4326)
+        gdf = gpd.GeoDataFrame(df_filtered, 
+                               geometry=gpd.points_from_xy(df_filtered.lon, df_filtered.lat),
+                               crs="EPSG:4326")
+    
+        # Determine bounds from the GeoDataFrame (no extra buffer)
+        minx, miny, maxx, maxy = gdf.total_bounds
+    
+        # Define affine transform using from_origin (west, north, x_res, y_res)
+        transform = from_origin(minx, maxy, x_res, y_res)
+    
+        # Compute raster dimensions
+        width = int((maxx - minx) / x_res)
+        height = int((maxy - miny) / y_res)
+    
+        # Prepare shapes for rasterization: each point gets its "value"
+        shapes = ((geom, val) for geom, val in zip(gdf.geometry, gdf["value"]))
+    
+        # Rasterize the point data; cells with no data remain NaN
+        canopy_raster = rasterize(
+            shapes=shapes,
+            out_shape=(height, width),
+            transform=transform,
+            fill=np.nan,
+            dtype='float32'
+        )
+    
+    # Normalize valid values (only over cells that are not NaN)
+    min_val = np.nanmin(canopy_raster)
+    max_val = np.nanmax(canopy_raster)
+    norm = (canopy_raster - min_val) / (max_val - min_val)
+    
+    # Apply the RdYlGn colormap (returns RGBA)
+    colormap = plt.get_cmap("RdYlGn")
+    colors = colormap(norm)  # shape: (height, width, 4)
+    
+    # Set alpha: where canopy_raster is NaN, alpha becomes 0 (transparent); else 1 (opaque)
+    mask = np.isnan(canopy_raster)
+    colors[..., 3][mask] = 0
+    colors[..., 3][~mask] = 1
+    
+    # Convert RGBA (0-1) to 8-bit (0-255)
+    colors_8bit = (colors * 255).astype(np.uint8)
+    
+    # Use a temporary directory to store intermediate files
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Save canopy layer as a 4-band (RGBA) GeoTIFF in EPSG:4326
+        canopy_tif = os.path.join(tmpdir, f"canopy_cover_{selected_farm}_{pd.Timestamp(selected_date):%Y-%m-%d}.tif")
+        with rasterio.open(
+            canopy_tif, "w",
+            driver="GTiff",
+            height=height,
+            width=width,
+            count=4,
+            dtype="uint8",
+            crs="EPSG:4326",
+            transform=transform
+        ) as dst:
+            dst.write(colors_8bit[:, :, 0], 1)
+            dst.write(colors_8bit[:, :, 1], 2)
+            dst.write(colors_8bit[:, :, 2], 3)
+            dst.write(colors_8bit[:, :, 3], 4)
+        
+        # Step 2: Get a basemap for the same extent from the local tile cache (or the network).
+        basemap_tif = os.path.join(tmpdir, "basemap.tif")
+        img, ext = tiles.bounds2raster(minx, miny, maxx, maxy, basemap_tif, ll=True, source=basemap_provider)
+        
+        # Step 3: Composite the canopy over the basemap using GDAL Warp (forcing EPSG:4326)
+        composite_tif = os.path.join(tmpdir, f"composite_{selected_farm}_{pd.Timestamp(selected_date):%Y-%m-%d}.tif")
+        gdal.Warp(
+            composite_tif,
+            [basemap_tif, canopy_tif],
+            options=gdal.WarpOptions(format="GTiff", dstNodata=0, dstSRS="EPSG:4326")
+        )
+        
+        # Step 4: Convert the composite to a GeoPDF using GDAL Translate.
+        if out_pdf is None:
+            out_pdf = os.path.join(tmpdir, f"composite_{selected_farm}_{pd.Timestamp(selected_date):%Y-%m-%d}.pdf")
+        else:
+            out_pdf = os.path.join(tmpdir, out_pdf)
+        gdal.Translate(
+            out_pdf,
+            composite_tif,
+            format="PDF",
+            outputType=gdal.GDT_Byte,
+            creationOptions=["TILED=YES", "COLORSPACE=RGB"]
+        )
+        
+        # Read the final PDF into a BytesIO object
+        with open(out_pdf, "rb") as f:
+            pdf_bytes = f.read()
+    
+    # Temporary files are cleaned up automatically here.
+    return io.BytesIO(pdf_bytes)
+
+
+def create_geopdf_by_stand(df, selected_stand, selected_date, 
+                           x_res=0.000100001, y_res=0.000100001,
+                           basemap_provider=None,
+                           out_pdf=None, cog_path=None):
+    """
+    Creates a georeferenced GeoPDF that composites a satellite basemap with
+    your canopy cover overlay (derived from point data without interpolation),
+    filtering by STAND. The function computes a SQUARE bounding box
+    based on the stand's geometry.
+    
+    Parameters:
+      df : DataFrame
+          The DataFrame containing point data with columns including "X", "Y", 
+          "canopycov", and "STAND". Coordinates are assumed to be in EPSG:4326.
+      selected_stand : str
+          The value in the "STAND" column used for filtering.
+      selected_date : str
+          Date string (e.g., "2024-01-05") to filter the data.
+      x_res, y_res : float, optional
+          Resolution in degrees (default ~0.0001°; about 5-10 m per pixel).
+      basemap_provider : xyzservices.TileProvider, optional
+          The basemap tile provider (default: tiles.basemap_provider(),
+          resolved when the PDF is built).
+      out_pdf : str or None, optional
+          Output PDF filename; if None, a default name is used.
+      cog_path : str or None, optional
+          Canopy COG of the farm and date (see combate/cog.py). When given,
+          the canopy layer is read from it instead of rasterising the points.
+    
+    Returns:
+      BytesIO
+          A BytesIO object containing the GeoPDF.
+    """
+    import matplotlib.pyplot as plt
+    import rasterio
+    from rasterio.transform import from_origin
+    from rasterio.features import rasterize
+    from osgeo import gdal
+
+    # Filter the DataFrame by STAND and DATE
+    df_filtered = df[(df["STAND"] == selected_stand) & (df["DATE"] == selected_date)]
+    if df_filtered.empty:
+        raise ValueError(f"No data found for stand '{selected_stand}' on date '{selected_date}'")
+    
+    # Rename columns for clarity
+    df_filtered = df_filtered.rename(columns={"X": "lon", "Y": "lat", "canopycov": "value"})
+    
+    # Create a GeoDataFrame from the point data (EPSG:4326)
+    gdf = gpd.GeoDataFrame(df_filtered, 
+                           geometry=gpd.points_from_xy(df_filtered.lon, df_filtered.lat),
+                           crs="EPSG:4326")
+    
+    # Compute the original bounds of the stand
+    orig_bounds = gdf.total_bounds  # (minx, miny, maxx, maxy)
+    minx, miny, maxx, maxy = orig_bounds
+    center_x = (minx + maxx) / 2.0
+    center_y = (miny + maxy) / 2.0
+    half_side = max((maxx - minx), (maxy - miny)) / 2.0
+    
+    # Create a square bounding box based on the center and half_side
+    square_minx = center_x - half_side
+    square_maxx = center_x + half_side
+    square_miny = center_y - half_side
+    square_maxy = center_y + half_side
+    
+    # Define the affine transform using from_origin (west, north, x_res, y_res)
+    transform = from_origin(square_minx, square_maxy, x_res, y_res)
+    
+    # Compute raster dimensions based on the square bounds
+    width = int((square_maxx - square_minx) / x_res)
+    height = int((square_maxy - square_miny) / y_res)
+    
+    if cog_path is not None:
+        # Recorte do talhão no raster da fazenda (ver combate/cog.py), em vez de rasterizar os pontos
+        canopy_raster, (square_minx, square_miny, square_maxx, square_maxy) = cog.read_window(
+            cog_path, bounds=(square_minx, square_miny, square_maxx, square_maxy), stand=selected_stand)
+        height, width = canopy_raster.shape
+        transform = from_origin(square_minx, square_maxy,
+                                (square_maxx - square_minx) / width, (square_maxy - square_miny) / height)
+    else:
+        # Prepare shapes for rasterization: each point gets its "value"
+        shapes = ((geom, val) for geom, val in zip(gdf.geometry, gdf["value"]))
+    
+        # Rasterize the point data; cells with no data remain NaN
+        canopy_raster = rasterize(
+            shapes=shapes,
+            out_shape=(height, width),
+            transform=transform,
+            fill=np.nan,
+            dtype='float32'
+        )
+    
+    # Normalize valid values (only over non-NaN cells)
+    min_val = np.nanmin(canopy_raster)
+    max_val = np.nanmax(canopy_raster)
+    norm = (canopy_raster - min_val) / (max_val - min_val)
+    
+    # Apply the RdYlGn colormap (returns RGBA)
+    colormap = plt.get_cmap("RdYlGn")
+    colors = colormap(norm)  # shape: (height, width, 4)
+    
+    # Set alpha: where canopy_raster is NaN, alpha becomes 0 (transparent), else opaque (1)
+    mask = np.isnan(canopy_raster)
+    colors[..., 3][mask] = 0
+    colors[..., 3][~mask] = 1
+    
+    # Convert RGBA (0-1) to 8-bit (0-255)
+    colors_8bit = (colors * 255).astype(np.uint8)
+    
+    # Use a temporary directory for intermediate files
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Save canopy layer as a 4-band (RGBA) GeoTIFF in EPSG:4326
+        canopy_tif = os.path.join(tmpdir, f"canopy_cover_{selected_stand}_{pd.Timestamp(selected_date):%Y-%m-%d}.tif")
+        with rasterio.open(
+            canopy_tif, "w",
+            driver="GTiff",
+            height=height,
+            width=width,
+            count=4,
+            dtype="uint8",
+            crs="EPSG:4326",
+            transform=transform
+        ) as dst:
+            dst.write(colors_8bit[:, :, 0], 1)  # Red
+            dst.write(colors_8bit[:, :, 1], 2)  # Green
+            dst.write(colors_8bit[:, :, 2], 3)  # Blue
+            dst.write(colors_8bit[:, :, 3], 4)  # Alpha
+        
+        # Step 2: Get a basemap for the same square extent from the local tile cache (or the network).
+        basemap_tif = os.path.join(tmpdir, "basemap.tif")
+        img, ext = tiles.bounds2raster(square_minx, square_miny, square_maxx, square_maxy,
+                                        basemap_tif, ll=True, source=basemap_provider)
+        
+        # Step 3: Composite the canopy over the basemap using GDAL Warp (force EPSG:4326)
+        composite_tif = os.path.join(tmpdir, f"composite_{selected_stand}_{pd.Timestamp(selected_date):%Y-%m-%d}.tif")
+        gdal.Warp(
+            composite_tif,
+            [basemap_tif, canopy_tif],
+            options=gdal.WarpOptions(format="GTiff", dstNodata=0, dstSRS="EPSG:4326")
+        )
+        
+        # Step 4: Convert the composite GeoTIFF to a GeoPDF using GDAL Translate.
+        if out_pdf is None:
+            out_pdf = os.path.join(tmpdir, f"composite_{selected_stand}_{pd.Timestamp(selected_date):%Y-%m-%d}.pdf")
+        else:
+            out_pdf = os.path.join(tmpdir, out_pdf)
+        gdal.Translate(
+            out_pdf,
+            composite_tif,
+            format="PDF",
+            outputType=gdal.GDT_Byte,
+            creationOptions=["TILED=YES", "COLORSPACE=RGB"]
+        )
+        
+        # Read the final PDF into a BytesIO object
+        with open(out_pdf, "rb") as f:
+            pdf_bytes = f.read()
+    
+    return io.BytesIO(pdf_bytes)
+
+
+# Função de geração para cada tipo de GeoPDF
+GEOPDF_BUILDERS = {
+    'farm': create_geopdf,
+    'stand': create_geopdf_by_stand,
+}
+
+_executor = ThreadPoolExecutor(max_workers=config.GEOPDF_WORKERS, thread_name_prefix="geopdf")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _provider_name(provider):
+    return getattr(provider, 'name', None) or str(provider)
+
+
+def geopdf_cache_path(kind, key, selected_date, source_fingerprint,
+                      x_res=0.000100001, y_res=0.000100001,
+                      basemap_provider=None):
+    """Caminho do GeoPDF no cache para os parâmetros informados.
+
+    ``source_fingerprint`` identifica os pixels de origem; no painel e nos
+    lotes, é o da partição da fazenda e data (ver ``cog.partition_fingerprint``).
+    """
+    date_label = f"{pd.Timestamp(selected_date):%Y-%m-%d}"
+    params = f"{kind}|{key}|{date_label}|{x_res}|{y_res}|{_provider_name(basemap_provider or tiles.basemap_provider())}"
+    digest = hashlib.sha1(params.encode()).hexdigest()[:12]
+    safe_key = re.sub(r'[^0-9A-Za-z_-]', '_', str(key))
+    file_name = f"{kind}_{safe_key}_{date_label}_{digest}_{source_fingerprint[:12]}.pdf"
+    return os.path.join(config.GEOPDF_CACHE_DIR, file_name)
+
+
+def cached_geopdf(kind, key, selected_date, source_fingerprint, **options):
+    """Retorna o caminho do GeoPDF já gerado, ou None se ainda não existir."""
+    path = geopdf_cache_path(kind, key, selected_date, source_fingerprint, **options)
+    return path if os.path.exists(path) else None
+
+
+def geopdf_job(kind, key, selected_date, source_fingerprint, **options):
+    """Retorna a tarefa em andamento (ou que falhou) para o GeoPDF, se houver."""
+    path = geopdf_cache_path(kind, key, selected_date, source_fingerprint, **options)
+    with _jobs_lock:
+        return _jobs.get(path)
+
+
+def _build_to_cache(df, kind, key, selected_date, path, cog_path, options):
+    with profiling.span(f"geopdf.{kind}"):
+        pdf_buffer = GEOPDF_BUILDERS[kind](df, key, selected_date, cog_path=cog_path, **options)
+
+    # Remove versões do mesmo GeoPDF geradas a partir de uma base anterior
+    prefix = os.path.basename(path).rsplit("_", 1)[0] + "_"
+    for name in os.listdir(config.GEOPDF_CACHE_DIR):
+        if name.startswith(prefix) and name.endswith(".pdf") and name != os.path.basename(path):
+            os.remove(os.path.join(config.GEOPDF_CACHE_DIR, name))
+
+    # Grava em um arquivo temporário e substitui, para nunca servir um PDF incompleto
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pdf_buffer.getvalue())
+    os.replace(tmp_path, path)
+    return path
+
+
+def build_geopdf(df, kind, key, selected_date, source_fingerprint, cog_path=None, **options):
+    """Gera o GeoPDF no cache (na thread atual) se ainda não existir e retorna o caminho."""
+    path = geopdf_cache_path(kind, key, selected_date, source_fingerprint, **options)
+    if os.path.exists(path):
+        return path
+    os.makedirs(config.GEOPDF_CACHE_DIR, exist_ok=True)
+    return _build_to_cache(df, kind, key, selected_date, path, cog_path, options)
+
+
+def request_geopdf(df, kind, key, selected_date, source_fingerprint, cog_path=None, **options):
+    """Agenda a geração do GeoPDF em segundo plano e retorna a tarefa (Future).
+
+    Com ``cog_path`` (raster da fazenda e data), a camada de cobertura do
+    dossel é lida do COG em vez de rasterizada a partir de ``df``.
+
+    Pedidos repetidos para o mesmo GeoPDF, vindos de qualquer sessão,
+    compartilham a mesma tarefa. Tarefas que falharam são reagendadas.
+    """
+    path = geopdf_cache_path(kind, key, selected_date, source_fingerprint, **options)
+    os.makedirs(config.GEOPDF_CACHE_DIR, exist_ok=True)
+
+    with _jobs_lock:
+        job = _jobs.get(path)
+        if job is not None and not (job.done() and job.exception() is not None):
+            return job
+        job = _executor.submit(_build_to_cache, df, kind, key, selected_date, path, cog_path, options)
+        _jobs[path] = job
+
+    def _forget(done_job):
+        # Tarefas concluídas com sucesso já estão no cache em disco
+        if done_job.exception() is None:
+            with _jobs_lock:
+                if _jobs.get(path) is done_job:
+                    del _jobs[path]
+
+    job.add_done_callback(_forget)
+    return job
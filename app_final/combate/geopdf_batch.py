@@ -0,0 +1,240 @@
+"""Exportação em lote dos GeoPDFs de todas as fazendas e talhões de uma data.
+
+Os GeoPDFs são gerados em paralelo por um conjunto de processos
+(``config.GEOPDF_BATCH_WORKERS``) e reunidos em um arquivo ZIP::
+
+    MANULIFE_2024-10-01_<base>.zip
+        manifest.json
+        fazendas/BOI_PRETO_XI.pdf
+        talhoes/BOI_PRETO_XI/BOI_PRETO_XI_001.pdf
+
+Antes de iniciar os processos, os COGs das fazendas são gerados (ver
+combate/cog.py) e os tiles de imagem de fundo de todas as fazendas e talhões
+são baixados para o cache em disco (ver combate/tiles.py), que é lido por
+todos os processos. Cada GeoPDF também fica no cache do painel, e os que já
+estavam lá não são gerados de novo.
+
+O manifest.json registra o arquivo, a situação e o tempo de geração de cada
+GeoPDF, além do tempo total e da vazão (GeoPDFs gerados por minuto). Para
+exportar a partir da pasta app_final:
+
+    python -m combate.geopdf_batch 2024-10-01 [--company MANULIFE] [--workers 4] [--out arquivo.zip]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from combate import cog, config, tiles
+from combate.companies import load_registry
+from combate.geopdf import build_geopdf, cached_geopdf
+from combate.loading import file_fingerprint, load_stands, read_predictions
+
+# Um lote por vez; cada lote já usa todos os processos de trabalho
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="geopdf_batch")
+_jobs = {}
+_status = {}
+_jobs_lock = threading.Lock()
+
+
+def _safe(name):
+    return re.sub(r'[^0-9A-Za-z_-]', '_', str(name))
+
+
+def batch_path(company, date, source_fingerprint, root=config.GEOPDF_BATCH_DIR):
+    """Caminho do ZIP com os GeoPDFs da empresa e data."""
+    return os.path.join(root, f"{company}_{pd.Timestamp(date):%Y-%m-%d}_{source_fingerprint[:12]}.zip")
+
+
+def _build_item(df, kind, key, date, source_fingerprint, cog_path):
+    # Executado nos processos de trabalho
+    start = time.perf_counter()
+    path = build_geopdf(df, kind, key, date, source_fingerprint, cog_path=cog_path)
+    return path, time.perf_counter() - start
+
+
+def _batch_items(pred):
+    # (tipo, fazenda, talhão, pixels) de cada GeoPDF, dos maiores para os menores
+    items = []
+    for farm, pred_farm in pred.groupby('FARM', observed=True):
+        items.append(('farm', farm, None, pred_farm))
+        for stand, pred_stand in pred_farm.groupby('STAND', observed=True):
+            items.append(('stand', farm, stand, pred_stand))
+    return sorted(items, key=lambda item: -len(item[3]))
+
+
+def _arcname(kind, farm, stand):
+    if kind == 'farm':
+        return f"fazendas/{_safe(farm)}.pdf"
+    return f"talhoes/{_safe(farm)}/{_safe(stand)}.pdf"
+
+
+def export_date(company, date, out=None, workers=config.GEOPDF_BATCH_WORKERS, progress=print):
+    """Gera os GeoPDFs de todas as fazendas e talhões da empresa na data e grava o ZIP.
+
+    Retorna o manifesto gravado no ZIP (com o caminho do ZIP em ``path``).
+    GeoPDFs que falham são registrados no manifesto sem interromper o lote.
+    """
+    start = time.perf_counter()
+    date = pd.Timestamp(date)
+    entry = load_registry()[company]
+    source = entry.prediction
+    source_fingerprint = file_fingerprint(source)
+    out = out or batch_path(company, date, source_fingerprint)
+
+    pred = read_predictions(columns=['X', 'Y', 'canopycov'], source=source, dates=[date], companies=[company])
+    if pred.empty:
+        raise ValueError(f"Sem predições de {company} em {date:%Y-%m-%d}")
+
+    # COGs das fazendas e tiles de fundo no cache em disco, antes de iniciar os processos
+    cogs = {farm: cog.ensure_cog(source, company, farm, date, pred_farm)
+            for farm, pred_farm in pred.groupby('FARM', observed=True)}
+    stands = load_stands(entry.stands)
+    stands = stands[(stands['COMPANY'] == company) & stands['FARM'].isin(list(cogs))]
+    tiles.prefetch(tiles.app_views(stands), progress=progress)
+    prepared = time.perf_counter()
+
+    items = _batch_items(pred)
+    results = []
+    pending = {}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for kind, farm, stand, df in items:
+            key = farm if kind == 'farm' else stand
+            # Cada GeoPDF é identificado pela partição (data, fazenda) de origem, como no painel
+            fingerprint = cog.partition_fingerprint(source, farm, date)
+            path = cached_geopdf(kind, key, date, fingerprint)
+            if path is not None:
+                results.append((kind, farm, stand, path, 'cache', 0.0, None))
+                continue
+            future = pool.submit(_build_item, df, kind, key, date, fingerprint, cogs[farm])
+            pending[future] = (kind, farm, stand)
+
+        progress(f"{len(items)} GeoPDFs: {len(pending)} a gerar com {workers} processos, "
+                 f"{len(items) - len(pending)} já em cache")
+        for done, future in enumerate(as_completed(pending), 1):
+            kind, farm, stand = pending[future]
+            try:
+                path, seconds = future.result()
+                results.append((kind, farm, stand, path, 'gerado', seconds, None))
+                progress(f"[{done}/{len(pending)}] {stand or farm}: {seconds:.1f}s")
+            except Exception as exc:
+                results.append((kind, farm, stand, None, 'falhou', None, f"{type(exc).__name__}: {exc}"))
+                progress(f"[{done}/{len(pending)}] {stand or farm}: falhou ({exc})")
+    generated = sum(1 for result in results if result[4] == 'gerado')
+    build_seconds = time.perf_counter() - prepared
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    tmp_out = f"{out}.{threading.get_ident()}.tmp"
+    manifest_items = []
+    with zipfile.ZipFile(tmp_out, "w") as archive:
+        for kind, farm, stand, path, status, seconds, error in sorted(results, key=lambda r: (r[1], r[0], r[2] or "")):
+            arcname = _arcname(kind, farm, stand) if path is not None else None
+            if path is not None:
+                # PDFs já são comprimidos
+                archive.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+            manifest_items.append({'kind': kind, 'farm': farm, 'stand': stand, 'file': arcname, 'status': status,
+                                   'seconds': None if seconds is None else round(seconds, 2),
+                                   'bytes': os.path.getsize(path) if path is not None else None, 'error': error})
+
+        elapsed = time.perf_counter() - start
+        manifest = {
+            'company': company,
+            'date': f"{date:%Y-%m-%d}",
+            'source_fingerprint': source_fingerprint,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'workers': workers,
+            'pdfs': len(results),
+            'generated': generated,
+            'cached': sum(1 for result in results if result[4] == 'cache'),
+            'failed': sum(1 for result in results if result[4] == 'falhou'),
+            'prepare_seconds': round(prepared - start, 2),
+            'build_seconds': round(build_seconds, 2),
+            'total_seconds': round(elapsed, 2),
+            'pdfs_per_minute': round(generated / build_seconds * 60, 1) if generated else None,
+            'items': manifest_items,
+        }
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2, ensure_ascii=False),
+                         compress_type=zipfile.ZIP_DEFLATED)
+    os.replace(tmp_out, out)
+
+    # Remove lotes da mesma empresa e data gerados a partir de uma base anterior
+    prefix = os.path.basename(out).rsplit("_", 1)[0] + "_"
+    folder = os.path.dirname(os.path.abspath(out))
+    for name in os.listdir(folder):
+        if name.startswith(prefix) and name.endswith(".zip") and name != os.path.basename(out):
+            os.remove(os.path.join(folder, name))
+
+    progress(f"{generated} GeoPDFs gerados em {build_seconds:.1f}s "
+             f"({manifest['pdfs_per_minute'] or 0:.1f} por minuto), {manifest['cached']} do cache, "
+             f"{manifest['failed']} com falha; total {elapsed:.1f}s")
+    return dict(manifest, path=out)
+
+
+# Execução em segundo plano a partir do painel
+
+def cached_batch(company, date, source_fingerprint):
+    """Caminho do ZIP já gerado, ou None se ainda não existir."""
+    path = batch_path(company, date, source_fingerprint)
+    return path if os.path.exists(path) else None
+
+
+def batch_job(company, date, source_fingerprint):
+    """Tarefa em andamento (ou que falhou) e a última mensagem de progresso do lote, se houver."""
+    path = batch_path(company, date, source_fingerprint)
+    with _jobs_lock:
+        return _jobs.get(path), _status.get(path)
+
+
+def request_batch(company, date, source_fingerprint, workers=config.GEOPDF_BATCH_WORKERS):
+    """Agenda a exportação em lote em segundo plano e retorna a tarefa (Future).
+
+    Pedidos repetidos para a mesma empresa e data compartilham a mesma
+    tarefa. Tarefas que falharam são reagendadas.
+    """
+    path = batch_path(company, date, source_fingerprint)
+
+    def _progress(message):
+        with _jobs_lock:
+            _status[path] = message
+
+    with _jobs_lock:
+        job = _jobs.get(path)
+        if job is not None and not (job.done() and job.exception() is not None):
+            return job
+        job = _executor.submit(export_date, company, date, path, workers, _progress)
+        _jobs[path] = job
+
+    def _forget(done_job):
+        if done_job.exception() is None:
+            with _jobs_lock:
+                if _jobs.get(path) is done_job:
+                    del _jobs[path]
+                    _status.pop(path, None)
+
+    job.add_done_callback(_forget)
+    return job
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exportação em lote dos GeoPDFs de uma data")
+    parser.add_argument("date", help="Data da aquisição, ex.: 2024-10-01")
+    parser.add_argument("--company", default=None, help="Empresa do cadastro (padrão: todas)")
+    parser.add_argument("--workers", type=int, default=config.GEOPDF_BATCH_WORKERS, help="Número de processos")
+    parser.add_argument("--out", default=None, help="Arquivo ZIP de saída (apenas com --company)")
+    args = parser.parse_args(argv)
+
+    companies = [args.company.upper()] if args.company else list(load_registry())
+    for company in companies:
+        manifest = export_date(company, args.date, args.out if args.company else None, args.workers)
+        print(manifest['path'])
+
+
+if __name__ == "__main__":
+    main()
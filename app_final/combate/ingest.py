@@ -0,0 +1,128 @@
+"""Ingestão incremental de novas datas de aquisição.
+
+Executar a partir da pasta app_final, com um arquivo Parquet contendo os
+pixels das novas datas (mesmas colunas de filtered_pred_attack.parquet):
+
+    python -m combate.ingest nova_data.parquet [--company MANULIFE]
+
+Os pixels são gravados como novas partições da base particionada e as bases
+grouped_farm e grouped_stand recebem apenas as linhas dessas datas; Average% do
+mês afetado e percentage_diff são recalculados a partir das linhas já
+agregadas. Os limiares QT são os registrados em aggregates.json, de forma que
+as datas anteriores não mudam de classificação; os histogramas recebem os
+pixels das novas datas, e datas (ou fazendas) novas recebem o seu limiar
+conforme o modo registrado (ver combate/thresholds.py).
+
+Uma data já ingerida pode ser enviada de novo: apenas as partições (data,
+fazenda) presentes no arquivo são substituídas, nas bases agrupadas e na base
+particionada, e os pixels substituídos saem dos histogramas.
+
+Quando as bases agrupadas não correspondem à base de predições atual, elas são
+recalculadas por completo, como em ``python -m combate.build_aggregates``.
+"""
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from combate import config, store
+from combate import thresholds as canopy_thresholds
+from combate.aggregates import company_rows, stand_lookup, update_grouped
+from combate.build_aggregates import save_aggregates, write_aggregates
+from combate.companies import load_registry
+from combate.loading import file_fingerprint, load_stands, read_predictions, stands_source
+from combate.schema import ARROW_TO_PANDAS, enforce_pred_schema
+
+
+def _fresh_meta(meta_path, dataset, stands_path):
+    # aggregates.json, se as bases agrupadas corresponderem às bases de origem atuais
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('pred_attack') != file_fingerprint(dataset) or meta.get('stands') != file_fingerprint(stands_path):
+        return None
+    # Sem os histogramas dos limiares, as bases são recalculadas por completo (mantendo os limiares)
+    thresholds = canopy_thresholds.from_meta(meta)
+    if thresholds is None or not thresholds.sketches:
+        return None
+    return meta
+
+
+def ingest(new_path, dataset=config.PREDICTION_DATASET_DIR, stands_path=None, aggregates_dir=None):
+    """Acrescenta os pixels de ``new_path`` à base e atualiza as bases agrupadas.
+
+    Retorna um dicionário com as datas ingeridas, o número de pixels e se as
+    bases agrupadas foram atualizadas de forma incremental.
+    """
+    if not store.is_dataset(dataset):
+        raise ValueError(f"{dataset} não é uma base particionada; converta antes com `python -m combate.store convert`")
+
+    stands_path = stands_path or stands_source()
+    aggregates_dir = aggregates_dir or os.path.dirname(os.path.abspath(dataset))
+    farm_path, stand_path, meta_path = (os.path.join(aggregates_dir, os.path.basename(path)) for path in
+                                        (config.GROUPED_FARM_PATH, config.GROUPED_STAND_PATH, config.AGGREGATES_META_PATH))
+    meta = _fresh_meta(meta_path, dataset, stands_path)
+
+    table = pq.read_table(new_path)
+    new_pred = enforce_pred_schema(table.to_pandas(**ARROW_TO_PANDAS))
+    dates = sorted(new_pred['DATE'].unique())
+
+    if meta is None:
+        # Bases agrupadas ausentes ou desatualizadas: grava os pixels e recalcula tudo
+        store.append_to_dataset(table, dataset)
+        write_aggregates(dataset, stands_path, farm_path, stand_path, meta_path)
+        return {'dates': dates, 'pixels': len(new_pred), 'incremental': False}
+
+    # Pixels das partições (DATE, FARM) que serão gravadas de novo, retirados dos histogramas
+    partitions = pd.MultiIndex.from_frame(new_pred[['DATE', 'FARM']].drop_duplicates())
+    replaced = read_predictions(columns=['canopycov'], source=dataset, dates=dates,
+                                farms=list(partitions.get_level_values('FARM').unique()))
+    replaced = replaced[pd.MultiIndex.from_frame(replaced[['DATE', 'FARM']]).isin(partitions)]
+
+    # Linhas base das novas datas; os limiares já registrados não mudam
+    thresholds = canopy_thresholds.from_meta(meta).update(new_pred, replaced)
+    lookup = stand_lookup(load_stands(stands_path))
+    grouped_farm = pd.read_parquet(farm_path)
+    grouped_stand = pd.read_parquet(stand_path)
+    for empresa in new_pred['COMPANY'].unique():
+        farm_rows, stand_rows = company_rows(new_pred, lookup, empresa, thresholds)
+        if len(farm_rows):
+            grouped_farm = update_grouped(grouped_farm, farm_rows, 'FARM', 'farm_total_area_ha')
+        if len(stand_rows):
+            grouped_stand = update_grouped(grouped_stand, stand_rows, 'STAND', 'stand_total_area_ha')
+
+    # Os pixels são gravados antes do aggregates.json, que passa a registrar a base já atualizada
+    store.append_to_dataset(table, dataset)
+    save_aggregates(grouped_farm, grouped_stand, thresholds, dataset, stands_path, farm_path, stand_path, meta_path)
+    return {'dates': dates, 'pixels': len(new_pred), 'incremental': True}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help="Arquivo Parquet com os pixels das novas datas")
+    parser.add_argument('--dataset', default=config.PREDICTION_DATASET_DIR, help="Pasta da base particionada")
+    parser.add_argument('--stands', default=None,
+                        help="Base de talhões (shapefile ou GeoParquet; padrão: a base em uso)")
+    parser.add_argument('--company', default=None,
+                        help="Empresa do cadastro (companies.json); usa as bases e a pasta de saída da empresa")
+    args = parser.parse_args(argv)
+
+    dataset, stands, aggregates_dir = args.dataset, args.stands, None
+    if args.company:
+        company = load_registry()[args.company.upper()]
+        dataset, stands, aggregates_dir = company.prediction, company.stands, company.aggregates_dir
+
+    start = time.perf_counter()
+    result = ingest(args.path, dataset, stands, aggregates_dir)
+    dates = ", ".join(f"{date:%Y-%m-%d}" for date in result['dates'])
+    mode = "incremental" if result['incremental'] else "completa (bases agrupadas desatualizadas)"
+    print(f"{result['pixels']} pixels de {dates} ingeridos em {time.perf_counter() - start:.1f}s; "
+          f"atualização {mode}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# Carregamento das bases de dados com cache por processo
+#
+# As bases são lidas, tratadas e reprojetadas uma única vez por processo e
+# compartilhadas entre todas as sessões do Streamlit. A chave do cache é a
+# "impressão digital" do arquivo (caminho + data de modificação + tamanho), de
+# forma que uma nova entrega de predições é detectada automaticamente.
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from combate import config, profiling, stands, store, thresholds
+from combate.aggregates import build_aggregates
+from combate.schema import ARROW_TO_PANDAS, enforce_pred_schema
+
+# Arquivos auxiliares do shapefile que também invalidam o cache
+_SHAPEFILE_SIDECARS = (".dbf", ".shx", ".prj", ".cpg")
+
+_cache = {}
+_cache_lock = threading.Lock()
+_key_locks = {}
+
+
+def file_fingerprint(path):
+    """Retorna um hash do caminho, data de modificação e tamanho do arquivo.
+
+    Para shapefiles, os arquivos auxiliares (.dbf, .shx, .prj, .cpg) também
+    entram no hash; para pastas, todos os arquivos contidos nelas.
+    """
+    paths = [path]
+    root, ext = os.path.splitext(path)
+    if ext.lower() == ".shp":
+        paths += [root + sidecar for sidecar in _SHAPEFILE_SIDECARS if os.path.exists(root + sidecar)]
+    elif os.path.isdir(path):
+        # Bases particionadas: todos os arquivos da pasta
+        paths = sorted(os.path.join(dirpath, name) for dirpath, _, names in os.walk(path) for name in names)
+
+    digest = hashlib.sha1()
+    for p in paths:
+        stat = os.stat(p)
+        digest.update(f"{os.path.abspath(p)}|{stat.st_mtime_ns}|{stat.st_size}".encode())
+    return digest.hexdigest()
+
+
+def _get_or_load(key, fingerprint, loader):
+    # Retorna o valor do cache ou o recalcula caso a impressão digital tenha mudado
+    with _cache_lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    # Um lock por base evita que várias sessões carreguem o mesmo arquivo ao mesmo tempo
+    with key_lock:
+        entry = _cache.get(key)
+        if entry is None or entry[0] != fingerprint:
+            entry = (fingerprint, loader())
+            _cache[key] = entry
+    return entry[1]
+
+
+def evict(*paths):
+    """Remove do cache as bases carregadas a partir dos caminhos informados."""
+    paths = {os.path.abspath(path) for path in paths}
+    with _cache_lock:
+        for key in [key for key in _cache if paths & set(key[1:])]:
+            del _cache[key]
+
+
+def _cached(name, path, loader):
+    key = (name, os.path.abspath(path))
+    frame = _get_or_load(key, file_fingerprint(path), lambda: loader(path))
+
+    # Cópia rasa: os dados são compartilhados e, com o copy-on-write do pandas 3 (ver requirements.txt),
+    # escritas da sessão geram cópias locais sem alterar o original
+    return frame.copy(deep=False)
+
+
+def prediction_source():
+    """Base de predições em uso: a base particionada, se existir, ou o arquivo único."""
+    if store.is_dataset(config.PREDICTION_DATASET_DIR):
+        return config.PREDICTION_DATASET_DIR
+    return config.PRED_ATTACK_PATH
+
+
+def stands_source():
+    """Base de talhões em uso: o GeoParquet convertido, se existir, ou o shapefile."""
+    if os.path.exists(config.STANDS_DATASET_PATH):
+        return config.STANDS_DATASET_PATH
+    return config.STANDS_PATH
+
+
+@profiling.traced("loading.read_pred_attack")
+def _read_pred_attack(path):
+    if store.is_dataset(path):
+        table = store.read_table(path)
+    else:
+        table = pq.read_table(path)
+    return enforce_pred_schema(table.to_pandas(**ARROW_TO_PANDAS))
+
+
+@profiling.traced("loading.read_stands")
+def _read_stands(path):
+    return stands.read(path)
+
+
+def load_pred_attack(path=None):
+    """Base de predições completa, no esquema de combate/schema.py.
+
+    Por padrão utiliza ``prediction_source()``. Para consultas de uma data ou
+    fazenda, prefira ``read_predictions``, que lê apenas as partições necessárias.
+    """
+    return _cached("pred_attack", path or prediction_source(), _read_pred_attack)
+
+
+@profiling.traced("loading.read_predictions")
+def read_predictions(columns=None, source=None, **keys):
+    """Pixels das predições filtrados pelas chaves informadas.
+
+    As chaves aceitas são ``dates``, ``farms``, ``stands`` e ``companies``
+    (listas de valores). Com a base particionada, apenas as partições e as
+    colunas pedidas são lidas; com o arquivo único, a base completa em cache é
+    filtrada em memória.
+    """
+    source = source or prediction_source()
+    if keys.get('dates') is not None:
+        keys['dates'] = [pd.Timestamp(date) for date in keys['dates']]
+
+    if store.is_dataset(source):
+        if columns is not None:
+            columns = list(dict.fromkeys(list(columns) + ['COMPANY', 'FARM', 'STAND', 'DATE']))
+        table = store.read_table(source, columns=columns, **keys)
+        return enforce_pred_schema(table.to_pandas(**ARROW_TO_PANDAS))
+
+    pred_attack = load_pred_attack(source)
+    mask = pd.Series(True, index=pred_attack.index)
+    for column, key in (('DATE', 'dates'), ('FARM', 'farms'), ('STAND', 'stands'), ('COMPANY', 'companies')):
+        if keys.get(key) is not None:
+            mask &= pred_attack[column].isin(keys[key])
+    filtered = pred_attack[mask]
+    return filtered if columns is None else filtered[list(dict.fromkeys(list(columns) + ['COMPANY', 'FARM', 'STAND', 'DATE']))]
+
+
+def _read_prediction_keys(path):
+    if store.is_dataset(path):
+        table = store.read_table(path, columns=['COMPANY', 'FARM', 'STAND', 'DATE'])
+        keys = enforce_pred_schema(table.group_by(['COMPANY', 'FARM', 'STAND', 'DATE']).aggregate([]).to_pandas(**ARROW_TO_PANDAS))
+    else:
+        keys = load_pred_attack(path)[['COMPANY', 'FARM', 'STAND', 'DATE']].drop_duplicates()
+    return keys.sort_values(['COMPANY', 'FARM', 'STAND', 'DATE']).reset_index(drop=True)
+
+
+def load_prediction_keys(source=None):
+    """Combinações distintas de COMPANY, FARM, STAND e DATE presentes nas predições.
+
+    Alimenta os filtros da barra lateral sem carregar os pixels.
+    """
+    return _cached("prediction_keys", source or prediction_source(), _read_prediction_keys)
+
+
+def load_stands(path=None):
+    """Base de talhões tratada, em EPSG:4326, com as áreas dos talhões e das fazendas (ver combate/stands.py).
+
+    Por padrão utiliza ``stands_source()``.
+    """
+    return _cached("stands_all", path or stands_source(), _read_stands)
+
+
+def _read_aggregates_meta(meta_path):
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def aggregates_stale(pred_path=None, stands_path=None, meta_path=config.AGGREGATES_META_PATH):
+    """Indica se as bases agrupadas gravadas não correspondem mais às bases de origem atuais."""
+    meta = _read_aggregates_meta(meta_path)
+    return meta is not None and (meta.get('pred_attack') != file_fingerprint(pred_path or prediction_source())
+                                 or meta.get('stands') != file_fingerprint(stands_path or stands_source()))
+
+
+def load_aggregates(pred_path=None, stands_path=None,
+                    farm_path=config.GROUPED_FARM_PATH, stand_path=config.GROUPED_STAND_PATH,
+                    meta_path=config.AGGREGATES_META_PATH):
+    """Retorna as bases grouped_farm e grouped_stand (com a coluna COMPANY).
+
+    Utiliza as bases pré-calculadas por ``python -m combate.build_aggregates``,
+    mesmo que estejam desatualizadas em relação às bases de origem (ver
+    ``aggregates_stale``): recalculá-las exigiria carregar todas as predições
+    em cada servidor, e isso fica a cargo da linha de comando. Apenas quando
+    ainda não há bases gravadas elas são calculadas no próprio processo, uma
+    vez por versão dos arquivos, com os limiares QT registrados no
+    aggregates.json.
+    """
+    pred_path = pred_path or prediction_source()
+    stands_path = stands_path or stands_source()
+
+    meta = _read_aggregates_meta(meta_path)
+    if meta is not None and os.path.exists(farm_path) and os.path.exists(stand_path):
+        return (_cached("grouped_farm", farm_path, pd.read_parquet),
+                _cached("grouped_stand", stand_path, pd.read_parquet))
+
+    def build():
+        grouped_farm, grouped_stand, _ = build_aggregates(load_pred_attack(pred_path), load_stands(stands_path),
+                                                          thresholds.from_meta(meta))
+        return grouped_farm, grouped_stand
+
+    key = ("aggregates", os.path.abspath(pred_path), os.path.abspath(stands_path))
+    grouped_farm, grouped_stand = _get_or_load(key, file_fingerprint(pred_path) + file_fingerprint(stands_path), build)
+    return grouped_farm.copy(deep=False), grouped_stand.copy(deep=False)
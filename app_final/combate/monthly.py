@@ -0,0 +1,49 @@
+"""Desfolha média (%) por fazenda (ou talhão) e mês, para os gráficos de evolução mensal.
+
+A matriz tem uma linha por fazenda (ou talhão) e uma coluna por mês (ano-mês),
+do primeiro ao último mês das bases agrupadas; meses sem aquisição ficam
+vazios (NaN). É montada uma vez por carga das bases agrupadas (ver
+combate/companies.py), e cada gráfico lê apenas a linha da fazenda ou do
+talhão, até o mês da data selecionada.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from combate.aggregates import month_label, month_number
+
+
+@dataclass(frozen=True)
+class MonthlyCube:
+    """Matriz (fazenda ou talhão × mês) da desfolha média, com o índice de cada linha."""
+    first_month: int
+    index: dict
+    values: np.ndarray
+
+    def series(self, entity, until=None):
+        """Meses com aquisição da fazenda (ou talhão), até o mês de ``until``, com as colunas Mes e Average%."""
+        row = self.index.get(entity)
+        last = self.values.shape[1]
+        if until is not None:
+            until = pd.Timestamp(until)
+            last = min(last, until.year * 12 + until.month - 1 - self.first_month + 1)
+        if row is None or last <= 0:
+            return pd.DataFrame({'Mes': pd.Series(dtype=str), 'Average%': pd.Series(dtype=float)})
+        values = self.values[row, :last]
+        months = np.flatnonzero(~np.isnan(values))
+        return pd.DataFrame({'Mes': month_label(months + self.first_month), 'Average%': values[months]})
+
+
+def monthly_cube(grouped, key):
+    """Matriz da desfolha média mensal a partir de uma base agrupada (``key``: 'FARM' ou 'STAND')."""
+    entity_codes, entities = pd.factorize(grouped[key])
+    months = month_number(grouped['DATE'])
+    first_month = int(months.min()) if len(months) else 0
+    n_months = int(months.max()) - first_month + 1 if len(months) else 0
+
+    # Average% já é a média do mês de cada fazenda (ou talhão): todas as linhas da célula têm o mesmo valor
+    values = np.full((len(entities), n_months), np.nan)
+    values[entity_codes, months - first_month] = grouped['Average%'].to_numpy(dtype=float)
+
+    return MonthlyCube(first_month, {entity: row for row, entity in enumerate(entities)}, values)
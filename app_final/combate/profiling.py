@@ -0,0 +1,212 @@
+"""Medição do tempo e da memória de cada etapa de uma execução do painel.
+
+Cada execução do script abre um ``RunProfile`` e marca as seções com
+``section`` (a seção anterior é fechada ao abrir a próxima); trechos
+internos usam ``span``, também disponível nas funções de combate/ (leitura
+das bases, imagens de fundo, GeoPDFs), que registram no perfil da execução
+em andamento. Para cada trecho são registrados:
+
+- o tempo decorrido e o tempo de CPU da thread (cada sessão do Streamlit
+  executa o script na sua própria thread);
+- a variação da memória residente (RSS) do processo;
+- a memória alocada (pico do tracemalloc), apenas com COMBATE_PROFILE_MEMORY=1,
+  já que o tracemalloc deixa todas as sessões mais lentas.
+
+Os trechos aparecem no painel de depuração (``?debug=1`` no endereço) e são
+gravados em JSON lines em ``config.PROFILE_LOG`` nas execuções com
+``?debug=1`` ou em todas, com COMBATE_PROFILE=1. Trechos executados fora do
+script (ex.: GeoPDFs em segundo plano) são gravados avulsos. Para resumir o
+arquivo, executar a partir da pasta app_final:
+
+    python -m combate.profiling summary [--log cache/profile/spans.jsonl]
+"""
+import argparse
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from combate import config
+
+if config.PROFILE_MEMORY and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+_current = contextvars.ContextVar("combate_profile", default=None)
+_write_lock = threading.Lock()
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _Measure:
+    # Leituras no início de um trecho
+    def __init__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        self.rss = _rss_mb()
+        if tracemalloc.is_tracing():
+            # O pico é global: em trechos aninhados, o do trecho externo desconsidera o que veio antes do interno
+            self.traced = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+    def finish(self, name, depth):
+        rss = _rss_mb()
+        record = {
+            'name': name,
+            'depth': depth,
+            'wall_ms': round((time.perf_counter() - self.wall) * 1000, 2),
+            'cpu_ms': round((time.thread_time() - self.cpu) * 1000, 2),
+            'rss_delta_mb': round(rss - self.rss, 2) if rss is not None and self.rss is not None else None,
+            'alloc_peak_mb': None,
+        }
+        if tracemalloc.is_tracing() and hasattr(self, 'traced'):
+            record['alloc_peak_mb'] = round((tracemalloc.get_traced_memory()[1] - self.traced) / 1e6, 2)
+        return record
+
+
+def _write(records, path=None):
+    path = path or config.PROFILE_LOG
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+    with _write_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(lines)
+
+
+class RunProfile:
+    """Trechos medidos em uma execução do script.
+
+    ``context`` (ex.: empresa, fazenda, data) é gravado junto com cada trecho.
+    """
+
+    def __init__(self, log=config.PROFILE_ENABLED, **context):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.log = log
+        self.context = context
+        self.records = []
+        self._stack = []
+        self._section = None
+        self._start = _Measure()
+        self._token = _current.set(self)
+
+    def _open(self, name):
+        self._stack.append((name, _Measure()))
+
+    def _close(self):
+        name, measure = self._stack.pop()
+        record = measure.finish(name, len(self._stack))
+        record['ts'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.records.append(record)
+
+    @contextmanager
+    def span(self, name):
+        self._open(name)
+        try:
+            yield
+        finally:
+            self._close()
+
+    def section(self, name):
+        """Fecha a seção anterior (se houver) e abre a seção ``name``."""
+        if self._section is not None:
+            self._close()
+        self._open(name)
+        self._section = name
+
+    def finish(self):
+        """Fecha a seção em aberto, registra o total da execução e grava o log (se ativo)."""
+        if self._section is not None:
+            self._close()
+            self._section = None
+        total = self._start.finish("total", 0)
+        total['ts'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.records.append(total)
+        _current.reset(self._token)
+        if self.log:
+            _write([dict(record, run_id=self.run_id, **self.context) for record in self.records])
+        return self.records
+
+    def table(self):
+        """Trechos da execução como DataFrame, na ordem em que terminaram."""
+        return pd.DataFrame(self.records, columns=['name', 'depth', 'wall_ms', 'cpu_ms', 'rss_delta_mb',
+                                                   'alloc_peak_mb'])
+
+
+@contextmanager
+def span(name):
+    """Mede um trecho no perfil da execução em andamento.
+
+    Fora de uma execução do script, o trecho é gravado avulso no log quando
+    COMBATE_PROFILE=1, e não é medido caso contrário.
+    """
+    profile = _current.get()
+    if profile is not None:
+        with profile.span(name):
+            yield
+        return
+    if not config.PROFILE_ENABLED:
+        yield
+        return
+
+    measure = _Measure()
+    try:
+        yield
+    finally:
+        record = measure.finish(name, 0)
+        _write([dict(record, ts=time.strftime('%Y-%m-%dT%H:%M:%S'), run_id=None,
+                     thread=threading.current_thread().name)])
+
+
+def traced(name):
+    """Decorador que mede cada chamada da função com ``span(name)``."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summarize(path=config.PROFILE_LOG):
+    """Resumo do log por trecho: número de medições, p50/p95 do tempo e médias de CPU e memória."""
+    with open(path, encoding="utf-8") as f:
+        spans = pd.DataFrame([json.loads(line) for line in f if line.strip()])
+    if spans.empty:
+        return spans
+    return (spans
+            .groupby('name', sort=False)
+            .agg(n=('wall_ms', 'size'),
+                 wall_p50_ms=('wall_ms', lambda values: np.percentile(values, 50)),
+                 wall_p95_ms=('wall_ms', lambda values: np.percentile(values, 95)),
+                 cpu_mean_ms=('cpu_ms', 'mean'),
+                 rss_delta_mean_mb=('rss_delta_mb', 'mean'),
+                 alloc_peak_mean_mb=('alloc_peak_mb', 'mean'))
+            .round(1)
+            .sort_values('wall_p95_ms', ascending=False))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resumo do log de medições do painel")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary_parser = commands.add_parser("summary", help="Tempo e memória por trecho, em todas as execuções")
+    summary_parser.add_argument("--log", default=config.PROFILE_LOG, help="Arquivo JSON lines")
+    args = parser.parse_args(argv)
+
+    print(summarize(args.log).to_string())
+
+
+if __name__ == "__main__":
+    main()
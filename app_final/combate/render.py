@@ -0,0 +1,220 @@
+# Renderização dos mapas de calor no servidor
+#
+# Em vez de desenhar cada pixel das predições como um marcador do matplotlib,
+# os valores são agregados em uma grade regular (np.bincount), coloridos com
+# uma tabela de cores do NumPy e sobrepostos à imagem de fundo. O custo do
+# desenho depende do tamanho da imagem de saída, e não do número de pixels.
+#
+# O matplotlib e o contextily são importados apenas ao desenhar (ver combate/warmup.py).
+# As figuras são criadas com matplotlib.figure.Figure, sem o pyplot: as sessões e o
+# pré-carregamento (ver combate/slices.py) desenham ao mesmo tempo, em threads
+# diferentes, e o estado global do pyplot (figura atual, gerenciador de figuras)
+# não é seguro entre threads.
+import io
+
+import numpy as np
+
+from combate import config, profiling, tiles
+
+# Margem em torno dos dados, como a margem padrão dos eixos do matplotlib
+MARGIN = 0.05
+
+
+def colormap_lut(cmap, n_colors=256):
+    """Tabela de cores RGBA (uint8) com ``n_colors`` entradas."""
+    import matplotlib
+
+    return (matplotlib.colormaps[cmap].resampled(n_colors)(np.arange(n_colors)) * 255).round().astype(np.uint8)
+
+
+def bin_to_grid(x, y, values, bounds, shape):
+    """Média dos valores em cada célula de uma grade regular (NaN nas células vazias).
+
+    ``bounds`` é (oeste, sul, leste, norte) e ``shape`` é (linhas, colunas);
+    a primeira linha da grade é a do norte.
+    """
+    w, s, e, n = bounds
+    rows, cols = shape
+    col = np.floor((np.asarray(x) - w) / (e - w) * cols).astype(np.int64)
+    row = np.floor((n - np.asarray(y)) / (n - s) * rows).astype(np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    inside = (col >= 0) & (col < cols) & (row >= 0) & (row < rows) & np.isfinite(values)
+
+    cell = row[inside] * cols + col[inside]
+    sums = np.bincount(cell, weights=values[inside], minlength=rows * cols)
+    counts = np.bincount(cell, minlength=rows * cols)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (sums / counts).reshape(shape)
+
+
+def colorize(grid, lut, vmin, vmax):
+    """Imagem RGBA da grade; células vazias ficam transparentes."""
+    valid = np.isfinite(grid)
+    scaled = (np.where(valid, grid, vmin) - vmin) * (len(lut) / ((vmax - vmin) or 1))
+    image = np.take(lut, np.clip(scaled, 0, len(lut) - 1).astype(np.intp), axis=0)
+    image *= valid[..., None]
+    return image
+
+
+def _resample(image, extent, bounds, shape):
+    # Amostra (vizinho mais próximo) a imagem de extensão (oeste, leste, sul, norte) na grade de saída
+    w, s, e, n = bounds
+    rows, cols = shape
+    left, right, bottom, top = extent
+    lon = w + (np.arange(cols) + 0.5) * (e - w) / cols
+    lat = n - (np.arange(rows) + 0.5) * (n - s) / rows
+    col = np.clip(((lon - left) / (right - left) * image.shape[1]).astype(np.int64), 0, image.shape[1] - 1)
+    row = np.clip(((top - lat) / (top - bottom) * image.shape[0]).astype(np.int64), 0, image.shape[0] - 1)
+    return image[row[:, None], col[None, :]]
+
+
+def _with_margin(w, s, e, n):
+    dx, dy = (e - w) * MARGIN, (n - s) * MARGIN
+    return w - dx, s - dy, e + dx, n + dy
+
+
+def _grid_bounds(x, y, outlines, cell):
+    # Extensão dos dados e contornos com margem, alinhada à grade das predições
+    xs = [x] + [gdf.total_bounds[[0, 2]] for gdf, _, _ in outlines if len(gdf)]
+    ys = [y] + [gdf.total_bounds[[1, 3]] for gdf, _, _ in outlines if len(gdf)]
+    xs, ys = np.concatenate(xs), np.concatenate(ys)
+    w, s, e, n = _with_margin(xs.min(), ys.min(), xs.max(), ys.max())
+
+    # Os centros das células coincidem com os centros dos pixels das predições
+    x0, y0 = (x.min(), y.min()) if len(x) else (w, s)
+    w = x0 - cell / 2 - np.ceil((x0 - cell / 2 - w) / cell) * cell
+    s = y0 - cell / 2 - np.ceil((y0 - cell / 2 - s) / cell) * cell
+    e = w + np.ceil((e - w) / cell) * cell
+    n = s + np.ceil((n - s) / cell) * cell
+    return w, s, e, n
+
+
+def map_bounds(bounds, cell=config.PREDICTION_GRID_DEG):
+    """Extensões mínima e máxima do mapa de dados contidos em ``bounds`` (oeste, sul, leste, norte).
+
+    A mínima é a extensão com a margem; a máxima inclui também o ajuste à
+    grade das predições (até uma célula de cada lado). Usadas para
+    pré-carregar os tiles dos mapas (ver ``tiles.app_views``).
+    """
+    w, s, e, n = _with_margin(*bounds)
+    return (w, s, e, n), (w - cell, s - cell, e + cell, n + cell)
+
+
+def composite_grid(grid, bounds, shape, lut, vmin, vmax, source=None):
+    """Grade de valores (extensão ``bounds``) sobre a imagem de fundo, como imagem RGBA de ``shape`` pixels."""
+    import contextily as ctx
+
+    w, s, e, n = bounds
+    heat = _resample(colorize(grid, lut, vmin, vmax), (w, e, s, n), bounds, shape)
+
+    # Imagem de fundo reprojetada para graus e amostrada na mesma grade
+    basemap, extent = tiles.bounds2img(w, s, e, n, provider=source)
+    basemap, extent = ctx.warp_tiles(basemap, extent, t_crs=config.CRS_LATLON)
+    if basemap.shape[2] == 3:
+        basemap = np.dstack([basemap, np.full(basemap.shape[:2], 255, dtype=np.uint8)])
+    basemap = _resample(basemap.astype(np.uint8), extent, bounds, shape)
+
+    return np.where(heat[:, :, 3:] > 0, heat, basemap)
+
+
+def composite(x, y, values, bounds, shape, lut, vmin, vmax, source=None, cell=config.PREDICTION_GRID_DEG):
+    """Mapa de calor dos pixels sobre a imagem de fundo, como imagem RGBA de ``shape`` pixels."""
+    w, s, e, n = bounds
+    rows, cols = shape
+
+    # Grade na resolução das predições, ou na da imagem de saída quando esta for menor
+    grid_shape = (min(rows, int(round((n - s) / cell))), min(cols, int(round((e - w) / cell))))
+    return composite_grid(bin_to_grid(x, y, values, bounds, grid_shape), bounds, shape, lut, vmin, vmax, source)
+
+
+def _output_shape(bounds, figsize, dpi):
+    # Tamanho da imagem: a largura da figura, com a proporção dos mapas em graus (1/cos da latitude)
+    w, s, e, n = bounds
+    aspect = 1 / np.cos(np.radians((s + n) / 2))
+    cols = int(figsize[0] * dpi)
+    rows = max(1, int(round(cols * (n - s) * aspect / (e - w))))
+    if rows > figsize[1] * dpi:
+        rows = int(figsize[1] * dpi)
+        cols = max(1, int(round(rows * (e - w) / ((n - s) * aspect))))
+    return (rows, cols), aspect
+
+
+def _png(image, bounds, aspect, outlines, vmin, vmax, figsize, dpi, cmap, label):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.cm import ScalarMappable
+    from matplotlib.colors import Normalize
+    from matplotlib.figure import Figure
+
+    w, s, e, n = bounds
+    fig = Figure(figsize=figsize, layout="constrained")
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.imshow(image, extent=(w, e, s, n), interpolation="nearest")
+    for gdf, color, linewidth in outlines:
+        gdf.plot(ax=ax, edgecolor=color, facecolor="none", linewidth=linewidth)
+    ax.set_aspect(aspect)
+    ax.axis((w, e, s, n))
+    ax.axis("off")
+
+    cbar = fig.colorbar(ScalarMappable(norm=Normalize(vmin, vmax), cmap=cmap), ax=ax, fraction=0.02, pad=0.02)
+    cbar.set_label(label, fontsize=8)
+    cbar.ax.tick_params(labelsize=6)
+
+    buffer = io.BytesIO()
+    canvas.print_figure(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+@profiling.traced("render.render_heatmap")
+def render_heatmap(x, y, values, outlines=(), figsize=(6, 3), dpi=config.MAP_DPI, cmap="RdYlGn",
+                   label="Cobertura do dossel (%)", source=None):
+    """PNG do mapa de calor dos pixels (graus) com os contornos e a barra de cores.
+
+    ``outlines`` é uma lista de (GeoDataFrame em EPSG:4326, cor, espessura).
+    """
+    x, y, values = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), np.asarray(values)
+    cell = config.PREDICTION_GRID_DEG
+    bounds = _grid_bounds(x, y, outlines, cell)
+    shape, aspect = _output_shape(bounds, figsize, dpi)
+
+    vmin, vmax = (float(np.nanmin(values)), float(np.nanmax(values))) if len(values) else (0.0, 1.0)
+    image = composite(x, y, values, bounds, shape, colormap_lut(cmap), vmin, vmax, source, cell)
+    return _png(image, bounds, aspect, outlines, vmin, vmax, figsize, dpi, cmap, label)
+
+
+@profiling.traced("render.render_grid")
+def render_grid(grid, bounds, outlines=(), figsize=(6, 3), dpi=config.MAP_DPI, cmap="RdYlGn",
+                label="Cobertura do dossel (%)", source=None):
+    """PNG do mapa de calor de uma grade já rasterizada (ex.: janela de um COG, ver combate/cog.py).
+
+    ``bounds`` é a extensão (oeste, sul, leste, norte) da grade, em graus.
+    """
+    w, s, e, n = bounds
+    rows, cols = grid.shape
+    cell = (e - w) / cols
+
+    # Extensão das células com dados, para enquadrar o mapa como no caso dos pixels
+    valid_rows = np.flatnonzero(np.isfinite(grid).any(axis=1))
+    valid_cols = np.flatnonzero(np.isfinite(grid).any(axis=0))
+    if len(valid_rows):
+        x = w + (valid_cols[[0, -1]] + 0.5) * cell
+        y = n - (valid_rows[[-1, 0]] + 0.5) * cell
+    else:
+        x = y = np.array([])
+    view = _grid_bounds(x, y, outlines, cell)
+    vw, vs, ve, vn = view
+
+    # Grade na extensão do mapa (as duas grades são alinhadas)
+    view_grid = np.full((int(round((vn - vs) / cell)), int(round((ve - vw) / cell))), np.nan, dtype=np.float32)
+    row0, col0 = int(round((vn - n) / cell)), int(round((w - vw) / cell))
+    src_r0, src_c0 = max(0, -row0), max(0, -col0)
+    dst_r0, dst_c0 = max(0, row0), max(0, col0)
+    height = min(rows - src_r0, view_grid.shape[0] - dst_r0)
+    width = min(cols - src_c0, view_grid.shape[1] - dst_c0)
+    if height > 0 and width > 0:
+        view_grid[dst_r0:dst_r0 + height, dst_c0:dst_c0 + width] = grid[src_r0:src_r0 + height, src_c0:src_c0 + width]
+
+    shape, aspect = _output_shape(view, figsize, dpi)
+    vmin, vmax = (float(np.nanmin(grid)), float(np.nanmax(grid))) if len(valid_rows) else (0.0, 1.0)
+    image = composite_grid(view_grid, view, shape, colormap_lut(cmap), vmin, vmax, source)
+    return _png(image, view, aspect, outlines, vmin, vmax, figsize, dpi, cmap, label)
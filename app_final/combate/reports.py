@@ -0,0 +1,130 @@
+"""Planilhas de recomendação por fazenda e por talhão (Excel, CSV e Parquet).
+
+As planilhas têm as linhas das bases agrupadas até a data selecionada. O Excel
+tem uma aba por planilha e é gravado linha a linha pelo xlsxwriter em modo de
+memória constante; CSV e Parquet são arquivos ZIP com um arquivo por
+planilha. Os arquivos só são gerados quando o download é pedido e ficam em
+cache no disco por (empresa, data, formato), com a impressão digital das bases
+de origem no nome.
+"""
+import hashlib
+import io
+import os
+import threading
+import zipfile
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from combate import config, profiling
+from combate.loading import file_fingerprint
+
+# Colunas das bases agrupadas que não vão para as planilhas
+DROPPED_COLUMNS = ['count', 'total', 'Mes', 'percentage_diff', 'percentage', 'Average%']
+
+SHEETS = {
+    'Fazendas': {'DATE': 'Data', 'FARM': 'Fazenda', 'farm_total_area_ha': 'Area total da fazenda',
+                 'farm_desfolha_area_ha': 'Area total em desfolha'},
+    'Talhoes': {'DATE': 'Data', 'FARM': 'Fazenda', 'STAND': 'Talhao', 'stand_total_area_ha': 'Area total do talhao',
+                'stand_desfolha_area_ha': 'Area total em desfolha'},
+}
+
+
+def report_frames(grouped_farm, grouped_stand, date=None):
+    """Planilhas por fazenda e por talhão, com as linhas até ``date`` (padrão: todas)."""
+    frames = {}
+    for sheet, grouped in zip(SHEETS, (grouped_farm, grouped_stand)):
+        if date is not None:
+            grouped = grouped[grouped['DATE'] <= pd.Timestamp(date)]
+        frame = grouped.drop(columns=[column for column in DROPPED_COLUMNS + ['COMPANY'] if column in grouped])
+        frames[sheet] = frame.rename(columns=SHEETS[sheet]).reset_index(drop=True)
+    return frames
+
+
+def write_xlsx(frames, path):
+    # Modo de memória constante: cada linha é gravada no disco assim que a próxima começa
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    header = workbook.add_format({'bold': True})
+    date_format = workbook.add_format({'num_format': 'dd/mm/yyyy'})
+    for sheet, frame in frames.items():
+        worksheet = workbook.add_worksheet(sheet)
+        worksheet.write_row(0, 0, list(frame.columns), header)
+        dates = [pd.api.types.is_datetime64_any_dtype(dtype) for dtype in frame.dtypes]
+        for col, is_date in enumerate(dates):
+            worksheet.set_column(col, col, 12 if is_date else 20)
+
+        # Colunas convertidas para listas do Python de uma vez, e não célula a célula
+        columns = [frame[column].astype(object).where(frame[column].notna(), None).tolist() for column in frame]
+        for row, values in enumerate(zip(*columns), start=1):
+            for col, value in enumerate(values):
+                if value is None:
+                    continue
+                if dates[col]:
+                    worksheet.write_datetime(row, col, value.to_pydatetime(), date_format)
+                elif isinstance(value, (int, float, np.number)):
+                    worksheet.write_number(row, col, value)
+                else:
+                    worksheet.write_string(row, col, str(value))
+    workbook.close()
+
+
+def write_csv(frames, path):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for sheet, frame in frames.items():
+            with archive.open(f"{sheet.lower()}.csv", "w") as raw, io.TextIOWrapper(raw, encoding="utf-8") as f:
+                frame.to_csv(f, index=False, date_format="%Y-%m-%d", chunksize=10_000)
+
+
+def write_parquet(frames, path):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for sheet, frame in frames.items():
+            with archive.open(f"{sheet.lower()}.parquet", "w") as f:
+                frame.to_parquet(f, index=False)
+
+
+# Formato: (função de gravação, extensão, tipo MIME)
+FORMATS = {
+    'xlsx': (write_xlsx, 'xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': (write_csv, 'csv.zip', 'application/zip'),
+    'parquet': (write_parquet, 'parquet.zip', 'application/zip'),
+}
+
+
+def company_fingerprint(company):
+    """Impressão digital das bases de predições e de talhões da empresa (``companies.Company``)."""
+    fingerprints = file_fingerprint(company.prediction) + file_fingerprint(company.stands)
+    return hashlib.sha1(fingerprints.encode()).hexdigest()
+
+
+def report_path(company, date, fmt, source_fingerprint, root=config.REPORT_CACHE_DIR):
+    return os.path.join(root, f"recomendacao_{company}_{pd.Timestamp(date):%Y-%m-%d}_{source_fingerprint[:12]}"
+                              f".{FORMATS[fmt][1]}")
+
+
+@profiling.traced("reports.export_report")
+def export_report(grouped_farm, grouped_stand, company, date, fmt, source_fingerprint):
+    """Caminho das planilhas no formato ``fmt``, gerando-as se ainda não estiverem em cache."""
+    path = report_path(company, date, fmt, source_fingerprint)
+    if os.path.exists(path):
+        return path
+
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    # Remove versões da mesma empresa, data e formato geradas a partir de bases anteriores
+    prefix = os.path.basename(path).rsplit("_", 1)[0] + "_"
+    for name in os.listdir(folder):
+        if name.startswith(prefix) and name.endswith(FORMATS[fmt][1]) and name != os.path.basename(path):
+            os.remove(os.path.join(folder, name))
+
+    # Grava em um arquivo temporário e substitui, para nunca servir um arquivo incompleto
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    FORMATS[fmt][0](report_frames(grouped_farm, grouped_stand, date), tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def report_bytes(grouped_farm, grouped_stand, company, date, fmt, source_fingerprint):
+    """Conteúdo das planilhas no formato ``fmt`` (ver ``export_report``)."""
+    with open(export_report(grouped_farm, grouped_stand, company, date, fmt, source_fingerprint), "rb") as f:
+        return f.read()
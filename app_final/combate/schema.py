@@ -0,0 +1,56 @@
+# Esquema tipado da base de predições (pred_attack)
+#
+# As chaves são categóricas (codificadas por dicionário), DATE é datetime64 e
+# as coordenadas e coberturas são float32. Todos os filtros e agrupamentos do
+# painel trabalham diretamente sobre esses tipos.
+import numpy as np
+import pandas as pd
+
+# Chaves categóricas, normalizadas para maiúsculas
+KEY_COLUMNS = ('COMPANY', 'FARM', 'STAND')
+
+PRED_ATTACK_SCHEMA = {
+    'COMPANY': 'category',
+    'FARM': 'category',
+    'STAND': 'category',
+    'DATE': 'datetime64[ns]',
+    'X': 'float32',
+    'Y': 'float32',
+    'canopycov': 'float32',
+    'canopycovfit': 'float32',
+    'cover_min': 'float32',
+    'cover_max': 'float32',
+}
+
+# Conversão das tabelas do pyarrow: textos como categóricos e datas como datetime64
+ARROW_TO_PANDAS = {'strings_to_categorical': True, 'date_as_object': False}
+
+
+def upper_categorical(values):
+    """Converte a coluna em categórica com as categorias em maiúsculas.
+
+    A conversão é feita apenas nas categorias (e não em cada linha);
+    categorias que passam a coincidir são unificadas.
+    """
+    values = values.astype('category')
+    upper = values.cat.categories.str.upper()
+    categories = pd.Index(upper.unique())
+    mapping = categories.get_indexer(upper)
+    codes = values.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, mapping[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=values.index, name=values.name)
+
+
+def enforce_pred_schema(pred_attack):
+    """Aplica o esquema de PRED_ATTACK_SCHEMA às colunas presentes na base."""
+    for column in KEY_COLUMNS:
+        if column in pred_attack:
+            pred_attack[column] = upper_categorical(pred_attack[column])
+
+    if 'DATE' in pred_attack:
+        pred_attack['DATE'] = pd.to_datetime(pred_attack['DATE']).dt.normalize().astype('datetime64[ns]')
+
+    for column, dtype in PRED_ATTACK_SCHEMA.items():
+        if column in pred_attack and dtype not in ('category', 'datetime64[ns]'):
+            pred_attack[column] = pred_attack[column].astype(dtype)
+    return pred_attack
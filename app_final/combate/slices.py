@@ -0,0 +1,89 @@
+"""Cache compartilhado dos recortes de cada data, com pré-carregamento em segundo plano.
+
+Os painéis, os pixels e os mapas de uma data (ver ``engine.date_panels``,
+``engine.farm_slice`` e ``engine.date_maps``) ficam em um cache
+compartilhado entre as sessões, com no máximo ``config.SLICE_CACHE_SIZE``
+recortes; os usados há mais tempo são descartados. Quando o usuário chega a
+uma data, ``prefetch`` calcula as datas vizinhas em uma thread, de forma que
+a navegação pelo histórico reaproveita o que já foi calculado.
+
+As chaves incluem a versão das bases da empresa (``CompanyData.version``):
+recortes de versões anteriores deixam de ser usados e saem do cache.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from combate import config
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+_queued = None
+_worker = None
+
+
+def get(key, build):
+    """Recorte de ``key``, calculado com ``build`` na primeira vez.
+
+    Se o recorte estiver sendo calculado por outra sessão ou pelo
+    pré-carregamento, aguarda o resultado em vez de calculá-lo de novo.
+    """
+    with _lock:
+        future = _entries.get(key)
+        owner = future is None
+        if owner:
+            future = _entries[key] = Future()
+        _entries.move_to_end(key)
+        while len(_entries) > config.SLICE_CACHE_SIZE:
+            _entries.popitem(last=False)
+
+    if owner:
+        try:
+            future.set_result(build())
+        except BaseException as exc:
+            # Falhas não ficam em cache: a próxima chamada tenta de novo
+            with _lock:
+                if _entries.get(key) is future:
+                    del _entries[key]
+            future.set_exception(exc)
+    return future.result()
+
+
+def cached(key):
+    """Indica se o recorte de ``key`` está em cache (calculado ou em cálculo)."""
+    with _lock:
+        return key in _entries
+
+
+def _run():
+    # Apenas o pedido mais recente é atendido: pedidos de datas que o usuário já deixou são descartados
+    global _queued, _worker
+    while True:
+        with _lock:
+            tasks, _queued = _queued, None
+            if tasks is None:
+                _worker = None
+                return
+        for key, build in tasks:
+            try:
+                get(key, build)
+            except Exception:
+                # Erros aparecem quando o usuário abre a data; o pré-carregamento apenas segue para a próxima
+                pass
+
+
+def prefetch(tasks):
+    """Calcula em segundo plano os recortes ``(chave, build)`` que ainda não estão em cache.
+
+    Um novo pedido (de qualquer sessão) substitui o anterior que ainda não
+    começou a ser atendido, de forma que o trabalho em segundo plano é limitado.
+    """
+    global _queued, _worker
+    tasks = [(key, build) for key, build in tasks if not cached(key)]
+    if not tasks or not config.PREFETCH:
+        return
+    with _lock:
+        _queued = tasks
+        if _worker is None:
+            _worker = _executor.submit(_run)
@@ -0,0 +1,121 @@
+"""Base de talhões em GeoParquet, já tratada, reprojetada e com as áreas calculadas.
+
+O shapefile dos talhões é lido, reprojetado e tem as áreas calculadas uma vez,
+na conversão; o painel lê o GeoParquet sem nenhuma reprojeção. Além das
+colunas do shapefile, o arquivo tem:
+
+- ``geometry``: polígonos em EPSG:4326 (mapas, tiles e GeoPDFs);
+- ``geometry_utm``: os mesmos polígonos em EPSG:32722;
+- ``COMPANY``, ``FARM`` e ``STAND``: chaves usadas nas predições;
+- ``area_ha``: área do polígono em hectares (EPSG:32722);
+- ``farm_total_area_ha``: área total da fazenda do talhão, em hectares.
+
+``area_index`` resume as áreas por fazenda e por talhão para os cartões do painel.
+
+Quando ``config.STANDS_DATASET_PATH`` existe, ele é utilizado no lugar de
+``config.STANDS_PATH`` (ver ``loading.stands_source``). Para convertê-lo, e
+depois de cada nova entrega do shapefile, executar a partir da pasta app_final:
+
+    python -m combate.stands convert [--source prediction/Talhoes_Manulife_2.shp] [--dest prediction/talhoes.parquet]
+
+As bases agrupadas registram a base de talhões usada; depois da conversão,
+recalculá-las com ``python -m combate.build_aggregates``.
+"""
+import argparse
+import os
+import time
+from dataclasses import dataclass
+
+import geopandas as gpd
+
+from combate import config, profiling
+
+UTM_GEOMETRY = "geometry_utm"
+
+
+def is_geoparquet(path):
+    """Indica se a base de talhões é um GeoParquet convertido (e não um shapefile)."""
+    return os.path.splitext(path)[1].lower() == ".parquet"
+
+
+def prepare(stands_all):
+    """Trata os talhões lidos do shapefile: chaves, geometrias nos dois sistemas e áreas."""
+    stands_all = stands_all.to_crs(config.CRS_LATLON)
+    stands_all['COMPANY'] = stands_all['Companhia'].str.upper()
+    stands_all['FARM'] = stands_all['Fazenda'].str.replace(" ", "_")
+    stands_all['STAND'] = stands_all['Fazenda'] + "_" + stands_all['CD_TALHAO'].astype(str)
+    # Uma única reprojeção para todos os polígonos; a área da fazenda é a soma das áreas dos seus talhões
+    with profiling.span("stands.area"):
+        stands_all[UTM_GEOMETRY] = stands_all['geometry'].to_crs(config.CRS_UTM)
+        stands_all['area_ha'] = stands_all[UTM_GEOMETRY].area / 10000
+        stands_all['farm_total_area_ha'] = stands_all.groupby('FARM')['area_ha'].transform('sum')
+    return stands_all
+
+
+@dataclass(frozen=True)
+class AreaIndex:
+    """Áreas (ha) e número de talhões da empresa, por fazenda e por talhão.
+
+    Montado uma vez por carga (``area_index``); os cartões do painel consultam
+    os dicionários em vez de filtrar a base de talhões a cada execução.
+    """
+    total_ha: float
+    farm_ha: dict
+    stand_ha: dict
+    farm_stand_count: dict
+
+    def farm(self, farm):
+        return self.farm_ha.get(farm, 0.0)
+
+    def stand(self, stand):
+        return self.stand_ha.get(stand, 0.0)
+
+    def stand_count(self, farm=None):
+        """Número de talhões da fazenda ou, sem ``farm``, da empresa."""
+        if farm is None:
+            return len(self.stand_ha)
+        return self.farm_stand_count.get(farm, 0)
+
+
+def area_index(stands_all):
+    """Índice de áreas a partir da coluna ``area_ha``, com somas agrupadas (sem reprojeção)."""
+    stand_ha = stands_all.groupby('STAND', sort=False)['area_ha'].sum()
+    farm_ha = stands_all.groupby('FARM', sort=False)['area_ha'].sum()
+    farm_stand_count = stands_all.groupby('FARM', sort=False)['STAND'].nunique()
+    return AreaIndex(total_ha=float(stands_all['area_ha'].sum()), farm_ha=farm_ha.to_dict(),
+                     stand_ha=stand_ha.to_dict(), farm_stand_count=farm_stand_count.to_dict())
+
+
+def read(path):
+    """Base de talhões: o GeoParquet convertido, ou o shapefile tratado com ``prepare``."""
+    if is_geoparquet(path):
+        return gpd.read_parquet(path)
+    return prepare(gpd.read_file(path))
+
+
+def convert(source=config.STANDS_PATH, dest=config.STANDS_DATASET_PATH):
+    """Converte o shapefile dos talhões para GeoParquet; retorna a base gravada."""
+    stands_all = read(source)
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    tmp_dest = dest + ".tmp"
+    stands_all.to_parquet(tmp_dest, index=False)
+    os.replace(tmp_dest, dest)
+    return stands_all
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Base de talhões em GeoParquet")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser("convert", help="Converte o shapefile dos talhões para GeoParquet")
+    convert_parser.add_argument("--source", default=config.STANDS_PATH, help="Shapefile dos talhões")
+    convert_parser.add_argument("--dest", default=config.STANDS_DATASET_PATH, help="Arquivo GeoParquet de saída")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    stands_all = convert(args.source, args.dest)
+    print(f"{len(stands_all)} talhões de {stands_all['FARM'].nunique()} fazendas gravados em {args.dest} "
+          f"({os.path.getsize(args.dest) / 1e6:.1f} MB, {time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
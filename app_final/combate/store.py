@@ -0,0 +1,128 @@
+"""Base de predições particionada por data e fazenda (Parquet, estilo Hive).
+
+Layout em disco::
+
+    prediction/pred_attack/DATE=2024-10-01/FARM=BOI_PRETO_XI/part-0.parquet
+
+As leituras usam filtros do ``pyarrow.dataset``, portanto apenas as
+partições (e colunas) necessárias são lidas. Para converter a base atual em
+arquivo único, executar a partir da pasta app_final:
+
+    python -m combate.store convert
+"""
+import argparse
+import os
+import shutil
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from combate import config
+
+# Colunas de partição e seus tipos
+PARTITIONING = ds.partitioning(pa.schema([('DATE', pa.date32()), ('FARM', pa.string())]), flavor="hive")
+
+# Colunas cujos valores são normalizados para maiúsculas na conversão
+KEY_COLUMNS = ('COMPANY', 'FARM', 'STAND')
+
+
+def is_dataset(path):
+    """Indica se o caminho é uma base particionada (pasta) em vez de um arquivo único."""
+    return os.path.isdir(path)
+
+
+def open_dataset(root=config.PREDICTION_DATASET_DIR):
+    return ds.dataset(root, format="parquet", partitioning=PARTITIONING)
+
+
+def filter_expression(dates=None, farms=None, stands=None, companies=None):
+    """Expressão de filtro para as chaves informadas (None = sem filtro)."""
+    expression = None
+    if dates is not None:
+        dates = [pd.Timestamp(date).date() for date in dates]
+    for column, values in (('DATE', dates), ('FARM', farms), ('STAND', stands), ('COMPANY', companies)):
+        if values is None:
+            continue
+        condition = ds.field(column).isin(list(values))
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def read_table(root=config.PREDICTION_DATASET_DIR, columns=None, **keys):
+    """Lê da base particionada apenas as partições e colunas necessárias."""
+    dataset = open_dataset(root)
+    return dataset.to_table(columns=columns, filter=filter_expression(**keys))
+
+
+def dataset_dates(root=config.PREDICTION_DATASET_DIR):
+    """Datas disponíveis na base, a partir dos nomes das partições (sem ler os arquivos)."""
+    return sorted(name.split("=", 1)[1] for name in os.listdir(root) if name.startswith("DATE="))
+
+
+def _normalise_keys(table):
+    for column in KEY_COLUMNS:
+        index = table.schema.get_field_index(column)
+        if index >= 0:
+            table = table.set_column(index, column, pc.utf8_upper(table[column]))
+    return table
+
+
+def _prepare(table):
+    # Chaves em maiúsculas e DATE como data, como na base particionada
+    table = _normalise_keys(table)
+    date_index = table.schema.get_field_index('DATE')
+    return table.set_column(date_index, 'DATE', pc.cast(table['DATE'], pa.date32()))
+
+
+def convert_to_dataset(source=config.PRED_ATTACK_PATH, dest=config.PREDICTION_DATASET_DIR):
+    """Converte a base em arquivo único para a base particionada por DATE e FARM.
+
+    As chaves (COMPANY, FARM, STAND) são gravadas em maiúsculas, como são
+    usadas no painel. Uma base existente no destino é substituída.
+    """
+    table = _prepare(pq.read_table(source))
+
+    # Grava em uma pasta temporária e substitui, para o painel nunca ler uma base pela metade
+    tmp_dest = dest + ".tmp"
+    if os.path.exists(tmp_dest):
+        shutil.rmtree(tmp_dest)
+    ds.write_dataset(table, tmp_dest, format="parquet", partitioning=PARTITIONING,
+                     basename_template="part-{i}.parquet")
+    if os.path.exists(dest):
+        shutil.rmtree(dest)
+    os.replace(tmp_dest, dest)
+    return table.num_rows
+
+
+def append_to_dataset(table, root=config.PREDICTION_DATASET_DIR):
+    """Grava novas partições (DATE, FARM) na base particionada.
+
+    Apenas as partições presentes em ``table`` são escritas; partições
+    existentes com a mesma data e fazenda são substituídas.
+    """
+    table = _prepare(table)
+    ds.write_dataset(table, root, format="parquet", partitioning=PARTITIONING,
+                     basename_template="part-{i}.parquet", existing_data_behavior="delete_matching")
+    return table.num_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Base de predições particionada por data e fazenda")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser("convert", help="Converte a base em arquivo único para a base particionada")
+    convert_parser.add_argument("--source", default=config.PRED_ATTACK_PATH, help="Base de predições em arquivo único")
+    convert_parser.add_argument("--dest", default=config.PREDICTION_DATASET_DIR, help="Pasta da base particionada")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    rows = convert_to_dataset(args.source, args.dest)
+    print(f"{rows} linhas gravadas em {args.dest} ({len(dataset_dates(args.dest))} datas) "
+          f"em {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Limiar QT da cobertura do dossel, mantido com histogramas acumuláveis.
+
+O QT é o quantil ``config.CANOPY_QUANTILE`` da cobertura do dossel: pixels
+abaixo dele são classificados como Desfolha. Em vez de ordenar a coluna
+canopycov inteira, os pixels são resumidos em histogramas com resolução fixa
+(``config.CANOPY_SKETCH_RESOLUTION``; canopycov é um percentual e os valores
+na grade são representados sem erro). Dois histogramas se combinam somando as
+contagens, de forma que a ingestão de uma nova data (combate/ingest.py) apenas
+acrescenta os pixels dela.
+
+O limiar pode ser (``config.THRESHOLD_MODE``):
+
+- ``global``: um único limiar para todas as datas e fazendas;
+- ``date``: um limiar por data de aquisição;
+- ``farm``: um limiar por fazenda (de cada empresa).
+
+Os limiares escolhidos ficam registrados no aggregates.json junto com os
+histogramas e não mudam quando novas datas chegam: apenas datas (ou fazendas)
+ainda sem limiar recebem um, calculado a partir do histograma. Para
+recalculá-los, usar ``python -m combate.build_aggregates --reset-thresholds``.
+"""
+import datetime
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from combate import config
+
+MODES = ('global', 'date', 'farm')
+
+# Colunas das predições que definem o grupo de cada modo; o modo global tem uma única chave
+_GROUP_COLUMNS = {'date': ['DATE'], 'farm': ['COMPANY', 'FARM']}
+GLOBAL_KEY = 'global'
+# Separador das colunas na chave do grupo (ex.: 'MANULIFE|BOI_PRETO_XI')
+KEY_SEPARATOR = '|'
+
+# Valores por unidade de canopycov (0.01 → 100 intervalos por ponto percentual)
+_SCALE = round(1 / config.CANOPY_SKETCH_RESOLUTION)
+
+
+@dataclass(frozen=True)
+class QuantileSketch:
+    """Histograma de canopycov: intervalos (inteiros, em ordem crescente) e contagem de pixels de cada um."""
+    bins: np.ndarray
+    counts: np.ndarray
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def merge(self, other):
+        merged = pd.Series(self.counts, index=self.bins).add(pd.Series(other.counts, index=other.bins), fill_value=0)
+        return QuantileSketch(merged.index.to_numpy(dtype=np.int64), merged.to_numpy(dtype=np.int64))
+
+    def remove(self, other):
+        """Histograma sem os pixels de ``other``, que devem ter sido acrescentados antes."""
+        remaining = pd.Series(self.counts, index=self.bins).sub(pd.Series(other.counts, index=other.bins), fill_value=0)
+        remaining = remaining[remaining > 0]
+        return QuantileSketch(remaining.index.to_numpy(dtype=np.int64), remaining.to_numpy(dtype=np.int64))
+
+    def quantile(self, q):
+        """Quantil com interpolação linear entre os pixels vizinhos, como ``pandas.Series.quantile``."""
+        n = self.count
+        if n == 0:
+            return float('nan')
+        position = (n - 1) * q
+        lower = int(np.floor(position))
+        cumulative = np.cumsum(self.counts)
+        below, above = self.bins[np.searchsorted(cumulative, [lower, min(lower + 1, n - 1)], side='right')] / _SCALE
+        return float(below + (position - lower) * (above - below))
+
+    def to_dict(self):
+        return {'bins': self.bins.tolist(), 'counts': self.counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(np.asarray(data['bins'], dtype=np.int64), np.asarray(data['counts'], dtype=np.int64))
+
+
+def _group_key(value):
+    if isinstance(value, (datetime.date, np.datetime64)):
+        return pd.Timestamp(value).strftime('%Y-%m-%d')
+    return str(value)
+
+
+def _groups(pred, mode):
+    # Código inteiro do grupo de cada pixel e chave (texto) de cada grupo
+    codes = np.zeros(len(pred), dtype=np.int64)
+    if mode == 'global':
+        return codes, [GLOBAL_KEY]
+    # Combina os códigos de cada coluna, como em aggregates.count_pixels
+    groups = [()]
+    for column in _GROUP_COLUMNS[mode]:
+        column_codes, uniques = pd.factorize(pred[column])
+        codes, combined = pd.factorize(codes * len(uniques) + column_codes)
+        groups = [groups[code // len(uniques)] + (uniques[code % len(uniques)],) for code in combined]
+    return codes, [KEY_SEPARATOR.join(_group_key(value) for value in group) for group in groups]
+
+
+def sketch_pixels(pred):
+    """Histogramas dos pixels por modo: ``{modo: {chave: QuantileSketch}}``."""
+    canopycov = pred['canopycov'].to_numpy(dtype=float)
+    valid = np.isfinite(canopycov)
+    bins = np.rint(canopycov[valid] * _SCALE).astype(np.int64)
+
+    # Contagem com np.bincount sobre a chave combinada (grupo, intervalo), como em aggregates.count_pixels
+    first_bin = bins.min() if len(bins) else 0
+    n_bins = int(bins.max() - first_bin + 1) if len(bins) else 1
+    sketches = {}
+    for mode in MODES:
+        codes, keys = _groups(pred, mode)
+        counts = np.bincount(codes[valid] * n_bins + (bins - first_bin),
+                             minlength=len(keys) * n_bins).reshape(len(keys), n_bins)
+        sketches[mode] = {}
+        for code, key in enumerate(keys):
+            nonzero = np.flatnonzero(counts[code])
+            if len(nonzero):
+                sketches[mode][key] = QuantileSketch(nonzero + first_bin, counts[code, nonzero])
+    return sketches
+
+
+def merge_sketches(left, right):
+    """Soma dois conjuntos de histogramas retornados por ``sketch_pixels``."""
+    merged = {}
+    for mode in MODES:
+        merged[mode] = dict(left.get(mode, {}))
+        for key, sketch in right.get(mode, {}).items():
+            merged[mode][key] = merged[mode][key].merge(sketch) if key in merged[mode] else sketch
+    return merged
+
+
+def remove_sketches(left, right):
+    """Retira de ``left`` os pixels resumidos em ``right`` (ambos retornados por ``sketch_pixels``)."""
+    remaining = {}
+    for mode in MODES:
+        remaining[mode] = dict(left.get(mode, {}))
+        for key, sketch in right.get(mode, {}).items():
+            if key in remaining[mode]:
+                remaining[mode][key] = remaining[mode][key].remove(sketch)
+                if remaining[mode][key].count == 0:
+                    del remaining[mode][key]
+    return remaining
+
+
+@dataclass(frozen=True)
+class Thresholds:
+    """Limiares escolhidos (chave do grupo → QT) e histogramas de todos os pixels já processados.
+
+    ``recorded_qt`` é o limiar global registrado no aggregates.json, usado
+    quando não há histogramas (ver ``from_meta``).
+    """
+    mode: str
+    values: dict
+    sketches: dict
+    recorded_qt: float = None
+
+    @property
+    def qt(self):
+        """Limiar global: o registrado, no modo global, ou o quantil do histograma de todos os pixels."""
+        if self.mode == 'global':
+            return self.values[GLOBAL_KEY]
+        sketch = self.sketches.get('global', {}).get(GLOBAL_KEY)
+        if sketch is None:
+            return self.recorded_qt
+        return sketch.quantile(config.CANOPY_QUANTILE)
+
+    def for_pixels(self, pred):
+        """Limiar de cada pixel (um número, no modo global, ou um array alinhado a ``pred``)."""
+        if self.mode == 'global':
+            return self.values[GLOBAL_KEY]
+        codes, keys = _groups(pred, self.mode)
+        return np.array([self.values[key] for key in keys], dtype=float)[codes]
+
+    def update(self, pred, replaced=None):
+        """Acrescenta os pixels de novas datas; só os grupos ainda sem limiar recebem um.
+
+        ``replaced`` são os pixels já processados que ``pred`` substitui (ex.:
+        partições gravadas de novo na ingestão), retirados dos histogramas.
+        """
+        sketches = self.sketches
+        if replaced is not None and len(replaced):
+            sketches = remove_sketches(sketches, sketch_pixels(replaced))
+        return _choose(self.mode, merge_sketches(sketches, sketch_pixels(pred)), self.values)
+
+    def to_meta(self):
+        return {
+            'mode': self.mode,
+            'quantile': config.CANOPY_QUANTILE,
+            'resolution': config.CANOPY_SKETCH_RESOLUTION,
+            'values': self.values,
+            'sketches': {mode: {key: sketch.to_dict() for key, sketch in sketches.items()}
+                         for mode, sketches in self.sketches.items()},
+        }
+
+
+def _choose(mode, sketches, frozen):
+    values = dict(frozen)
+    for key, sketch in sketches[mode].items():
+        if key not in values:
+            values[key] = sketch.quantile(config.CANOPY_QUANTILE)
+    return Thresholds(mode, values, sketches)
+
+
+def build(pred, mode=None, previous=None):
+    """Limiares a partir de todos os pixels, mantendo os já registrados em ``previous`` (no mesmo modo)."""
+    mode = mode or config.THRESHOLD_MODE
+    if mode not in MODES:
+        raise ValueError(f"modo de limiar desconhecido: {mode} (opções: {', '.join(MODES)})")
+    frozen = previous.values if previous is not None and previous.mode == mode else {}
+    return _choose(mode, sketch_pixels(pred), frozen)
+
+
+def from_meta(meta):
+    """Limiares registrados no aggregates.json (``None`` se não houver nenhum).
+
+    Bases gravadas antes dos histogramas (apenas o QT único) ou com outra
+    resolução mantêm os limiares, mas sem os histogramas (``sketches`` vazio).
+    Limiares por fazenda gravados sem a empresa na chave são descartados e
+    recalculados.
+    """
+    if meta is None:
+        return None
+    if 'thresholds' not in meta:
+        return Thresholds('global', {GLOBAL_KEY: meta['QT']}, {}, meta['QT']) if 'QT' in meta else None
+    data = meta['thresholds']
+    values = dict(data['values'])
+    sketches = {}
+    if data.get('resolution') == config.CANOPY_SKETCH_RESOLUTION:
+        sketches = {mode: {key: QuantileSketch.from_dict(sketch)
+                           for key, sketch in data['sketches'].get(mode, {}).items()}
+                    for mode in MODES}
+    if any(KEY_SEPARATOR not in key for key in sketches.get('farm', {})):
+        sketches = {}
+    if data['mode'] == 'farm':
+        values = {key: value for key, value in values.items() if KEY_SEPARATOR in key}
+    return Thresholds(data['mode'], values, sketches, meta.get('QT'))
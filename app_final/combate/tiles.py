@@ -0,0 +1,426 @@
+"""Camada de imagens de fundo (basemap) com cache local de tiles.
+
+Substitui ``ctx.add_basemap`` e ``ctx.bounds2raster`` do contextily por
+versões que leem os tiles, nesta ordem, de:
+
+1. uma fonte local opcional (arquivo MBTiles ou pasta XYZ ``{z}/{x}/{y}.png``),
+   configurada em ``COMBATE_BASEMAP_SOURCE``;
+2. um cache em disco limitado por tamanho (LRU);
+3. o servidor de tiles do provedor (exceto no modo offline,
+   ``COMBATE_TILES_OFFLINE=1``).
+
+Tiles ausentes no modo offline ficam transparentes, de forma que os mapas
+continuam sendo exibidos sem rede. O endereço do servidor pode ser trocado
+por ``COMBATE_TILE_URL`` (por exemplo, um servidor local de testes).
+
+Para semear o cache com os tiles de todos os mapas e GeoPDFs das fazendas e
+talhões, executar a partir da pasta app_final:
+
+    python -m combate.tiles prefetch
+
+Com ``--zooms 13,14`` o cache é semeado com toda a extensão dos talhões nos
+níveis informados.
+"""
+import argparse
+import io
+import math
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+
+import numpy as np
+from PIL import Image
+import xyzservices
+
+from combate import config, profiling
+
+TILE_SIZE = 256
+
+# Metade da circunferência da Terra na projeção Web Mercator (EPSG:3857)
+ORIGIN_SHIFT = 20037508.342789244
+
+
+def basemap_provider():
+    """Provedor de tiles utilizado nos mapas (Esri World Imagery por padrão)."""
+    if config.TILE_URL:
+        return xyzservices.TileProvider(name="local", url=config.TILE_URL, attribution="", max_zoom=config.TILE_MAX_ZOOM)
+    return xyzservices.providers.Esri.WorldImagery
+
+
+# Matemática dos tiles (esquema XYZ / "slippy map")
+
+def lonlat_to_tile(lon, lat, zoom):
+    """Índices (x, y) do tile que contém o ponto (lon, lat) no nível de zoom."""
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_for_bounds(w, s, e, n, zoom):
+    """Lista de tiles (x, y, z) que cobrem a extensão em graus."""
+    x0, y0 = lonlat_to_tile(w, n, zoom)
+    x1, y1 = lonlat_to_tile(e, s, zoom)
+    return [(x, y, zoom) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def tile_extent(x, y, zoom):
+    """Extensão do tile em EPSG:3857, no formato (minX, maxX, minY, maxY)."""
+    size = 2 * ORIGIN_SHIFT / 2 ** zoom
+    minx = -ORIGIN_SHIFT + x * size
+    maxy = ORIGIN_SHIFT - y * size
+    return minx, minx + size, maxy - size, maxy
+
+
+def mercator_to_lonlat(x, y):
+    """Converte coordenadas EPSG:3857 em (lon, lat)."""
+    lon = x / ORIGIN_SHIFT * 180.0
+    lat = math.degrees(math.atan(math.sinh(y / ORIGIN_SHIFT * math.pi)))
+    return lon, lat
+
+
+def auto_zoom(w, s, e, n, provider=None):
+    """Nível de zoom escolhido automaticamente para a extensão (mesmo critério do contextily)."""
+    zoom_lon = math.ceil(math.log2(360 * 2.0 / max(e - w, 1e-9)))
+    zoom_lat = math.ceil(math.log2(360 * 2.0 / max(n - s, 1e-9)))
+    zoom = int(min(zoom_lon, zoom_lat))
+    max_zoom = (provider or basemap_provider()).get("max_zoom", config.TILE_MAX_ZOOM)
+    return max(0, min(zoom, max_zoom))
+
+
+# Fontes de tiles
+
+class TileCache:
+    """Cache de tiles em disco, limitado por tamanho e com descarte LRU.
+
+    Cada acesso atualiza a data de modificação do arquivo; ao ultrapassar
+    ``max_bytes``, os tiles usados há mais tempo são removidos.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _path(self, provider_name, x, y, zoom):
+        return os.path.join(self.root, provider_name, str(zoom), str(x), f"{y}.tile")
+
+    def _files(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tile"):
+                    yield os.path.join(dirpath, name)
+
+    def size(self):
+        """Tamanho total dos tiles em cache, em bytes."""
+        with self._lock:
+            if self._size is None:
+                self._size = sum(os.path.getsize(p) for p in self._files())
+            return self._size
+
+    def get(self, provider_name, x, y, zoom):
+        path = self._path(provider_name, x, y, zoom)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return content
+
+    def put(self, provider_name, x, y, zoom, content):
+        path = self._path(provider_name, x, y, zoom)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Tamanho total calculado antes da gravação, para o novo tile não ser contado duas vezes
+        self.size()
+
+        # Grava em um arquivo temporário e substitui, para outros processos nunca lerem um tile incompleto
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        with self._lock:
+            # Um tile substituído deixa de ocupar o tamanho anterior
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            self._size += len(content) - replaced
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove os tiles menos usados até o cache ficar abaixo de 90% do limite."""
+        with self._lock:
+            entries = []
+            for path in self._files():
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._size = total
+
+
+class MBTilesSource:
+    """Leitura de tiles de um arquivo MBTiles (linhas no esquema TMS)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # Conexões sqlite não podem ser compartilhadas entre threads
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        return self._local.connection
+
+    def get(self, x, y, zoom):
+        row = self._connection().execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+            (zoom, x, 2 ** zoom - 1 - y)).fetchone()
+        return row[0] if row else None
+
+
+class XYZDirectorySource:
+    """Leitura de tiles de uma pasta no formato ``{z}/{x}/{y}.png`` (ou .jpg)."""
+
+    EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+    def __init__(self, root):
+        self.root = root
+
+    def get(self, x, y, zoom):
+        base = os.path.join(self.root, str(zoom), str(x), str(y))
+        for ext in self.EXTENSIONS:
+            if os.path.exists(base + ext):
+                with open(base + ext, "rb") as f:
+                    return f.read()
+        return None
+
+
+def local_source(path):
+    """Fonte local de tiles a partir de um arquivo MBTiles ou de uma pasta XYZ."""
+    if path.lower().endswith(".mbtiles"):
+        return MBTilesSource(path)
+    return XYZDirectorySource(path)
+
+
+_tile_cache = TileCache(config.TILE_CACHE_DIR, config.TILE_CACHE_MAX_BYTES)
+_local = local_source(config.BASEMAP_SOURCE) if config.BASEMAP_SOURCE else None
+
+
+def _download(url):
+    request = urllib.request.Request(url, headers={"User-Agent": "combate-sf/1.0"})
+    for attempt in range(3):
+        try:
+            with urllib.request.urlopen(request, timeout=config.TILE_TIMEOUT) as response:
+                return response.read()
+        except OSError:
+            if attempt == 2:
+                raise
+            time.sleep(0.5 * (attempt + 1))
+
+
+def fetch_tile(x, y, zoom, provider=None):
+    """Conteúdo (bytes) do tile, ou None se ele não estiver disponível no modo offline."""
+    provider = provider or basemap_provider()
+
+    if _local is not None:
+        content = _local.get(x, y, zoom)
+        if content is not None:
+            return content
+
+    content = _tile_cache.get(provider.name, x, y, zoom)
+    if content is not None:
+        return content
+    if config.TILES_OFFLINE:
+        return None
+
+    content = _download(provider.build_url(x=x, y=y, z=zoom))
+    _tile_cache.put(provider.name, x, y, zoom, content)
+    return content
+
+
+def _decode(content):
+    if content is None:
+        return np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    image = Image.open(io.BytesIO(content)).convert("RGBA")
+    if image.size != (TILE_SIZE, TILE_SIZE):
+        image = image.resize((TILE_SIZE, TILE_SIZE))
+    return np.asarray(image)
+
+
+# Substitutos do contextily
+
+@profiling.traced("tiles.bounds2img")
+def bounds2img(w, s, e, n, zoom="auto", ll=True, provider=None):
+    """Mosaico de tiles que cobre a extensão, como ``ctx.bounds2img``.
+
+    Retorna a imagem RGBA (uint8) e sua extensão em EPSG:3857, no formato
+    (minX, maxX, minY, maxY). Se ``ll`` for False, os limites estão em EPSG:3857.
+    """
+    provider = provider or basemap_provider()
+    if not ll:
+        w, s = mercator_to_lonlat(w, s)
+        e, n = mercator_to_lonlat(e, n)
+    if zoom == "auto":
+        zoom = auto_zoom(w, s, e, n, provider)
+
+    tiles = tiles_for_bounds(w, s, e, n, zoom)
+    xs = sorted({x for x, _, _ in tiles})
+    ys = sorted({y for _, y, _ in tiles})
+    image = np.zeros((len(ys) * TILE_SIZE, len(xs) * TILE_SIZE, 4), dtype=np.uint8)
+    for x, y, z in tiles:
+        row, col = (y - ys[0]) * TILE_SIZE, (x - xs[0]) * TILE_SIZE
+        image[row:row + TILE_SIZE, col:col + TILE_SIZE] = _decode(fetch_tile(x, y, z, provider))
+
+    minx, _, _, maxy = tile_extent(xs[0], ys[0], zoom)
+    _, maxx, miny, _ = tile_extent(xs[-1], ys[-1], zoom)
+    return image, (minx, maxx, miny, maxy)
+
+
+def add_basemap(ax, crs=config.CRS_LATLON, source=None, zoom="auto", interpolation="bilinear", **kwargs):
+    """Desenha a imagem de fundo nos limites atuais do eixo, como ``ctx.add_basemap``."""
+    import contextily as ctx
+    from pyproj import Transformer
+
+    xmin, xmax = ax.get_xlim()
+    ymin, ymax = ax.get_ylim()
+
+    # Limites do eixo em graus, para escolher os tiles
+    to_lonlat = Transformer.from_crs(crs, config.CRS_LATLON, always_xy=True)
+    w, s, e, n = to_lonlat.transform_bounds(xmin, ymin, xmax, ymax)
+
+    image, extent = bounds2img(w, s, e, n, zoom=zoom, provider=source)
+    image, extent = ctx.warp_tiles(image, extent, t_crs=crs)
+
+    ax.imshow(image, extent=extent, interpolation=interpolation, zorder=kwargs.pop("zorder", 0), **kwargs)
+    ax.axis((xmin, xmax, ymin, ymax))
+
+
+def bounds2raster(w, s, e, n, path, zoom="auto", ll=True, source=None):
+    """Grava o mosaico da extensão em um GeoTIFF (EPSG:3857), como ``ctx.bounds2raster``."""
+    import rasterio
+    from rasterio.transform import from_bounds
+
+    image, extent = bounds2img(w, s, e, n, zoom=zoom, ll=ll, provider=source)
+    minx, maxx, miny, maxy = extent
+    height, width, bands = image.shape
+    with rasterio.open(
+        path, "w",
+        driver="GTiff",
+        height=height,
+        width=width,
+        count=bands,
+        dtype="uint8",
+        crs="EPSG:3857",
+        transform=from_bounds(minx, miny, maxx, maxy, width, height)
+    ) as dst:
+        for band in range(bands):
+            dst.write(image[:, :, band], band + 1)
+    return image, extent
+
+
+# Pré-carregamento do cache
+
+def _square(w, s, e, n):
+    # Quadrado envolvente, como no GeoPDF do talhão
+    half_side = max(e - w, n - s) / 2.0
+    cx, cy = (w + e) / 2.0, (s + n) / 2.0
+    return cx - half_side, cy - half_side, cx + half_side, cy + half_side
+
+
+def _map_views(bounds, provider):
+    # Mapas do painel: a extensão recebe margem e é ajustada à grade (ver render.map_bounds);
+    # os tiles da extensão máxima são baixados nos níveis de zoom das duas extensões
+    from combate.render import map_bounds
+
+    smallest, largest = map_bounds(bounds)
+    return [(largest, zoom) for zoom in {auto_zoom(*smallest, provider), auto_zoom(*largest, provider)}]
+
+
+def app_views(stands_all, provider=None):
+    """Extensões (em graus) e níveis de zoom das imagens de fundo usadas pelo painel.
+
+    Considera a extensão de cada fazenda (GeoPDF da fazenda), a extensão e o
+    quadrado envolvente de cada talhão (GeoPDF do talhão) e a extensão com
+    margem de cada fazenda e talhão (mapas do painel).
+    """
+    views = []
+    for _, group in stands_all.groupby("FARM"):
+        bounds = tuple(group.total_bounds)
+        views.append((bounds, auto_zoom(*bounds, provider)))
+        views += _map_views(bounds, provider)
+    for _, group in stands_all.groupby("STAND"):
+        for bounds in (tuple(group.total_bounds), _square(*group.total_bounds)):
+            views.append((bounds, auto_zoom(*bounds, provider)))
+        views += _map_views(tuple(group.total_bounds), provider)
+    return views
+
+
+def prefetch(views, provider=None, progress=print):
+    """Baixa para o cache todos os tiles das extensões (em graus) nos níveis de zoom informados.
+
+    ``views`` é uma lista de pares (extensão, zoom), como a retornada por ``app_views``.
+    """
+    provider = provider or basemap_provider()
+    tiles = sorted({t for bounds, zoom in views for t in tiles_for_bounds(*bounds, zoom)})
+    zooms = sorted({zoom for _, zoom in views})
+    progress(f"{len(tiles)} tiles nos níveis de zoom {', '.join(map(str, zooms))}")
+
+    fetched = missing = 0
+    for i, (x, y, zoom) in enumerate(tiles, 1):
+        if fetch_tile(x, y, zoom, provider) is None:
+            missing += 1
+        else:
+            fetched += 1
+        if i % 500 == 0:
+            progress(f"{i}/{len(tiles)} tiles")
+
+    size_mb = _tile_cache.size() / 1e6
+    progress(f"{fetched} tiles disponíveis, {missing} ausentes; cache com {size_mb:.1f} MB")
+    if _tile_cache.size() > _tile_cache.max_bytes * 0.9:
+        progress("Aviso: o limite do cache foi atingido e tiles antigos foram descartados")
+    return fetched, missing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cache local de tiles de imagem de fundo")
+    commands = parser.add_subparsers(dest="command", required=True)
+    prefetch_parser = commands.add_parser("prefetch", help="Semeia o cache com a área dos talhões")
+    prefetch_parser.add_argument("--stands", default=None,
+                                 help="Base de talhões (shapefile ou GeoParquet; padrão: a base em uso)")
+    prefetch_parser.add_argument("--zooms", default=None,
+                                 help="Níveis de zoom separados por vírgula para cobrir toda a extensão dos talhões "
+                                      "(padrão: exatamente os tiles dos mapas e GeoPDFs do painel)")
+    args = parser.parse_args(argv)
+
+    from combate.loading import load_stands
+
+    stands_all = load_stands(args.stands)
+    provider = basemap_provider()
+    if args.zooms:
+        bounds = tuple(stands_all.total_bounds)
+        views = [(bounds, int(zoom)) for zoom in args.zooms.split(",")]
+    else:
+        views = app_views(stands_all, provider)
+    prefetch(views, provider)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Carregamento em segundo plano das bibliotecas dos mapas e GeoPDFs.
+
+rasterio, matplotlib, contextily e GDAL são usados apenas a partir dos mapas de
+calor e dos GeoPDFs, e são importados dentro das funções que os usam (ver
+combate/cog.py, combate/render.py, combate/geopdf.py). Na primeira execução do
+painel em um servidor novo, ``start`` inicia a importação em uma thread
+enquanto os filtros, cartões e gráficos são montados; antes dos mapas, ``wait``
+aguarda o fim da importação. Nas execuções seguintes os módulos já estão
+carregados e ``wait`` retorna imediatamente.
+"""
+import importlib
+import threading
+
+from combate import config, profiling
+
+# Na ordem de importação: contextily importa rasterio e matplotlib; os mapas desenham
+# com a figura e o backend Agg do matplotlib, e os GeoPDFs usam o pyplot
+HEAVY_MODULES = ("rasterio", "matplotlib.figure", "matplotlib.backends.backend_agg", "matplotlib.pyplot",
+                 "contextily", "osgeo.gdal")
+
+_thread = None
+_lock = threading.Lock()
+
+
+def _import_all(modules):
+    for name in modules:
+        # Sem perfil de execução na thread: com COMBATE_PROFILE=1, cada importação é gravada avulsa no log
+        with profiling.span(f"import.{name}"):
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                # Ex.: GDAL não instalado; o erro aparece apenas ao gerar um GeoPDF
+                pass
+
+
+def start(modules=HEAVY_MODULES):
+    """Inicia a importação dos módulos em segundo plano (uma vez por processo)."""
+    global _thread
+    with _lock:
+        if _thread is None and config.PREWARM:
+            _thread = threading.Thread(target=_import_all, args=(modules,), name="combate-warmup", daemon=True)
+            _thread.start()
+
+
+def wait(timeout=None):
+    """Aguarda o fim da importação iniciada por ``start`` (se houver)."""
+    if _thread is not None and _thread.is_alive():
+        with profiling.span("warmup.wait"):
+            _thread.join(timeout)